@@ -175,6 +175,15 @@ class ImageConvertFailed(IronicException):
     message = _("Image %(image_id)s is unacceptable: %(reason)s")
 
 
+class ImageChecksumError(IronicException):
+    message = _("Checksum of image %(image_id)s does not match: expected "
+                "%(expected)s, got %(actual)s.")
+
+
+class ImageDownloadFailed(IronicException):
+    message = _("Failed to download image %(image_href)s: %(reason)s")
+
+
 # Cannot be templated as the error syntax varies.
 # msg needs to be constructed when raised.
 class InvalidParameterValue(Invalid):
@@ -362,6 +371,11 @@ class NodeLocked(Conflict):
                 "after the current operation is completed.")
 
 
+class NodeConstraintsNotMet(Conflict):
+    message = _("Node %(node)s does not match the constraints required to "
+                "reserve it.")
+
+
 class NodeNotLocked(Invalid):
     message = _("Node %(node)s found not to be locked on release")
 
@@ -15,7 +15,10 @@
 #    under the License.
 
 
+import collections
 import functools
+import hashlib
+import itertools
 import logging
 import os
 import sys
@@ -35,6 +38,100 @@ from oslo.config import cfg
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
+_RETRY_EXCEPTIONS = (exception.ServiceUnavailable,
+                     exception.InvalidEndpoint,
+                     exception.CommunicationError)
+
+# errors interrupting the download of image data
+_STREAM_EXCEPTIONS = _RETRY_EXCEPTIONS + (IOError,)
+
+# hash algorithms of glance (os_hash_algo) used to verify downloads
+_HASH_ALGORITHMS = ('md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512')
+
+
+def _retry_interval(attempt):
+    """Return the time to wait after the attempt-th failed attempt."""
+    return min(CONF.glance.glance_retry_interval * 2 ** (attempt - 1),
+               CONF.glance.glance_max_retry_interval)
+
+
+class ImageMetadataCache(object):
+    """Caches the images fetched from glance for the whole process.
+
+    Entries expire CONF.glance.glance_metadata_cache_ttl seconds after they
+    were fetched, and the least recently used ones are dropped when there
+    are more than CONF.glance.glance_metadata_cache_size of them. Public
+    images are shared by all the requests, the other images are only
+    reused for the project of the request which fetched them; callers
+    still check the availability of the image for their own context.
+    """
+
+    PUBLIC = 'public'
+
+    def __init__(self):
+        # key -> [expiry time, tick of the last use, image]
+        self._entries = {}
+        self._ticks = itertools.count()
+        self.stats = collections.defaultdict(int)
+
+    def reset(self):
+        """Forget all the images."""
+        self._entries.clear()
+        self.stats.clear()
+
+    def get(self, version, image_id, project_id):
+        """Return a cached image, or None.
+
+        :param version: the glance API version the image was fetched with.
+        :param image_id: the opaque image identifier.
+        :param project_id: the project of the request.
+        """
+        now = time.time()
+        for scope in (self.PUBLIC, project_id):
+            key = (version, image_id, scope)
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[0] <= now:
+                del self._entries[key]
+                self.stats['expired'] += 1
+                continue
+            entry[1] = next(self._ticks)
+            self.stats['hits'] += 1
+            return entry[2]
+        self.stats['misses'] += 1
+
+    def add(self, version, image_id, project_id, image):
+        """Cache an image fetched for a request of project_id."""
+        if _is_public(image):
+            project_id = self.PUBLIC
+        key = (version, image_id, project_id)
+        expires = time.time() + CONF.glance.glance_metadata_cache_ttl
+        self._entries[key] = [expires, next(self._ticks), image]
+        while len(self._entries) > CONF.glance.glance_metadata_cache_size:
+            oldest = min(self._entries, key=lambda k: self._entries[k][1])
+            del self._entries[oldest]
+            self.stats['evictions'] += 1
+
+    def invalidate(self, image_id):
+        """Forget an image, e.g. when it is modified."""
+        for key in [k for k in self._entries if k[1] == image_id]:
+            del self._entries[key]
+
+    def get_stats(self):
+        """Return the counters of the cache and its number of entries."""
+        stats = dict(self.stats)
+        stats['entries'] = len(self._entries)
+        return stats
+
+
+def _is_public(image):
+    return (getattr(image, 'is_public', False) or
+            getattr(image, 'visibility', None) == 'public')
+
+
+METADATA_CACHE = ImageMetadataCache()
+
 
 def _translate_image_exception(image_id, exc_value):
     if isinstance(exc_value, (exception.Forbidden,
@@ -108,9 +205,7 @@ class BaseImageService(object):
 
         :raises: GlanceConnectionFailed
         """
-        retry_excs = (exception.ServiceUnavailable,
-                      exception.InvalidEndpoint,
-                      exception.CommunicationError)
+        retry_excs = _RETRY_EXCEPTIONS
         image_excs = (exception.Forbidden,
                       exception.Unauthorized,
                       exception.NotFound,
@@ -143,7 +238,7 @@ class BaseImageService(object):
                                           'attempt': attempt,
                                           'method': method,
                                           'extra': extra})
-                time.sleep(1)
+                time.sleep(_retry_interval(attempt))
             except image_excs as e:
                 exc_type, exc_value, exc_trace = sys.exc_info()
                 if method == 'list':
@@ -172,6 +267,21 @@ class BaseImageService(object):
 
         return _images
 
+    def _get_image(self, image_id, method='get'):
+        """Get an image from glance, or from the metadata cache.
+
+        :param image_id: The opaque image identifier.
+        :returns: the image as returned by the glance client.
+        """
+        if CONF.glance.glance_metadata_cache_ttl <= 0:
+            return self.call(method, image_id)
+        project_id = getattr(self.context, 'project_id', None)
+        image = METADATA_CACHE.get(self.version, image_id, project_id)
+        if image is None:
+            image = self.call(method, image_id)
+            METADATA_CACHE.add(self.version, image_id, project_id, image)
+        return image
+
     @check_image_service
     def _show(self, image_href, method='get'):
         """Returns a dict with image data for the given opaque image id.
@@ -186,7 +296,7 @@ class BaseImageService(object):
         (image_id, self.glance_host,
          self.glance_port, use_ssl) = service_utils.parse_image_ref(image_href)
 
-        image = self.call(method, image_id)
+        image = self._get_image(image_id, method)
 
         if not service_utils.is_image_available(self.context, image):
             raise exception.ImageNotFound(image_id=image_id)
@@ -200,6 +310,8 @@ class BaseImageService(object):
 
         :param image_id: The opaque image identifier.
         :param data: (Optional) File object to write data to.
+        :returns: the image data chunks if data is None, otherwise the MD5
+                  checksum of the image if it was verified.
         """
         (image_id, self.glance_host,
          self.glance_port, use_ssl) = service_utils.parse_image_ref(image_id)
@@ -215,13 +327,116 @@ class BaseImageService(object):
                     sendfile.sendfile(data.fileno(), f.fileno(), 0, filesize)
                 return
 
-        image_chunks = self.call(method, image_id)
-
         if data is None:
-            return image_chunks
-        else:
-            for chunk in image_chunks:
-                data.write(chunk)
+            return self.call(method, image_id)
+        return self._write_data(image_id, data, method)
+
+    def _get_image_hash(self, image_id):
+        """Return (hash algorithm, hex digest) of an image, or None."""
+        image = self._get_image(image_id)
+        algorithm = getattr(image, 'os_hash_algo', None)
+        value = getattr(image, 'os_hash_value', None)
+        if algorithm in _HASH_ALGORITHMS and value:
+            return algorithm, value
+        checksum = getattr(image, 'checksum', None)
+        if checksum:
+            return 'md5', checksum
+
+    def _read_data(self, image_id, method, stats):
+        """Iterate over the data chunks of an image.
+
+        If the download is interrupted, it is started again, up to
+        CONF.glance.glance_num_retries times, skipping the data already
+        read. Only errors reading the data are retried.
+
+        :param image_id: The opaque image identifier.
+        :param stats: dict in which the number of 'retries' is counted.
+        :raises: GlanceConnectionFailed
+        """
+        num_attempts = 1 + CONF.glance.glance_num_retries
+        read = 0
+        for attempt in range(1, num_attempts + 1):
+            image_chunks = iter(self.call(method, image_id))
+            skip = read
+            while True:
+                try:
+                    chunk = next(image_chunks)
+                except StopIteration:
+                    return
+                except _STREAM_EXCEPTIONS as e:
+                    if attempt == num_attempts:
+                        raise exception.GlanceConnectionFailed(
+                            host=self.glance_host, port=self.glance_port,
+                            reason=str(e))
+                    LOG.warn(_("Download of image %(image)s interrupted "
+                               "after %(size)d bytes, resuming: %(exc)s"),
+                             {'image': image_id, 'size': read, 'exc': e})
+                    time.sleep(_retry_interval(attempt))
+                    stats['retries'] += 1
+                    break
+                if skip:
+                    if len(chunk) <= skip:
+                        skip -= len(chunk)
+                        continue
+                    chunk, skip = chunk[skip:], 0
+                read += len(chunk)
+                yield chunk
+
+    def _write_data(self, image_id, data, method):
+        """Write the data of an image, verifying its checksum.
+
+        Interrupted downloads are resumed by _read_data, errors writing
+        the data are raised as they are.
+
+        :param image_id: The opaque image identifier.
+        :param data: File object to write data to.
+        :returns: the MD5 checksum of the image if it was verified.
+        :raises: GlanceConnectionFailed, ImageChecksumError
+        """
+        expected = None
+        hasher = None
+        if CONF.glance.glance_verify_checksum:
+            expected = self._get_image_hash(image_id)
+        if expected is not None:
+            hasher = hashlib.new(expected[0])
+        buffer_size = CONF.glance.glance_download_buffer_size
+        buffered = []
+        buffered_size = 0
+        written = 0
+        stats = {'retries': 0}
+        started = time.time()
+
+        try:
+            for chunk in self._read_data(image_id, method, stats):
+                if hasher is not None:
+                    hasher.update(chunk)
+                written += len(chunk)
+                buffered.append(chunk)
+                buffered_size += len(chunk)
+                if buffered_size >= buffer_size:
+                    data.write(''.join(buffered))
+                    buffered, buffered_size = [], 0
+        except exception.GlanceConnectionFailed:
+            # NOTE: keep what was downloaded, like unbuffered writes do
+            if buffered:
+                data.write(''.join(buffered))
+            raise
+        if buffered:
+            data.write(''.join(buffered))
+
+        if hasher is not None and hasher.hexdigest() != expected[1]:
+            raise exception.ImageChecksumError(image_id=image_id,
+                                               expected=expected[1],
+                                               actual=hasher.hexdigest())
+        elapsed = time.time() - started
+        LOG.debug("Downloaded %(size)d bytes of image %(image)s in "
+                  "%(time).2f seconds (%(rate).1f MiB/s, %(retries)d "
+                  "retries)",
+                  {'size': written, 'image': image_id, 'time': elapsed,
+                   'rate': written / 1024.0 / 1024 / max(elapsed, 1e-6),
+                   'retries': stats['retries']})
+        if hasher is not None and expected[0] == 'md5':
+            return expected[1]
 
     @check_image_service
     def _create(self, image_meta, data=None, method='create'):
@@ -268,6 +483,7 @@ class BaseImageService(object):
         # passed in by calling code. Let's be nice and ignore it.
         image_meta.pop('id', None)
 
+        METADATA_CACHE.invalidate(image_id)
         image_meta = self.call(method, image_id, **image_meta)
 
         if self.version == 2 and data:
@@ -290,4 +506,5 @@ class BaseImageService(object):
         (image_id, glance_host,
          glance_port, use_ssl) = service_utils.parse_image_ref(image_id)
 
+        METADATA_CACHE.invalidate(image_id)
         self.call(method, image_id)
@@ -13,7 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+import time
+
+from eventlet import greenpool
+from eventlet import queue
 from oslo.config import cfg
+import requests
 from swiftclient import utils as swift_utils
 
 from ironic.common import exception as exc
@@ -67,10 +73,46 @@ glance_opts = [
                     'in glance-api.conf. '
                     'Swift temporary URL format: '
                     '"endpoint_url/api_version/account/container/object_id"'),
+    cfg.FloatOpt('swift_temp_url_reuse_fraction',
+                 default=0.5,
+                 help='Fraction of "swift_temp_url_duration" during which '
+                      'a temporary URL generated for an image is reused '
+                      'for other requests of the same image, so that each '
+                      'URL handed out stays valid for at least the rest of '
+                      'the duration. Set to 0 to generate a new URL for '
+                      'every request.'),
+    cfg.IntOpt('swift_download_streams',
+               default=0,
+               help='Number of concurrent HTTP range requests used to '
+                    'download an image from its Swift temporary URL when '
+                    'the conductor caches it. Set to 0 to download images '
+                    'through the Glance API. Images which cannot be '
+                    'downloaded from Swift are downloaded through the '
+                    'Glance API too.'),
+    cfg.IntOpt('swift_download_min_range_size',
+               default=16 * 1024 * 1024,
+               help='Minimum size (in bytes) of the ranges of an image '
+                    'downloaded from Swift, so that small images are '
+                    'downloaded with fewer requests.'),
+    cfg.IntOpt('swift_download_timeout',
+               default=60,
+               help='Time (in seconds) to wait for Swift to accept a '
+                    'connection or to send data when an image is '
+                    'downloaded from Swift, before the download is given '
+                    'up and the image is downloaded through the Glance API '
+                    'instead.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(glance_opts, group='glance')
+CONF.import_opt('glance_verify_checksum', 'ironic.common.image_service',
+                group='glance')
+
+_CHUNK_SIZE = 64 * 1024
+
+# temporary URLs already generated, keyed by (endpoint, path, key, duration)
+# with the time until which they are reused
+_TEMP_URLS = {}
 
 
 class GlanceImageService(base_image_service.BaseImageService,
@@ -105,7 +147,8 @@ class GlanceImageService(base_image_service.BaseImageService,
         'swift_api_version', 'swift_account' and 'swift_container'.
         The temporary URL will be valid for 'swift_temp_url_duration' seconds.
         This allows Ironic to download a Glance image without passing around
-        an auth_token.
+        an auth_token. The URL is reused for the same image during
+        'swift_temp_url_reuse_fraction' of that duration.
 
         :param image_info: The return from a GET request to Glance for a
         certain image_id. Should be a dictionary, with keys like 'name' and
@@ -138,15 +181,130 @@ class GlanceImageService(base_image_service.BaseImageService,
 
         template = '/{api_version}/{account}/{container}/{object_id}'
         url_path = template.format(**url_fragments)
+        duration = CONF.glance.swift_temp_url_duration
+        cache_key = (url_fragments['endpoint_url'], url_path,
+                     CONF.glance.swift_temp_url_key, duration)
+        now = time.time()
+        cached = _TEMP_URLS.get(cache_key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
         path = swift_utils.generate_temp_url(
             path=url_path,
-            seconds=CONF.glance.swift_temp_url_duration,
+            seconds=duration,
             key=CONF.glance.swift_temp_url_key,
             method='GET')
-
-        return '{endpoint_url}{url_path}'.format(
+        url = '{endpoint_url}{url_path}'.format(
             endpoint_url=url_fragments['endpoint_url'], url_path=path)
 
+        fraction = min(CONF.glance.swift_temp_url_reuse_fraction, 1.0)
+        reuse_until = now + duration * fraction
+        if reuse_until > now:
+            for key in [k for k, v in _TEMP_URLS.items() if v[0] <= now]:
+                del _TEMP_URLS[key]
+            _TEMP_URLS[cache_key] = (reuse_until, url)
+        return url
+
+    def download_from_swift(self, image_id, path):
+        """Download an image from Swift, fetching ranges concurrently.
+
+        The image is downloaded from its Swift temporary URL with up to
+        'swift_download_streams' concurrent HTTP range requests, each of
+        them writing its part of the file, which is preallocated to the
+        size of the image.
+
+        :param image_id: The opaque image identifier.
+        :param path: The file to download the image to.
+        :returns: the MD5 checksum of the image if it was verified.
+
+        :raises: InvalidParameterValue if Swift config options are not set
+        correctly.
+        :raises: ImageDownloadFailed if the image has no data or a range
+        could not be downloaded.
+        :raises: ImageChecksumError
+        """
+        image_info = self.show(image_id)
+        size = image_info.get('size')
+        if not size or size < 0:
+            raise exc.ImageDownloadFailed(image_href=image_id,
+                reason=_('the image size is unknown: %s') % size)
+        url = self.swift_temp_url(image_info)
+
+        streams = min(CONF.glance.swift_download_streams,
+                      size // max(CONF.glance.swift_download_min_range_size,
+                                  1))
+        range_size = -(-size // max(streams, 1))
+        ranges = [(start, min(start + range_size, size) - 1)
+                  for start in range(0, size, range_size)]
+        with open(path, 'wb') as f:
+            f.truncate(size)
+
+        results = queue.LightQueue()
+
+        def _download(start, end):
+            try:
+                self._download_range(image_id, url, path, start, end)
+            except Exception as e:
+                results.put(e)
+            else:
+                results.put(None)
+
+        pool = greenpool.GreenPool(len(ranges))
+        threads = [pool.spawn(_download, start, end) for start, end in ranges]
+        try:
+            for _range in ranges:
+                error = results.get()
+                if error is not None:
+                    raise error
+        finally:
+            # NOTE: on failure, stop the other ranges before the caller
+            # deletes the file they write to.
+            for thread in threads:
+                thread.kill()
+
+        checksum = image_info.get('checksum')
+        if not (CONF.glance.glance_verify_checksum and checksum):
+            return
+        hasher = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), ''):
+                hasher.update(chunk)
+        if hasher.hexdigest() != checksum:
+            raise exc.ImageChecksumError(image_id=image_id,
+                                         expected=checksum,
+                                         actual=hasher.hexdigest())
+        return checksum
+
+    def _download_range(self, image_id, url, path, start, end):
+        """Download bytes start to end (included) of an image to a file."""
+        try:
+            resp = requests.get(url, stream=True,
+                                headers={'Range': 'bytes=%d-%d'
+                                                  % (start, end)},
+                                timeout=CONF.glance.swift_download_timeout)
+            try:
+                if resp.status_code != 206:
+                    raise exc.ImageDownloadFailed(image_href=image_id,
+                        reason=_('Swift answered HTTP %(code)s to a request '
+                                 'for bytes %(start)d-%(end)d') %
+                               {'code': resp.status_code, 'start': start,
+                                'end': end})
+                written = 0
+                with open(path, 'r+b') as f:
+                    f.seek(start)
+                    for chunk in resp.iter_content(_CHUNK_SIZE):
+                        f.write(chunk)
+                        written += len(chunk)
+            finally:
+                resp.close()
+        except requests.RequestException as e:
+            raise exc.ImageDownloadFailed(image_href=image_id,
+                                          reason=str(e))
+        if written != end - start + 1:
+            raise exc.ImageDownloadFailed(image_href=image_id,
+                reason=_('got %(written)d bytes of range %(start)d-%(end)d')
+                       % {'written': written, 'start': start, 'end': end})
+
     def _validate_temp_url_config(self):
         """Validate the required settings for a temporary URL."""
         if not CONF.glance.swift_temp_url_key:
@@ -169,7 +327,7 @@ class GlanceImageService(base_image_service.BaseImageService,
         """Returns the direct url representing the backend storage location,
         or None if this attribute is not shown by Glance.
         """
-        image_meta = self.call('get', image_id)
+        image_meta = self._get_image(image_id)
 
         if not service_utils.is_image_available(self.context, image_meta):
             raise exc.ImageNotFound(image_id=image_id)
@@ -17,6 +17,7 @@ import array
 import hashlib
 import struct
 import threading
+import time
 
 from oslo.config import cfg
 
@@ -39,12 +40,32 @@ hash_opts = [
                     'conductor services to prepare deployment environments '
                     'and potentially allow the Ironic cluster to recover '
                     'more quickly if a conductor instance is terminated.'),
+    cfg.IntOpt('hash_ring_reset_interval',
+               default=180,
+               help='Interval (in seconds) between refreshes of the hash '
+                    'rings shared by all users within a process. Only the '
+                    'rings of drivers whose set of active conductors has '
+                    'changed are rebuilt on refresh.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(hash_opts)
 
 
+def get_hash_key(data):
+    """Get the 32-bit hash of a string identifier used to map it onto a ring.
+
+    :param data: A string identifier.
+    :returns: an integer in the range [0, 2**32).
+    :raises: Invalid if the data can not be hashed.
+    """
+    try:
+        return struct.unpack_from('>I', hashlib.md5(data).digest())[0]
+    except TypeError:
+        raise exception.Invalid(
+                _("Invalid data supplied to HashRing.get_hosts."))
+
+
 class HashRing(object):
 
     def __init__(self, hosts, replicas=None):
@@ -67,17 +88,95 @@ class HashRing(object):
                     _("Invalid hosts supplied when building HashRing."))
 
         self.partition_shift = 32 - CONF.hash_partition_exponent
+        self._host_ids = dict((h, i) for i, h in enumerate(self.hosts))
+
+        # Each host is mapped to one contiguous block of partitions, so that
+        # the data of a host has hash keys in a single range.
         self.part2host = array.array('H')
-        for p in range(2 ** CONF.hash_partition_exponent):
-            self.part2host.append(p % len(hosts))
+        for host_id in range(len(self.hosts)):
+            self.part2host.extend(
+                array.array('H', [host_id]) *
+                (self._first_partition(host_id + 1) -
+                 self._first_partition(host_id)))
 
-    def _get_partition(self, data):
-        try:
-            return (struct.unpack_from('>I', hashlib.md5(data).digest())[0]
-                    >> self.partition_shift)
-        except TypeError:
-            raise exception.Invalid(
-                    _("Invalid data supplied to HashRing.get_hosts."))
+    def _first_partition(self, host_id):
+        # NOTE: host h is mapped to the partitions p such that
+        #       p * len(hosts) // num_partitions == h
+        num_partitions = 2 ** CONF.hash_partition_exponent
+        num_hosts = len(self.hosts)
+        return (host_id * num_partitions + num_hosts - 1) // num_hosts
+
+    def get_partition(self, data):
+        """Get the partition of the ring which the supplied data maps onto.
+
+        :param data: A string identifier to be mapped across the ring.
+        :returns: the partition, an index into part2host.
+        :raises: Invalid if the data can not be hashed.
+        """
+        return get_hash_key(data) >> self.partition_shift
+
+    def get_hash_key_range(self, host):
+        """Get the hash keys of the data which maps onto a host.
+
+        Data maps onto the host (as the first of its hosts) if and only if
+        start <= get_hash_key(data) < end. This allows selecting the data
+        mapped to a host without hashing each item, eg. with an indexed
+        database query.
+
+        :param host: the host to get the range for.
+        :returns: a (start, end) tuple, or None if the host is not part of
+                  this ring.
+        """
+        host_id = self._host_ids.get(host)
+        if host_id is None:
+            return None
+        # NOTE: the hash key of the data in partition p is in
+        # [p << shift, (p + 1) << shift).
+        shift = self.partition_shift
+        return (self._first_partition(host_id) << shift,
+                self._first_partition(host_id + 1) << shift)
+
+    def get_partitions_hash_key_ranges(self, partitions):
+        """Get the hash keys of the data which maps onto some partitions.
+
+        :param partitions: an iterable of partitions of this ring.
+        :returns: a list of (start, end) tuples, one for each run of
+                  consecutive partitions, such that data is in one of the
+                  partitions if and only if start <= get_hash_key(data) < end
+                  for one of them.
+        """
+        ranges = []
+        shift = self.partition_shift
+        for partition in sorted(partitions):
+            if ranges and ranges[-1][1] == partition:
+                ranges[-1][1] = partition + 1
+            else:
+                ranges.append([partition, partition + 1])
+        return [(start << shift, end << shift) for start, end in ranges]
+
+    def _get_ignore_host_ids(self, ignore_hosts):
+        if not ignore_hosts:
+            return frozenset()
+        return frozenset(self._host_ids[h] for h in ignore_hosts
+                         if h in self._host_ids)
+
+    def _get_host_ids(self, partition, ignore_host_ids):
+        if self.replicas == 1 and not ignore_host_ids:
+            # Fast path for the common case.
+            return [self.part2host[partition]]
+
+        # NOTE: the other replicas, and the hosts replacing ignored ones,
+        # are the next hosts of the ring, in order.
+        host_ids = []
+        num_hosts = len(self.hosts)
+        host_id = self.part2host[partition]
+        for i in range(num_hosts):
+            if len(host_ids) >= self.replicas:
+                break
+            candidate = (host_id + i) % num_hosts
+            if candidate not in ignore_host_ids:
+                host_ids.append(candidate)
+        return host_ids
 
     def get_hosts(self, data, ignore_hosts=None):
         """Get the list of hosts which the supplied data maps onto.
@@ -92,53 +191,180 @@ class HashRing(object):
                   this `HashRing` was created with. It may be less than this
                   if ignore_hosts is not None.
         """
-        host_ids = []
-        if ignore_hosts is None:
-            ignore_host_ids = []
-        else:
-            ignore_host_ids = [self.hosts.index(h)
-                               for h in ignore_hosts if h in self.hosts]
-
-        partition = self._get_partition(data)
-        for replica in range(0, self.replicas):
-            if len(host_ids + ignore_host_ids) == len(self.hosts):
-                # prevent infinite loop
-                break
-            while self.part2host[partition] in host_ids + ignore_host_ids:
-                partition += 1
-                if partition >= len(self.part2host):
-                    partition = 0
-            host_ids.append(self.part2host[partition])
+        host_ids = self._get_host_ids(self.get_partition(data),
+                                      self._get_ignore_host_ids(ignore_hosts))
         return [self.hosts[h] for h in host_ids]
 
+    def get_hosts_many(self, data_list, ignore_hosts=None):
+        """Get the lists of hosts which each of the supplied data maps onto.
+
+        This is equivalent to calling get_hosts for each item, but the
+        excluded hosts are resolved only once and the hosts of each partition
+        are only looked up once for the whole batch.
+
+        :param data_list: An iterable of string identifiers to be mapped
+                          across the ring.
+        :param ignore_hosts: A list of hosts to skip when performing the hash.
+                             Default: None.
+        :returns: a dict mapping each identifier to its list of hosts, as
+                  returned by get_hosts.
+        """
+        ignore_host_ids = self._get_ignore_host_ids(ignore_hosts)
+        hosts = self.hosts
+        md5 = hashlib.md5
+        unpack_from = struct.unpack_from
+        shift = self.partition_shift
+        part2host = self.part2host
+        fast_path = self.replicas == 1 and not ignore_host_ids
+        part2hosts = {}
+        result = {}
+        for data in data_list:
+            try:
+                partition = unpack_from('>I', md5(data).digest())[0] >> shift
+            except TypeError:
+                raise exception.Invalid(
+                        _("Invalid data supplied to HashRing.get_hosts."))
+            if fast_path:
+                result[data] = [hosts[part2host[partition]]]
+                continue
+            try:
+                part_hosts = part2hosts[partition]
+            except KeyError:
+                part_hosts = [hosts[h] for h in
+                              self._get_host_ids(partition, ignore_host_ids)]
+                part2hosts[partition] = part_hosts
+            result[data] = list(part_hosts)
+        return result
+
+
+def get_moved_partitions(old_ring, new_ring, host):
+    """Get the partitions which a host gained or lost between two rings.
+
+    Only the primary host of each partition is considered.
+
+    :param old_ring: the previous HashRing, or None if there was none.
+    :param new_ring: the current HashRing, or None if there is none.
+    :param host: the host to compare the rings for.
+    :returns: a set of partitions which are mapped to the host in one of the
+              rings but not in the other.
+    """
+    def _owned(ring):
+        if ring is None or host not in ring.hosts:
+            return set()
+        host_id = ring.hosts.index(host)
+        return set(p for p, h in enumerate(ring.part2host) if h == host_id)
+
+    return _owned(old_ring) ^ _owned(new_ring)
+
 
 class HashRingManager(object):
+    """Maps driver names to HashRings.
+
+    The rings are shared by every HashRingManager within a process, so that
+    short-lived users (eg. the RPC API client built for each API request) do
+    not have to query the database and rebuild the rings each time. The rings
+    are refreshed every CONF.hash_ring_reset_interval seconds; on refresh only
+    the rings of drivers whose set of active conductors changed are rebuilt.
+    """
+
+    _hash_rings = None
+    _updated_at = 0
+    _generation = 0
+    _registrations = None
+    _lock = threading.Lock()
+
     def __init__(self):
-        self._lock = threading.Lock()
         self.dbapi = dbapi.get_instance()
-        self.hash_rings = None
 
-    def _load_hash_rings(self):
+    @property
+    def hash_rings(self):
+        self._ensure_rings_fresh()
+        return self.__class__._hash_rings
+
+    @property
+    def generation(self):
+        """Number of times the shared rings have changed in this process.
+
+        Callers holding on to a ring can compare this with the value they
+        saw when they got it to cheaply detect that the ring may be stale.
+        """
+        return self.__class__._generation
+
+    def _load_hash_rings(self, old_rings=None):
+        if old_rings is None:
+            old_rings = {}
         rings = {}
         d2c = self.dbapi.get_active_driver_dict()
 
         for driver_name, hosts in d2c.iteritems():
-            rings[driver_name] = HashRing(hosts)
+            ring = old_rings.get(driver_name)
+            if ring is None or set(ring.hosts) != set(hosts):
+                ring = HashRing(hosts)
+            rings[driver_name] = ring
         return rings
 
+    def _rings_are_stale(self):
+        cls = self.__class__
+        return (cls._hash_rings is None or
+                time.time() - cls._updated_at >
+                CONF.hash_ring_reset_interval)
+
     def _ensure_rings_fresh(self):
         # Hot path, no lock
-        # TODO(russell_h): Consider adding time-based invalidation of rings
-        if self.hash_rings is not None:
+        if not self._rings_are_stale():
             return
 
-        with self._lock:
-            if self.hash_rings is None:
-                self.hash_rings = self._load_hash_rings()
+        with self.__class__._lock:
+            if self._rings_are_stale():
+                self._update_rings()
 
-    def get_hash_ring(self, driver_name):
-        self._ensure_rings_fresh()
+    def _update_rings(self, registrations=None):
+        # NOTE: must be called with the lock held.
+        cls = self.__class__
+        cls._registrations = registrations
+        old_rings = cls._hash_rings
+        new_rings = self._load_hash_rings(old_rings)
+        if (old_rings is None or set(old_rings) != set(new_rings) or
+                any(new_rings[d] is not old_rings[d] for d in new_rings)):
+            cls._generation += 1
+        cls._hash_rings = new_rings
+        cls._updated_at = time.time()
+
+    def refresh(self):
+        """Reload the rings now, regardless of when they were last loaded.
 
+        Only the rings of drivers whose set of active conductors has changed
+        are rebuilt, and the generation is only bumped if any ring changed.
+        """
+        with self.__class__._lock:
+            self._update_rings()
+
+    def refresh_membership(self):
+        """Reload the rings only if the set of active conductors changed.
+
+        Unlike refresh, this only queries the registrations of the active
+        conductors, and only reloads the rings if they differ from the ones
+        seen by the last call. This makes it cheap enough to call on every
+        heartbeat.
+        """
+        registrations = self.dbapi.get_active_conductor_registrations()
+        with self.__class__._lock:
+            cls = self.__class__
+            if (cls._hash_rings is not None and
+                    cls._registrations == registrations):
+                cls._updated_at = time.time()
+                return
+            self._update_rings(registrations)
+
+    @classmethod
+    def reset(cls):
+        """Drop the shared rings, forcing them to be reloaded on next use."""
+        with cls._lock:
+            cls._hash_rings = None
+            cls._updated_at = 0
+            cls._registrations = None
+
+    def get_hash_ring(self, driver_name):
         try:
             return self.hash_rings[driver_name]
         except KeyError:
@@ -43,6 +43,33 @@ glance_opts = [
                default=0,
                help='Number of retries when downloading an image from '
                     'glance.'),
+    cfg.IntOpt('glance_retry_interval',
+               default=1,
+               help='Time (in seconds) to wait before retrying a failed '
+                    'request to glance. The wait doubles with every '
+                    'further retry.'),
+    cfg.IntOpt('glance_max_retry_interval',
+               default=30,
+               help='Maximum time (in seconds) to wait between two retries '
+                    'of a failed request to glance.'),
+    cfg.IntOpt('glance_download_buffer_size',
+               default=1024 * 1024,
+               help='Size (in bytes) of the buffer collecting the chunks of '
+                    'an image downloaded from glance before they are '
+                    'written. Set to 0 to write the chunks as they are '
+                    'received.'),
+    cfg.BoolOpt('glance_verify_checksum',
+                default=True,
+                help='Verify the checksum of images downloaded from glance '
+                     'while they are downloaded.'),
+    cfg.IntOpt('glance_metadata_cache_ttl',
+               default=60,
+               help='Time (in seconds) for which the metadata of an image '
+                    'fetched from glance is reused instead of being fetched '
+                    'again. Set to 0 to disable the cache.'),
+    cfg.IntOpt('glance_metadata_cache_size',
+               default=1024,
+               help='Maximum number of images whose metadata is cached.'),
     cfg.StrOpt('auth_strategy',
                default='keystone',
                help='Default protocol to use when connecting to glance. '
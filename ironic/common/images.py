@@ -21,6 +21,8 @@ Handling of VM disk images.
 
 import os
 import re
+import struct
+import time
 
 from oslo.config import cfg
 
@@ -37,10 +39,20 @@ image_opts = [
     cfg.BoolOpt('force_raw_images',
                 default=True,
                 help='Force backing images to raw format.'),
+    cfg.BoolOpt('stream_image_downloads',
+                default=False,
+                help='Detect the format of images from their first bytes '
+                     'while they are downloaded instead of running '
+                     'qemu-img info on them, skip writing blocks of zeros '
+                     'and convert qcow2 images straight to their '
+                     'destination.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(image_opts)
+CONF.import_opt('swift_download_streams',
+                'ironic.common.glance_service.v2.image_service',
+                group='glance')
 
 
 class QemuImgInfo(object):
@@ -174,23 +186,206 @@ def convert_image(source, dest, out_format, run_as_root=False):
     utils.execute(*cmd, run_as_root=run_as_root)
 
 
+# (format, offset, magic) of the image formats recognised by qemu-img,
+# any other image is raw
+_FORMAT_MAGICS = (('qcow2', 0, 'QFI\xfb'),
+                  ('qed', 0, 'QED\x00'),
+                  ('vmdk', 0, 'KDMV'),
+                  ('vmdk', 0, 'COWD'),
+                  ('vmdk', 0, '# Disk DescriptorFile'),
+                  ('vhdx', 0, 'vhdxfile'),
+                  ('vpc', 0, 'conectix'),
+                  ('vdi', 0x40, '\x7f\x10\xda\xbe'),
+                  ('cloop', 0, '#!/bin/sh\n#V2.0 Format\n'),
+                  ('parallels', 0, 'WithoutFreeSpace'),
+                  ('parallels', 0, 'WithouFreSpacExt'),
+                  ('bochs', 0, 'Bochs Virtual HD Image'),
+                  ('luks', 0, 'LUKS\xba\xbe'))
+_HEADER_SIZE = 512
+
+
+def detect_image_format(header):
+    """Detect the format of an image from its first bytes.
+
+    :param header: the first 512 bytes of the image, or the whole image
+                   if it is shorter.
+    :returns: the format name, as qemu-img calls it.
+    """
+    for fmt, offset, magic in _FORMAT_MAGICS:
+        if header[offset:offset + len(magic)] == magic:
+            return fmt
+    return 'raw'
+
+
+def _check_image_header(image_href, header):
+    fmt = detect_image_format(header)
+    if fmt == 'qcow2' and len(header) >= 20:
+        offset, size = struct.unpack('>QI', header[8:20])
+        if offset:
+            backing_file = header[offset:offset + size] or _('unknown')
+            raise exception.ImageUnacceptable(image_id=image_href,
+                reason=_("fmt=%(fmt)s backed by: %(backing_file)s") %
+                                              {'fmt': fmt,
+                                               'backing_file': backing_file})
+    return fmt
+
+
+class _StreamedImageFile(object):
+    """File to which an image is downloaded, detecting its format.
+
+    The format is detected from the first bytes written, so images which
+    can't be used are rejected without downloading the rest of them.
+    Chunks of zeros are not written but skipped over, leaving holes in
+    the file.
+    """
+
+    def __init__(self, image_href, path):
+        self.image_href = image_href
+        self.file_format = None
+        self.size = 0
+        self._path = path
+        self._file = open(path, 'wb')
+        self._header = ''
+        self._direct = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self._finish()
+        finally:
+            self._file.close()
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.file_format is None:
+            self._header += chunk
+            if len(self._header) < _HEADER_SIZE:
+                return
+            chunk, self._header = self._header, ''
+            self.file_format = _check_image_header(self.image_href, chunk)
+        if chunk.count('\0') == len(chunk):
+            self._file.seek(len(chunk), os.SEEK_CUR)
+        else:
+            self._file.write(chunk)
+
+    def fileno(self):
+        # NOTE: the image is copied to the file without going through
+        # write(), its format is detected once it is complete
+        self._direct = True
+        return self._file.fileno()
+
+    def _finish(self):
+        if self._direct:
+            with open(self._path, 'rb') as f:
+                self.file_format = _check_image_header(
+                    self.image_href, f.read(_HEADER_SIZE))
+            self.size = os.path.getsize(self._path)
+            return
+        if self.file_format is None:
+            header, self._header = self._header, ''
+            self.file_format = _check_image_header(self.image_href, header)
+            self._file.write(header)
+        # NOTE: extend the file over the trailing zeros skipped
+        self._file.truncate()
+
+
+def _fetch_from_swift(context, image_href, path, image_service=None):
+    """Download an image from Swift if it is enabled.
+
+    Only images from the default image service are downloaded from Swift,
+    when CONF.glance.swift_download_streams is set.
+
+    :returns: tuple (True, MD5 checksum of the image if it was verified) if
+              the image was downloaded, or (False, None) if it has to be
+              downloaded from glance.
+    """
+    if image_service or not CONF.glance.swift_download_streams:
+        return False, None
+    try:
+        glance = service.Service(version=2, context=context)
+        with fileutils.remove_path_on_error(path):
+            return True, glance.download_from_swift(image_href, path)
+    except (exception.InvalidParameterValue, exception.ImageUnacceptable,
+            exception.ImageDownloadFailed,
+            exception.ImageChecksumError) as e:
+        LOG.warning(_("Unable to download image %(image)s from Swift, "
+                      "downloading it from glance: %(exc)s"),
+                    {'image': image_href, 'exc': e})
+        return False, None
+
+
 def fetch(context, image_href, path, image_service=None):
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
     #             checked before we got here.
+    downloaded, checksum = _fetch_from_swift(context, image_href, path,
+                                             image_service)
+    if downloaded:
+        return checksum
     if not image_service:
         image_service = service.Service(version=1, context=context)
 
     with fileutils.remove_path_on_error(path):
         with open(path, "wb") as image_file:
-            image_service.download(image_href, image_file)
+            return image_service.download(image_href, image_file)
 
 
 def fetch_to_raw(context, image_href, path, image_service=None):
+    """Download an image and convert it to raw format.
+
+    :returns: the MD5 checksum of the downloaded image, if the image
+              service verified it, otherwise None.
+    """
     path_tmp = "%s.part" % path
-    fetch(context, image_href, path_tmp, image_service)
+    if CONF.stream_image_downloads:
+        return _stream_to_raw(context, image_href, path, path_tmp,
+                              image_service)
+    checksum = fetch(context, image_href, path_tmp, image_service)
     image_to_raw(image_href, path, path_tmp)
+    return checksum
+
+
+def _stream_to_raw(context, image_href, path, path_tmp, image_service=None):
+    started = time.time()
+    downloaded, checksum = _fetch_from_swift(context, image_href, path_tmp,
+                                             image_service)
+    if downloaded:
+        with fileutils.remove_path_on_error(path_tmp):
+            with open(path_tmp, 'rb') as f:
+                fmt = _check_image_header(image_href, f.read(_HEADER_SIZE))
+        size = os.path.getsize(path_tmp)
+    else:
+        if not image_service:
+            image_service = service.Service(version=1, context=context)
+        with fileutils.remove_path_on_error(path_tmp):
+            with _StreamedImageFile(image_href, path_tmp) as image_file:
+                checksum = image_service.download(image_href, image_file)
+        fmt, size = image_file.file_format, image_file.size
+    elapsed = time.time() - started
+    LOG.debug("Downloaded %(size)d bytes of %(format)s image %(image)s "
+              "in %(time).2f seconds (%(rate).1f MiB/s)",
+              {'size': size, 'format': fmt, 'image': image_href,
+               'time': elapsed,
+               'rate': size / 1024.0 / 1024 / max(elapsed, 1e-6)})
+
+    if fmt == 'raw' or (fmt == 'qcow2' and not CONF.force_raw_images):
+        os.rename(path_tmp, path)
+    elif fmt == 'qcow2':
+        # NOTE: the header was checked while downloading, and qemu-img
+        # convert writes raw images, so qemu-img info is not needed
+        LOG.debug("%(image)s was qcow2, converting to raw" %
+                  {'image': image_href})
+        with fileutils.remove_path_on_error(path_tmp):
+            with fileutils.remove_path_on_error(path):
+                convert_image(path_tmp, path, 'raw')
+        os.unlink(path_tmp)
+    else:
+        image_to_raw(image_href, path, path_tmp)
+    return checksum
 
 
 def image_to_raw(image_href, path, path_tmp):
@@ -42,8 +42,10 @@ a change, etc.
 """
 
 import collections
+import contextlib
 import datetime
 import threading
+import time
 
 import eventlet
 from eventlet import greenpool
@@ -62,7 +64,6 @@ from ironic.common import utils as ironic_utils
 from ironic.conductor import task_manager
 from ironic.conductor import utils
 from ironic.db import api as dbapi
-from ironic import objects
 from ironic.openstack.common import excutils
 from ironic.openstack.common import lockutils
 from ironic.openstack.common import log
@@ -112,6 +113,22 @@ conductor_opts = [
                         'number of times Ironic should try syncing the '
                         'hardware node power state with the node power state '
                         'in DB'),
+        cfg.IntOpt('sync_power_state_workers',
+                   default=8,
+                   help='Number of nodes whose power state is synced '
+                        'concurrently during sync_power_state.'),
+        cfg.IntOpt('sync_power_state_pass_timeout',
+                   default=0,
+                   help='Maximum time (in seconds) a single sync_power_state '
+                        'pass may take. Nodes which were not started by then '
+                        'are skipped until the next pass. 0 - unlimited.'),
+        cfg.IntOpt('sync_power_state_batch_size',
+                   default=32,
+                   help='Maximum number of nodes whose power states are '
+                        'queried together during sync_power_state, for the '
+                        'drivers able to query all the nodes of a hypervisor '
+                        'or chassis at once. The nodes of a batch stay '
+                        'locked until all of them are synced.'),
         cfg.IntOpt('periodic_max_workers',
                    default=8,
                    help='Maximum number of worker threads that can be started '
@@ -140,6 +157,17 @@ conductor_opts = [
                         ' sent to Ceilometer. The default value, "ALL", is a '
                         'special value meaning send all the sensor data.'
                         ),
+        cfg.IntOpt('send_sensor_data_workers',
+                   default=4,
+                   help='The maximum number of nodes whose sensor data is '
+                        'collected concurrently by the send sensor data '
+                        'periodic task.'),
+        cfg.IntOpt('send_sensor_data_batch_size',
+                   default=1,
+                   help='The maximum number of nodes whose sensor data is '
+                        'sent in a single notification. When greater than '
+                        '1, the payload of the notification is the list of '
+                        'the per-node messages.'),
 ]
 
 CONF = cfg.CONF
@@ -199,6 +227,15 @@ class ConductorManager(periodic_task.PeriodicTasks):
         self.ring_manager = hash.HashRingManager()
         """Consistent hash ring which maps drivers to conductors."""
 
+        # NOTE: start from no rings at all, so that the first membership
+        # check takes over the nodes mapped to this conductor as it joins.
+        self._ring_generation = None
+        self._hash_rings = {}
+        """Rings seen by the last conductor membership check."""
+
+        self._takeover_partitions = {}
+        """Partitions, per driver, with nodes yet to be taken over."""
+
         self._worker_pool = greenpool.GreenPool(
                                 size=CONF.conductor.workers_pool_size)
         """GreenPool of background workers for performing tasks async."""
@@ -605,7 +642,16 @@ class ConductorManager(periodic_task.PeriodicTasks):
         node.save(task.context)
         LOG.error(msg)
 
-    def _do_sync_power_state(self, task):
+    def _do_sync_power_state(self, task, queried_state=None):
+        """Sync the power state of a node.
+
+        :param task: a TaskManager instance with an exclusive lock on the
+                     node.
+        :param queried_state: the power state of the node, or the exception
+                              raised getting it, if it was already queried
+                              along with other nodes. The power state is
+                              queried here if None.
+        """
         node = task.node
         power_state = None
 
@@ -618,7 +664,12 @@ class ConductorManager(periodic_task.PeriodicTasks):
                 return
 
         try:
-            power_state = task.driver.power.get_power_state(task)
+            if queried_state is None:
+                power_state = task.driver.power.get_power_state(task)
+            elif isinstance(queried_state, Exception):
+                raise queried_state
+            else:
+                power_state = queried_state
         except Exception as e:
             # TODO(rloo): change to IronicException, after
             #             https://bugs.launchpad.net/ironic/+bug/1267693
@@ -707,46 +758,176 @@ class ConductorManager(periodic_task.PeriodicTasks):
         cause a deploy callback to fail. There's not much we can do
         here to avoid failing a brand new deploy to a node that we've
         locked here, though.
+
+        Up to CONF.conductor.sync_power_state_workers nodes are synced
+        concurrently, and nodes which were not started within
+        CONF.conductor.sync_power_state_pass_timeout seconds are left for
+        the next pass. The power states of nodes with the same driver and
+        power endpoint (see PowerInterface.get_power_endpoint) are queried
+        in batches of up to CONF.conductor.sync_power_state_batch_size
+        nodes.
         """
-        # FIXME(comstud): Since our initial state checks are outside
-        # of the lock (to try to avoid the lock), some checks are
-        # repeated after grabbing the lock so we can unlock quickly.
-        # The node mapping is not re-checked because it doesn't much
-        # matter if things happened to re-balance.
-        #
-        # This is inefficient and racey. We end up with calling DB API's
-        # get_node() twice (once here, and once in acquire(). Ideally we
-        # add a way to pass constraints to task_manager.acquire()
-        # (through to its DB API call) so that we can eliminate our call
-        # and first set of checks below.
-
-        filters = {'reserved': False, 'maintenance': False}
-        columns = ['id', 'uuid', 'driver']
+        # NOTE: The node list is only a hint. The conditions are checked
+        # again, atomically, by the conditional reservation in
+        # task_manager.acquire(), so a node that changed in between is
+        # skipped without another read. The node mapping is not re-checked
+        # because it doesn't much matter if things happened to re-balance.
+        filters = {'reserved': False, 'maintenance': False,
+                   'provision_state_not_in': [states.DEPLOYWAIT],
+                   'driver_hash_ranges': self._get_driver_hash_ranges()}
+        columns = ['id', 'uuid', 'driver', 'driver_info']
         node_list = self.dbapi.get_nodeinfo_list(columns=columns,
                                                  filters=filters)
-        for (node_id, node_uuid, driver) in node_list:
+
+        start = time.time()
+        timeout = CONF.conductor.sync_power_state_pass_timeout
+        pool = greenpool.GreenPool(
+                    size=CONF.conductor.sync_power_state_workers)
+        results = collections.defaultdict(int)
+
+        def _sync(batch):
+            if len(batch) == 1:
+                synced = int(self._sync_node_power_state(context, *batch[0]))
+            else:
+                synced = self._sync_node_power_states(context, batch)
+            results['synced'] += synced
+            results['skipped'] += len(batch) - synced
+
+        started = 0
+        for batch in self._get_power_sync_batches(node_list):
+            if timeout and time.time() - start > timeout:
+                results['timed_out'] = len(node_list) - started
+                break
+            started += len(batch)
+            pool.spawn_n(_sync, batch)
+        pool.waitall()
+
+        if results['timed_out']:
+            LOG.warning(_LW("During sync_power_state, the pass took longer "
+                            "than %(timeout)s seconds; %(count)s nodes were "
+                            "not synced and will be synced in the next "
+                            "pass."),
+                        {'timeout': timeout, 'count': results['timed_out']})
+        LOG.debug("sync_power_state pass took %(duration).2f seconds: "
+                  "%(synced)d nodes synced, %(skipped)d skipped, "
+                  "%(timed_out)d not started before the pass timeout.",
+                  {'duration': time.time() - start,
+                   'synced': results['synced'],
+                   'skipped': results['skipped'],
+                   'timed_out': results['timed_out']})
+
+    def _get_power_sync_batches(self, node_list):
+        """Group the nodes whose power states may be queried together.
+
+        :param node_list: a list of (id, uuid, driver, driver_info) tuples.
+        :returns: a list of batches, lists of (id, uuid, driver) tuples, in
+                  the order of the first node of each batch.
+        """
+        batches = []
+        open_batches = {}
+        for node_id, node_uuid, driver, driver_info in node_list:
+            node = (node_id, node_uuid, driver)
             try:
-                if not self._mapped_to_this_conductor(node_uuid, driver):
-                    continue
-                node = objects.Node.get_by_id(context, node_id)
-                if (node.provision_state == states.DEPLOYWAIT or
-                        node.maintenance or node.reservation is not None):
-                    continue
-                with task_manager.acquire(context, node_id) as task:
-                    if (task.node.provision_state != states.DEPLOYWAIT and
-                            not task.node.maintenance):
-                        self._do_sync_power_state(task)
-            except exception.NodeNotFound:
-                LOG.info(_("During sync_power_state, node %(node)s was not "
-                           "found and presumed deleted by another process.") %
-                           {'node': node_uuid})
-            except exception.NodeLocked:
-                LOG.info(_("During sync_power_state, node %(node)s was "
-                           "already locked by another process. Skip.") %
-                           {'node': node_uuid})
-            finally:
+                power = self._get_driver(driver).power
+            except exception.DriverNotFound:
+                endpoint = None
+            else:
+                endpoint = power.get_power_endpoint(driver_info or {})
+            if endpoint is None:
+                batches.append([node])
+                continue
+
+            batch = open_batches.get((driver, endpoint))
+            if (batch is None or
+                    len(batch) >= CONF.conductor.sync_power_state_batch_size):
+                batch = open_batches[(driver, endpoint)] = []
+                batches.append(batch)
+            batch.append(node)
+        return batches
+
+    def _sync_node_power_state(self, context, node_id, node_uuid, driver):
+        """Sync the power state of a single node, if it should be synced.
+
+        :returns: True if the node's power state was synced, False if the
+                  node was skipped.
+        """
+        synced = False
+        with self._handle_sync_power_state_errors(node_uuid):
+            if self._mapped_to_this_conductor(node_uuid, driver):
+                with self._acquire_for_power_sync(context, node_id) as task:
+                    self._do_sync_power_state(task)
+                    synced = True
+        # Yield on every iteration
+        eventlet.sleep(0)
+        return synced
+
+    def _sync_node_power_states(self, context, nodes):
+        """Sync the power states of nodes queried with one driver call.
+
+        :param nodes: a list of (id, uuid, driver) tuples of nodes with the
+                      same driver and power endpoint.
+        :returns: the number of nodes whose power state was synced.
+        """
+        tasks = []
+        synced = 0
+        try:
+            for node_id, node_uuid, driver in nodes:
+                with self._handle_sync_power_state_errors(node_uuid):
+                    if self._mapped_to_this_conductor(node_uuid, driver):
+                        tasks.append(self._acquire_for_power_sync(context,
+                                                                  node_id))
+            if not tasks:
+                return 0
+
+            try:
+                power_states = tasks[0].driver.power.get_power_states(tasks)
+            except Exception as e:
+                power_states = [e] * len(tasks)
+            if len(power_states) != len(tasks):
+                LOG.warning(_LW("The %(driver)s driver returned %(states)d "
+                                "power states for %(nodes)d nodes; querying "
+                                "the power state of each node instead."),
+                            {'driver': tasks[0].node.driver,
+                             'states': len(power_states),
+                             'nodes': len(tasks)})
+                power_states = [None] * len(tasks)
+            for task, power_state in zip(tasks, power_states):
+                with self._handle_sync_power_state_errors(task.node.uuid):
+                    self._do_sync_power_state(task, power_state)
+                    synced += 1
                 # Yield on every iteration
                 eventlet.sleep(0)
+        finally:
+            for task in tasks:
+                task.release_resources()
+        return synced
+
+    def _acquire_for_power_sync(self, context, node_id):
+        filters = {'maintenance': False,
+                   'provision_state_not_in': [states.DEPLOYWAIT]}
+        return task_manager.acquire(context, node_id, filters=filters,
+                                    retry=False)
+
+    @contextlib.contextmanager
+    def _handle_sync_power_state_errors(self, node_uuid):
+        """Log and swallow the errors syncing the power state of a node."""
+        try:
+            yield
+        except exception.NodeConstraintsNotMet:
+            # The node entered maintenance or DEPLOYWAIT since it was listed.
+            pass
+        except exception.NodeNotFound:
+            LOG.info(_("During sync_power_state, node %(node)s was not "
+                       "found and presumed deleted by another process.") %
+                       {'node': node_uuid})
+        except exception.NodeLocked:
+            LOG.info(_("During sync_power_state, node %(node)s was "
+                       "already locked by another process. Skip.") %
+                       {'node': node_uuid})
+        except Exception:
+            LOG.exception(_("During sync_power_state, unexpected error "
+                            "while syncing node %(node)s."),
+                          {'node': node_uuid})
 
     @periodic_task.periodic_task(
             spacing=CONF.conductor.check_provision_state_interval)
@@ -758,7 +939,8 @@ class ConductorManager(periodic_task.PeriodicTasks):
         filters = {'reserved': False,
                    'provision_state': states.DEPLOYWAIT,
                    'maintenance': False,
-                   'provisioned_before': callback_timeout}
+                   'provisioned_before': callback_timeout,
+                   'driver_hash_ranges': self._get_driver_hash_ranges()}
         columns = ['uuid', 'driver']
         node_list = self.dbapi.get_nodeinfo_list(
                                     columns=columns,
@@ -790,15 +972,132 @@ class ConductorManager(periodic_task.PeriodicTasks):
             if workers_count == CONF.conductor.periodic_max_workers:
                 break
 
-    def rebalance_node_ring(self):
+    @periodic_task.periodic_task(
+            spacing=CONF.conductor.heartbeat_interval)
+    def _check_conductor_membership(self, context):
+        """Periodic task to detect conductors joining or leaving.
+
+        Reloads the hash rings when the set of active conductors changed,
+        rebuilding only the rings of drivers whose conductors changed, and
+        triggers a rebalance for the partitions this conductor gained or
+        lost.
+        """
+        self.ring_manager.refresh_membership()
+        # NOTE: read the generation before the rings, so that a concurrent
+        # refresh can only make us compare the rings again next time.
+        generation = self.ring_manager.generation
+        if generation == self._ring_generation:
+            # Retry taking over the nodes which were locked, or for which
+            # no worker was free, last time.
+            if self._takeover_partitions:
+                self._take_over_pending_nodes(context)
+            return
+        rings = dict(self.ring_manager.hash_rings)
+
+        moved = {}
+        for driver_name in self.drivers:
+            old_ring = self._hash_rings.get(driver_name)
+            new_ring = rings.get(driver_name)
+            if old_ring is new_ring:
+                continue
+            partitions = hash.get_moved_partitions(old_ring, new_ring,
+                                                   self.host)
+            if partitions:
+                moved[driver_name] = partitions
+
+        self._ring_generation = generation
+        self._hash_rings = rings
+        if moved or self._takeover_partitions:
+            self.rebalance_node_ring(context, moved)
+
+    def rebalance_node_ring(self, context, moved_partitions=None):
         """Perform any actions necessary when rebalancing the consistent hash.
 
-        This may trigger several actions, such as calling driver.deploy.prepare
-        for nodes which are now mapped to this conductor.
+        Takes over the deployed nodes which are now mapped to this conductor,
+        by calling driver.deploy.prepare and driver.deploy.take_over for each
+        of them in a worker. The nodes which can not be taken over now,
+        because they are locked or no worker is free, are retried by the
+        next membership checks.
 
+        :param context: an admin context.
+        :param moved_partitions: a dict mapping driver names to the set of
+                                 hash partitions which this conductor gained
+                                 or lost.
+
+        """
+        for driver_name, partitions in (moved_partitions or {}).items():
+            LOG.info(_LI('Hash ring for driver %(driver)s was rebalanced, '
+                         '%(count)d partitions moved to or from conductor '
+                         '%(host)s.'),
+                     {'driver': driver_name, 'count': len(partitions),
+                      'host': self.host})
+            self._takeover_partitions.setdefault(driver_name,
+                                                 set()).update(partitions)
+        self._take_over_pending_nodes(context)
+
+    def _take_over_pending_nodes(self, context):
+        pending = self._takeover_partitions
+        self._takeover_partitions = {}
+        for driver_name, partitions in pending.items():
+            ring = self._hash_rings.get(driver_name)
+            if ring is None or self.host not in ring.hosts:
+                continue
+            # NOTE: only the partitions still mapped to this conductor,
+            # the others were lost or moved away again.
+            host_id = ring.hosts.index(self.host)
+            gained = [p for p in partitions if ring.part2host[p] == host_id]
+            if not gained:
+                continue
+            left = self._take_over_nodes(context, driver_name, ring, gained)
+            if left:
+                self._takeover_partitions[driver_name] = left
+
+    def _take_over_nodes(self, context, driver_name, ring, partitions):
+        """Take over the deployed nodes of some partitions of a ring.
+
+        :returns: the set of partitions with nodes which were not taken
+                  over, because they were locked or no worker was free.
         """
-        # TODO(deva): implement this
-        pass
+        ranges = [(driver_name, start, end) for start, end in
+                  ring.get_partitions_hash_key_ranges(partitions)]
+        filters = {'associated': True,
+                   'maintenance': False,
+                   'driver_hash_ranges': ranges}
+        node_list = self.dbapi.get_nodeinfo_list(columns=['uuid'],
+                                                 filters=filters)
+        left = set()
+        for index, (node_uuid,) in enumerate(node_list):
+            try:
+                with task_manager.acquire(context, node_uuid,
+                                          retry=False) as task:
+                    # NOTE: recheck the node now that we have the lock.
+                    if (task.node.maintenance or
+                            task.node.instance_uuid is None):
+                        continue
+                    task.spawn_after(self._spawn_worker, self._do_takeover,
+                                     task)
+            except exception.NodeNotFound:
+                continue
+            except exception.NodeLocked:
+                left.add(ring.get_partition(node_uuid))
+            except exception.NoFreeConductorWorker:
+                LOG.warning(_LW('No free conductor workers available to '
+                                'take over the nodes of driver %s, retrying '
+                                'later.'), driver_name)
+                left.update(ring.get_partition(uuid)
+                            for (uuid,) in node_list[index:])
+                break
+        return left
+
+    def _do_takeover(self, task):
+        node = task.node
+        LOG.debug('Conductor %(cond)s taking over node %(node)s',
+                  {'cond': self.host, 'node': node.uuid})
+        try:
+            task.driver.deploy.prepare(task)
+            task.driver.deploy.take_over(task)
+        except Exception:
+            LOG.exception(_('Failed to take over node %s.'), node.uuid)
 
     def _mapped_to_this_conductor(self, node_uuid, driver):
         """Check that node is mapped to this conductor.
@@ -815,6 +1114,26 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
         return self.host == ring.get_hosts(node_uuid)[0]
 
+    def _get_driver_hash_ranges(self):
+        """Get a filter selecting the nodes mapped to this conductor.
+
+        Periodic tasks pass this as the 'driver_hash_ranges' filter of
+        get_nodeinfo_list, so that each conductor only reads its own share
+        of the nodes from the database.
+
+        :returns: a list of (driver name, start, end) tuples.
+        """
+        ranges = []
+        for driver_name in self.drivers:
+            try:
+                ring = self.ring_manager.get_hash_ring(driver_name)
+            except exception.DriverNotFound:
+                continue
+            hash_range = ring.get_hash_key_range(self.host)
+            if hash_range is not None:
+                ranges.append((driver_name,) + hash_range)
+        return ranges
+
     @messaging.expected_exceptions(exception.NodeLocked)
     def validate_driver_interfaces(self, context, node_id):
         """Validate the `core` and `standardized` interfaces for drivers.
@@ -1075,53 +1394,106 @@ class ConductorManager(periodic_task.PeriodicTasks):
         if not CONF.conductor.send_sensor_data:
             return
 
-        filters = {'associated': True}
+        filters = {'associated': True,
+                   'driver_hash_ranges': self._get_driver_hash_ranges()}
         columns = ['uuid', 'driver', 'instance_uuid']
         node_list = self.dbapi.get_nodeinfo_list(columns=columns,
                                                  filters=filters)
 
-        for (node_uuid, driver, instance_uuid) in node_list:
-            # only handle the nodes mapped to this conductor
-            if not self._mapped_to_this_conductor(node_uuid, driver):
+        start = time.time()
+        batch_size = max(1, CONF.conductor.send_sensor_data_batch_size)
+        pool = greenpool.GreenPool(
+                    size=CONF.conductor.send_sensor_data_workers)
+        messages = []
+        sent = notifications = 0
+
+        # Sensor data is fetched and parsed in the pool's greenthreads;
+        # imap() hands back the results in order as they complete, so
+        # notifications go out while other nodes are still being polled.
+        for message in pool.imap(
+                lambda node: self._get_sensor_data_message(context, *node),
+                node_list):
+            if message is None:
                 continue
+            messages.append(message)
+            if len(messages) >= batch_size:
+                self._notify_sensor_data(context, messages)
+                sent += len(messages)
+                notifications += 1
+                messages = []
+        if messages:
+            self._notify_sensor_data(context, messages)
+            sent += len(messages)
+            notifications += 1
+
+        LOG.debug("send_sensor_data pass took %(duration).2f seconds: sent "
+                  "sensor data for %(sent)d of %(total)d nodes in "
+                  "%(notifications)d notifications.",
+                  {'duration': time.time() - start, 'sent': sent,
+                   'total': len(node_list), 'notifications': notifications})
+
+    def _get_sensor_data_message(self, context, node_uuid, driver,
+                                 instance_uuid):
+        """Collect the sensor data of a node.
+
+        :returns: the message to send to ceilometer, or None if the node is
+                  not mapped to this conductor or there is no sensor data
+                  to send.
+        """
+        # only handle the nodes mapped to this conductor
+        if not self._mapped_to_this_conductor(node_uuid, driver):
+            return
 
-            # populate the message which will be sent to ceilometer
-            message = {'message_id': ironic_utils.generate_uuid(),
-                       'instance_uuid': instance_uuid,
-                       'node_uuid': node_uuid,
-                       'timestamp': datetime.datetime.utcnow(),
-                       'event_type': 'hardware.ipmi.metrics.update'}
+        # populate the message which will be sent to ceilometer
+        message = {'message_id': ironic_utils.generate_uuid(),
+                   'instance_uuid': instance_uuid,
+                   'node_uuid': node_uuid,
+                   'timestamp': datetime.datetime.utcnow(),
+                   'event_type': 'hardware.ipmi.metrics.update'}
 
-            try:
-                with task_manager.acquire(context, node_uuid, shared=True) \
-                         as task:
-                    sensors_data = task.driver.management.get_sensors_data(
-                        task)
-            except NotImplementedError:
-                LOG.warn(_LW('get_sensors_data is not implemented for driver'
-                    ' %(driver)s, node_uuid is %(node)s'),
-                    {'node': node_uuid, 'driver': driver})
-            except exception.FailedToParseSensorData as fps:
-                LOG.warn(_LW("During get_sensors_data, could not parse "
-                    "sensor data for node %(node)s. Error: %(err)s."),
-                    {'node': node_uuid, 'err': str(fps)})
-            except exception.FailedToGetSensorData as fgs:
-                LOG.warn(_LW("During get_sensors_data, could not get "
-                    "sensor data for node %(node)s. Error: %(err)s."),
-                    {'node': node_uuid, 'err': str(fgs)})
-            except exception.NodeNotFound:
-                LOG.warn(_LW("During send_sensor_data, node %(node)s was not "
-                           "found and presumed deleted by another process."),
-                           {'node': node_uuid})
-            except Exception as e:
-                LOG.warn(_LW("Failed to get sensor data for node %(node)s. "
-                    "Error: %(error)s"), {'node': node_uuid, 'error': str(e)})
-            else:
-                message['payload'] = self._filter_out_unsupported_types(
-                                                              sensors_data)
-                if message['payload']:
-                    self.notifier.info(context, "hardware.ipmi.metrics",
-                                       message)
+        try:
+            with task_manager.acquire(context, node_uuid, shared=True) \
+                     as task:
+                sensors_data = task.driver.management.get_sensors_data(
+                    task, CONF.conductor.send_sensor_data_types)
+        except NotImplementedError:
+            LOG.warn(_LW('get_sensors_data is not implemented for driver'
+                ' %(driver)s, node_uuid is %(node)s'),
+                {'node': node_uuid, 'driver': driver})
+        except exception.FailedToParseSensorData as fps:
+            LOG.warn(_LW("During get_sensors_data, could not parse "
+                "sensor data for node %(node)s. Error: %(err)s."),
+                {'node': node_uuid, 'err': str(fps)})
+        except exception.FailedToGetSensorData as fgs:
+            LOG.warn(_LW("During get_sensors_data, could not get "
+                "sensor data for node %(node)s. Error: %(err)s."),
+                {'node': node_uuid, 'err': str(fgs)})
+        except exception.NodeNotFound:
+            LOG.warn(_LW("During send_sensor_data, node %(node)s was not "
+                       "found and presumed deleted by another process."),
+                       {'node': node_uuid})
+        except Exception as e:
+            LOG.warn(_LW("Failed to get sensor data for node %(node)s. "
+                "Error: %(error)s"), {'node': node_uuid, 'error': str(e)})
+        else:
+            message['payload'] = self._filter_out_unsupported_types(
+                                                          sensors_data)
+            if message['payload']:
+                return message
+
+    def _notify_sensor_data(self, context, messages):
+        """Send the sensor data messages of one or more nodes."""
+        if CONF.conductor.send_sensor_data_batch_size <= 1:
+            for message in messages:
+                self.notifier.info(context, "hardware.ipmi.metrics",
+                                   message)
+            return
+
+        batch = {'message_id': ironic_utils.generate_uuid(),
+                 'timestamp': datetime.datetime.utcnow(),
+                 'event_type': 'hardware.ipmi.metrics.update',
+                 'payload': messages}
+        self.notifier.info(context, "hardware.ipmi.metrics", batch)
 
     def _filter_out_unsupported_types(self, sensors_data):
         # support the CONF.send_sensor_data_types sensor types only
@@ -45,7 +45,7 @@ attributes that you may access:
     task.shared -- False if Node is locked, True if it is not locked. (The
                    'shared' kwarg arg of TaskManager())
     task.node -- The Node object
-    task.ports -- Ports belonging to the Node
+    task.ports -- Ports belonging to the Node, loaded on first access
     task.driver -- The Driver for the Node, or the Driver based on the
                    'driver_name' kwarg of TaskManager().
 
@@ -85,6 +85,8 @@ code when the spawned task generates an exception:
 
 """
 
+import collections
+
 import retrying
 
 from oslo.config import cfg
@@ -102,6 +104,19 @@ LOG = logging.getLogger(__name__)
 
 CONF = cfg.CONF
 
+# Counts, for this process, the tasks that needed their node's ports
+# ('loaded') and those released without querying them ('avoided').
+_PORT_QUERY_STATS = collections.defaultdict(int)
+
+
+def get_port_query_stats():
+    """Return the number of port queries made and avoided by tasks.
+
+    :returns: a dict with 'loaded' and 'avoided' keys.
+    """
+    return {'loaded': _PORT_QUERY_STATS['loaded'],
+            'avoided': _PORT_QUERY_STATS['avoided']}
+
 
 def require_exclusive_lock(f):
     """Decorator to require an exclusive lock.
@@ -119,7 +134,8 @@ def require_exclusive_lock(f):
     return wrapper
 
 
-def acquire(context, node_id, shared=False, driver_name=None):
+def acquire(context, node_id, shared=False, driver_name=None, filters=None,
+            retry=True):
     """Shortcut for acquiring a lock on a Node.
 
     :param context: Request context.
@@ -127,11 +143,16 @@ def acquire(context, node_id, shared=False, driver_name=None):
     :param shared: Boolean indicating whether to take a shared or exclusive
                    lock. Default: False.
     :param driver_name: Name of Driver. Default: None.
+    :param filters: Filters the node must match to be locked. Only used
+                    for exclusive locks. Default: None.
+    :param retry: Whether to retry locking if the node is locked.
+                  Default: True.
     :returns: An instance of :class:`TaskManager`.
 
     """
     return TaskManager(context, node_id, shared=shared,
-                       driver_name=driver_name)
+                       driver_name=driver_name, filters=filters,
+                       retry=retry)
 
 
 class TaskManager(object):
@@ -142,7 +163,8 @@ class TaskManager(object):
 
     """
 
-    def __init__(self, context, node_id, shared=False, driver_name=None):
+    def __init__(self, context, node_id, shared=False, driver_name=None,
+                 filters=None, retry=True):
         """Create a new TaskManager.
 
         Acquire a lock on a node. The lock can be either shared or
@@ -156,9 +178,15 @@ class TaskManager(object):
                        lock. Default: False.
         :param driver_name: The name of the driver to load, if different
                             from the Node's current driver.
+        :param filters: Filters the node must match to be locked, checked
+                        in the same database update that takes the lock.
+                        See dbapi.get_nodeinfo_list for the accepted keys.
+                        Only used for exclusive locks.
+        :param retry: Whether to retry locking if the node is locked.
         :raises: DriverNotFound
         :raises: NodeNotFound
         :raises: NodeLocked
+        :raises: NodeConstraintsNotMet
 
         """
 
@@ -169,31 +197,46 @@ class TaskManager(object):
         self.context = context
         self.node = None
         self.shared = shared
+        self._ports = None
 
         # NodeLocked exceptions can be annoying. Let's try to alleviate
         # some of that pain by retrying our lock attempts. The retrying
         # module expects a wait_fixed value in milliseconds.
+        attempts = CONF.conductor.node_locked_retry_attempts if retry else 1
+
         @retrying.retry(
             retry_on_exception=lambda e: isinstance(e, exception.NodeLocked),
-            stop_max_attempt_number=CONF.conductor.node_locked_retry_attempts,
+            stop_max_attempt_number=attempts,
             wait_fixed=CONF.conductor.node_locked_retry_interval * 1000)
         def reserve_node():
             LOG.debug("Attempting to reserve node %(node)s",
                       {'node': node_id})
-            self.node = self._dbapi.reserve_node(CONF.host, node_id)
+            self.node = self._dbapi.reserve_node(CONF.host, node_id,
+                                                 filters=filters)
 
         try:
             if not self.shared:
                 reserve_node()
             else:
                 self.node = objects.Node.get(context, node_id)
-            self.ports = self._dbapi.get_ports_by_node_id(self.node.id)
             self.driver = driver_factory.get_driver(driver_name or
                                                     self.node.driver)
         except Exception:
             with excutils.save_and_reraise_exception():
                 self.release_resources()
 
+    @property
+    def ports(self):
+        """Ports belonging to the node, fetched on first access."""
+        if self._ports is None and self.node is not None:
+            self._ports = self._dbapi.get_ports_by_node_id(self.node.id)
+            _PORT_QUERY_STATS['loaded'] += 1
+        return self._ports
+
+    @ports.setter
+    def ports(self, ports):
+        self._ports = ports
+
     def spawn_after(self, _spawn_method, *args, **kwargs):
         """Call this to spawn a thread to complete the task."""
         self._spawn_method = _spawn_method
@@ -232,6 +275,8 @@ class TaskManager(object):
                 # squelch the exception if the node was deleted
                 # within the task's context.
                 pass
+        if self.node is not None and self._ports is None:
+            _PORT_QUERY_STATS['avoided'] += 1
         self.node = None
         self.driver = None
         self.ports = None
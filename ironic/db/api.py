@@ -57,8 +57,14 @@ class Connection(object):
                         'chassis_uuid': uuid of chassis
                         'driver': driver's name
                         'provision_state': provision state of node
+                        'provision_state_not_in': list of provision states
+                         the node must not be in
                         'provisioned_before': nodes with provision_updated_at
                          field before this interval in seconds
+                        'driver_hash_ranges': list of (driver, start, end)
+                         tuples; only nodes with one of these drivers
+                         whose uuid hash is in [start, end) are returned.
+                         See HashRing.get_hash_key_range.
         :param limit: Maximum number of nodes to return.
         :param marker: the last item of the previous page; we return the next
                        result set.
@@ -91,7 +97,7 @@ class Connection(object):
         """
 
     @abc.abstractmethod
-    def reserve_node(self, tag, node_id):
+    def reserve_node(self, tag, node_id, filters=None):
         """Reserve a node.
 
         To prevent other ManagerServices from manipulating the given
@@ -99,9 +105,15 @@ class Connection(object):
 
         :param tag: A string uniquely identifying the reservation holder.
         :param node_id: A node id or uuid.
+        :param filters: Filters the node must match to be reserved, checked
+                        in the same statement that takes the reservation.
+                        Accepts the same filters as get_nodeinfo_list.
+                        Defaults to None.
         :returns: A Node object.
         :raises: NodeNotFound if the node is not found.
         :raises: NodeLocked if the node is already reserved.
+        :raises: NodeConstraintsNotMet if the node does not match the
+                 filters.
         """
 
     @abc.abstractmethod
@@ -363,6 +375,19 @@ class Connection(object):
         :raises: ConductorNotFound
         """
 
+    @abc.abstractmethod
+    def get_active_conductor_registrations(self, interval=None):
+        """Retrieve the registrations of the active conductors.
+
+        This is much cheaper than get_active_driver_dict, and can be used to
+        detect changes in conductor membership. As a conductor registers
+        again when it restarts, a change of the drivers it supports also
+        changes its registration.
+
+        :param interval: Seconds since last check-in of a conductor.
+        :returns: A set of (hostname, created_at) tuples.
+        """
+
     @abc.abstractmethod
     def get_active_driver_dict(self, interval):
         """Retrieve drivers for the registered and active conductors.
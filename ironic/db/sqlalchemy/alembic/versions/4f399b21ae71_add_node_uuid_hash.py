@@ -0,0 +1,66 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Add node uuid_hash
+
+Revision ID: 4f399b21ae71
+Revises: 3bea56f25597
+Create Date: 2014-09-18 10:21:33.485320
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4f399b21ae71'
+down_revision = '3bea56f25597'
+
+import hashlib
+import struct
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import column
+from sqlalchemy.sql import table
+
+# number of nodes updated by each statement
+_BATCH_SIZE = 1000
+
+
+def _uuid_hash(uuid):
+    # NOTE: must stay in sync with ironic.common.hash_ring.get_hash_key
+    return struct.unpack_from('>I', hashlib.md5(uuid).digest())[0]
+
+
+def upgrade():
+    op.add_column('nodes', sa.Column('uuid_hash', sa.BigInteger(),
+                  nullable=True))
+    op.create_index('node_uuid_hash_idx', 'nodes', ['uuid_hash'])
+
+    nodes = table('nodes',
+                  column('id', sa.Integer),
+                  column('uuid', sa.String(36)),
+                  column('uuid_hash', sa.BigInteger))
+    connection = op.get_bind()
+    update = (nodes.update().
+              where(nodes.c.id == sa.bindparam('node_id')).
+              values(uuid_hash=sa.bindparam('node_uuid_hash')))
+    rows = connection.execute(sa.select([nodes.c.id,
+                                         nodes.c.uuid])).fetchall()
+    for i in range(0, len(rows), _BATCH_SIZE):
+        connection.execute(update, [{'node_id': node_id,
+                                     'node_uuid_hash': _uuid_hash(str(uuid))}
+                                    for node_id, uuid
+                                    in rows[i:i + _BATCH_SIZE]])
+
+
+def downgrade():
+    op.drop_index('node_uuid_hash_idx', 'nodes')
+    op.drop_column('nodes', 'uuid_hash')
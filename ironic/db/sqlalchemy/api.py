@@ -25,8 +25,10 @@ from oslo.db import options as db_options
 from oslo.db.sqlalchemy import session as db_session
 from oslo.db.sqlalchemy import utils as db_utils
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy import sql
 
 from ironic.common import exception
+from ironic.common import hash_ring
 from ironic.common import paths
 from ironic.common import states
 from ironic.common import utils
@@ -189,10 +191,24 @@ class Connection(api.Connection):
             query = query.filter_by(driver=filters['driver'])
         if 'provision_state' in filters:
             query = query.filter_by(provision_state=filters['provision_state'])
+        if 'provision_state_not_in' in filters:
+            # NOTE: NOT IN is NULL for the nodes in NOSTATE, which are not
+            # in any of the states either.
+            query = query.filter(sql.or_(
+                models.Node.provision_state == None,
+                ~models.Node.provision_state.in_(
+                    filters['provision_state_not_in'])))
         if 'provisioned_before' in filters:
             limit = timeutils.utcnow() - datetime.timedelta(
                                          seconds=filters['provisioned_before'])
             query = query.filter(models.Node.provision_updated_at < limit)
+        if 'driver_hash_ranges' in filters:
+            conditions = [
+                sql.and_(models.Node.driver == driver,
+                         models.Node.uuid_hash >= start,
+                         models.Node.uuid_hash < end)
+                for (driver, start, end) in filters['driver_hash_ranges']]
+            query = query.filter(sql.or_(sql.false(), *conditions))
 
         return query
 
@@ -219,21 +235,26 @@ class Connection(api.Connection):
                                sort_key, sort_dir, query)
 
     @objects.objectify(objects.Node)
-    def reserve_node(self, tag, node_id):
+    def reserve_node(self, tag, node_id, filters=None):
         session = get_session()
         with session.begin():
             query = model_query(models.Node, session=session)
             query = add_identity_filter(query, node_id)
             # be optimistic and assume we usually create a reservation
-            count = query.filter_by(reservation=None).update(
+            reserve_query = self._add_nodes_filters(
+                                query.filter_by(reservation=None), filters)
+            count = reserve_query.update(
                         {'reservation': tag}, synchronize_session=False)
             try:
                 node = query.one()
                 if count != 1:
-                    # Nothing updated and node exists. Must already be
-                    # locked.
-                    raise exception.NodeLocked(node=node_id,
-                                               host=node['reservation'])
+                    if node['reservation'] is not None:
+                        # Nothing updated and node exists. Must already be
+                        # locked.
+                        raise exception.NodeLocked(node=node_id,
+                                                   host=node['reservation'])
+                    # Not locked, so the node does not match the filters.
+                    raise exception.NodeConstraintsNotMet(node=node_id)
                 return node
             except NoResultFound:
                 raise exception.NodeNotFound(node_id)
@@ -261,6 +282,7 @@ class Connection(api.Connection):
         # ensure defaults are present for new nodes
         if not values.get('uuid'):
             values['uuid'] = utils.generate_uuid()
+        values['uuid_hash'] = hash_ring.get_hash_key(str(values['uuid']))
         if not values.get('power_state'):
             values['power_state'] = states.NOSTATE
         if not values.get('provision_state'):
@@ -564,6 +586,16 @@ class Connection(api.Connection):
             if count == 0:
                 raise exception.ConductorNotFound(conductor=hostname)
 
+    def get_active_conductor_registrations(self, interval=None):
+        if interval is None:
+            interval = CONF.conductor.heartbeat_timeout
+
+        limit = timeutils.utcnow() - datetime.timedelta(seconds=interval)
+        query = model_query(models.Conductor.hostname,
+                            models.Conductor.created_at).\
+                    filter(models.Conductor.updated_at >= limit)
+        return set(tuple(row) for row in query.all())
+
     def get_active_driver_dict(self, interval=None):
         if interval is None:
             interval = CONF.conductor.heartbeat_timeout
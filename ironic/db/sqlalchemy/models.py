@@ -23,7 +23,7 @@ import json
 from oslo.config import cfg
 from oslo.db.sqlalchemy import models
 import six.moves.urllib.parse as urlparse
-from sqlalchemy import Boolean, Column, DateTime
+from sqlalchemy import BigInteger, Boolean, Column, DateTime
 from sqlalchemy import ForeignKey, Integer
 from sqlalchemy import schema, String, Text
 from sqlalchemy.ext.declarative import declarative_base
@@ -135,9 +135,13 @@ class Node(Base):
     __table_args__ = (
         schema.UniqueConstraint('uuid', name='uniq_nodes0uuid'),
         schema.UniqueConstraint('instance_uuid',
-                                name='uniq_nodes0instance_uuid'))
+                                name='uniq_nodes0instance_uuid'),
+        schema.Index('node_uuid_hash_idx', 'uuid_hash'))
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36))
+    # NOTE: hash of the uuid used to map the node onto the hash rings, stored
+    #       so that conductors can select the nodes mapped to them in the DB.
+    uuid_hash = Column(BigInteger, nullable=True)
     # NOTE(deva): we store instance_uuid directly on the node so that we can
     #             filter on it more efficiently, even though it is
     #             user-settable, and would otherwise be in node.properties.
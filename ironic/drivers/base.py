@@ -239,6 +239,41 @@ class PowerInterface(object):
         :returns: a power state. One of :mod:`ironic.common.states`.
         """
 
+    def get_power_endpoint(self, driver_info):
+        """Return what answers for the power state of a node.
+
+        Nodes with the same driver and endpoint, e.g. the VMs of a
+        hypervisor or the servers of a chassis, may have their power states
+        queried together with :meth:`get_power_states`. This is called
+        before the nodes are locked, so it must not access the hardware.
+
+        :param driver_info: the 'driver_info' property of the node.
+        :returns: a hashable identifying the endpoint, or None if the power
+                  state of the node can only be queried on its own.
+        """
+        return None
+
+    def get_power_states(self, tasks):
+        """Return the power states of several nodes.
+
+        Drivers able to query the power states of all the nodes behind an
+        endpoint at once should override this, the default implementation
+        calls :meth:`get_power_state` for each node.
+
+        :param tasks: a list of TaskManager instances containing the nodes
+                      to act on, which share the same endpoint.
+        :returns: a list with, for each task, the power state of its node,
+                  one of :mod:`ironic.common.states`, or the exception
+                  raised getting it.
+        """
+        power_states = []
+        for task in tasks:
+            try:
+                power_states.append(self.get_power_state(task))
+            except Exception as e:
+                power_states.append(e)
+        return power_states
+
     @abc.abstractmethod
     def set_power_state(self, task, power_state):
         """Set the power state of the task's node.
@@ -465,10 +500,14 @@ class ManagementInterface(object):
         """
 
     @abc.abstractmethod
-    def get_sensors_data(self, task):
+    def get_sensors_data(self, task, sensor_types=None):
         """Get sensors data method.
 
         :param task: a TaskManager instance.
+        :param sensor_types: list of the sensor types the caller is
+                             interested in, None or a list containing 'All'
+                             for every type. Drivers may use it to skip
+                             unwanted sensors, but may also return more.
         :raises: FailedToGetSensorData when getting the sensor data fails.
         :raises: FailedToParseSensorData when parsing sensor data fails.
         :returns: returns a consistent format dict of sensor data grouped by
@@ -125,7 +125,8 @@ class AgentTFTPImageCache(image_cache.ImageCache):
             CONF.pxe.image_cache_size * 1024 * 1024,
             # min -> sec
             CONF.pxe.image_cache_ttl * 60,
-            image_service=image_service)
+            image_service=image_service,
+            eviction_policy=CONF.pxe.image_cache_eviction_policy)
 
 
 # copied from pxe driver - should be refactored per LP1350594
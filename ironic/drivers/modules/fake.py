@@ -183,5 +183,5 @@ class FakeManagement(base.ManagementInterface):
     def get_boot_device(self, task):
         return {'boot_device': boot_devices.PXE, 'persistent': False}
 
-    def get_sensors_data(self, task):
+    def get_sensors_data(self, task, sensor_types=None):
         return {}
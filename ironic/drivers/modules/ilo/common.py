@@ -16,6 +16,8 @@
 Common functionalities shared between different iLO modules.
 """
 
+import time
+
 from oslo.config import cfg
 
 from ironic.common import exception
@@ -57,6 +59,12 @@ OPTIONAL_PROPERTIES = {
 COMMON_PROPERTIES = REQUIRED_PROPERTIES.copy()
 COMMON_PROPERTIES.update(OPTIONAL_PROPERTIES)
 
+# node UUID -> (parsed driver_info, IloClient, time last used)
+_ILO_OBJECTS = {}
+
+# Seconds after which an unused IloClient is dropped from _ILO_OBJECTS
+_ILO_OBJECT_TTL = 600
+
 
 def parse_driver_info(node):
     """Gets the driver specific Node deployment info.
@@ -101,7 +109,9 @@ def get_ilo_object(node):
     """Gets an IloClient object from proliantutils library.
 
     Given an ironic node object, this method gives back a IloClient object
-    to do operations on the iLO.
+    to do operations on the iLO. The object is cached for the node and
+    reused until its driver_info changes, or it is not used for
+    _ILO_OBJECT_TTL seconds.
 
     :param node: an ironic node object.
     :returns: an IloClient object.
@@ -109,11 +119,22 @@ def get_ilo_object(node):
         is missing on the node or on invalid inputs.
     """
     driver_info = parse_driver_info(node)
-    ilo_object = ilo_client.IloClient(driver_info['ilo_address'],
-                                      driver_info['ilo_username'],
-                                      driver_info['ilo_password'],
-                                      driver_info['client_timeout'],
-                                      driver_info['client_port'])
+    now = time.time()
+    cached_info, ilo_object, used_at = _ILO_OBJECTS.get(node.uuid,
+                                                        (None, None, 0))
+    if (ilo_object is None or cached_info != driver_info or
+            now - used_at >= _ILO_OBJECT_TTL):
+        # NOTE: drop the objects of the nodes which are not managed by
+        # this conductor anymore, or were deleted, to bound the cache.
+        for uuid, entry in list(_ILO_OBJECTS.items()):
+            if now - entry[2] >= _ILO_OBJECT_TTL:
+                del _ILO_OBJECTS[uuid]
+        ilo_object = ilo_client.IloClient(driver_info['ilo_address'],
+                                          driver_info['ilo_username'],
+                                          driver_info['ilo_password'],
+                                          driver_info['client_timeout'],
+                                          driver_info['client_port'])
+    _ILO_OBJECTS[node.uuid] = (driver_info, ilo_object, now)
     return ilo_object
 
 
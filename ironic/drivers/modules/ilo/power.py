@@ -16,16 +16,17 @@
 iLO Power Driver
 """
 
+from eventlet import greenpool
 from oslo.config import cfg
 
 from ironic.common import exception
 from ironic.common import states
 from ironic.conductor import task_manager
 from ironic.drivers import base
+from ironic.drivers import utils as driver_utils
 from ironic.drivers.modules.ilo import common as ilo_common
 from ironic.openstack.common import importutils
 from ironic.openstack.common import log as logging
-from ironic.openstack.common import loopingcall
 
 ilo_client = importutils.try_import('proliantutils.ilo.ribcl')
 
@@ -38,6 +39,10 @@ opts = [
                default=2,
                help='Amount of time in seconds to wait in between power '
                     'operations'),
+    cfg.IntOpt('power_query_workers',
+               default=16,
+               help='Maximum number of iLOs queried at the same time for '
+                    'the power states of a batch of nodes.'),
 ]
 
 CONF = cfg.CONF
@@ -77,31 +82,51 @@ def _get_power_state(node):
         return states.ERROR
 
 
-def _wait_for_state_change(node, target_state):
-    """Wait for the power state change to get reflected."""
-    state = [None]
-    retries = [0]
+def _get_power_states(nodes):
+    """Returns the current power states of several nodes.
 
-    def _wait(state):
+    The iLOs of the nodes are queried concurrently, by up to
+    CONF.ilo.power_query_workers greenthreads.
 
-        state[0] = _get_power_state(node)
+    :param nodes: a list of nodes.
+    :returns: a list with the power state of each node, one of
+        :mod:`ironic.common.states`, or the exception raised getting it.
+    """
+    def _get_state(node):
+        try:
+            return _get_power_state(node)
+        except Exception as e:
+            return e
+
+    pool = greenpool.GreenPool(CONF.ilo.power_query_workers)
+    return list(pool.imap(_get_state, nodes))
 
-        # NOTE(rameshg87): For reboot operations, initially the state
-        # will be same as the final state. So defer the check for one retry.
-        if retries[0] != 0 and state[0] == target_state:
-            raise loopingcall.LoopingCallDone()
 
-        if retries[0] > CONF.ilo.power_retry:
-            state[0] = states.ERROR
-            raise loopingcall.LoopingCallDone()
+def _wait_for_state_change(node, target_state, reboot=False):
+    """Wait for the power state change to get reflected.
 
-        retries[0] += 1
+    :param node: an ironic node object.
+    :param target_state: the power state to wait for.
+    :param reboot: whether the node is being rebooted.
+    :returns: target_state, or states.ERROR if it was not reached within
+              CONF.ilo.power_wait * CONF.ilo.power_retry seconds.
+    """
+    checks = [0]
 
-    # Start a timer and wait for the operation to complete.
-    timer = loopingcall.FixedIntervalLoopingCall(_wait, state)
-    timer.start(interval=CONF.ilo.power_wait).wait()
+    def _get_state():
+        state = _get_power_state(node)
+        checks[0] += 1
+        # NOTE(rameshg87): For reboot operations, initially the state
+        # will be same as the final state. So defer the check for one retry.
+        if reboot and checks[0] == 1:
+            return None
+        return state
 
-    return state[0]
+    return driver_utils.wait_for_power_state(
+            _get_state, target_state,
+            CONF.ilo.power_wait * CONF.ilo.power_retry,
+            initial_interval=min(1, CONF.ilo.power_wait),
+            max_interval=CONF.ilo.power_wait)
 
 
 def _set_power_state(node, target_state):
@@ -124,7 +149,6 @@ def _set_power_state(node, target_state):
             ilo_object.set_host_power('ON')
         elif target_state == states.REBOOT:
             ilo_object.reset_server()
-            target_state = states.POWER_ON
         else:
             msg = _("_set_power_state called with invalid power state "
                 "'%s'") % target_state
@@ -140,7 +164,10 @@ def _set_power_state(node, target_state):
                                           error=ilo_exception)
 
     # Wait till the state change gets reflected.
-    state = _wait_for_state_change(node, target_state)
+    reboot = target_state == states.REBOOT
+    if reboot:
+        target_state = states.POWER_ON
+    state = _wait_for_state_change(node, target_state, reboot=reboot)
 
     if state != target_state:
         timeout = (CONF.ilo.power_wait) * (CONF.ilo.power_retry)
@@ -176,6 +203,27 @@ class IloPower(base.PowerInterface):
         """
         return _get_power_state(task.node)
 
+    def get_power_endpoint(self, driver_info):
+        """Return the same endpoint for all the nodes.
+
+        Each node has its own iLO, but get_power_states queries them
+        concurrently, so any iLO nodes may be batched together.
+
+        :param driver_info: the 'driver_info' property of the node.
+        :returns: 'ilo'.
+        """
+        return 'ilo'
+
+    def get_power_states(self, tasks):
+        """Gets the current power states of several nodes concurrently.
+
+        :param tasks: a list of TaskManager instances.
+        :returns: a list with the power state of each node, one of
+            :mod:`ironic.common.states` POWER_OFF, POWER_ON or ERROR, or
+            the exception raised getting it.
+        """
+        return _get_power_states([task.node for task in tasks])
+
     @task_manager.require_exclusive_lock
     def set_power_state(self, task, power_state):
         """Turn the current power state on or off.
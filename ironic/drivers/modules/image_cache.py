@@ -16,18 +16,47 @@
 # under the License.
 """
 Utility for caching master images.
+
+Every master image directory has an index, kept in memory and persisted to
+a file in the directory, recording the size, last use, link count and
+checksum of each master image. The index is reconciled with the directory
+once, when a conductor first uses the cache; from then on it is updated as
+images are downloaded, used and evicted, so that a clean up only looks at
+the images it considers evicting instead of listing and stat'ing the whole
+directory.
+
+Images older than the cache TTL are always evicted first. When the cache is
+still too large, an :class:`EvictionPolicy` chooses the next images to
+evict: the least recently used ones ('lru'), the least frequently used ones
+('lfu') or, with 'gdsf' (Greedy-Dual-Size-Frequency), the ones with the
+fewest uses per byte, ageing out images which were not used for a while.
+
+An image missing from the cache is downloaded once, however many nodes
+request it at the same time: the first request downloads it while the
+others wait for that download to finish. Downloads of different images run
+concurrently, up to [DEFAULT]max_concurrent_image_downloads at once (one at
+a time unless [DEFAULT]parallel_image_downloads is set).
 """
 
+import collections
+import contextlib
+import errno
+import heapq
 import os
+import stat as stat_module
+import sys
 import tempfile
 import time
 
+from eventlet import event
+from eventlet import semaphore
 from oslo.config import cfg
 
 from ironic.common.glance_service import service_utils
 from ironic.common import images
 from ironic.common import utils
 from ironic.openstack.common import fileutils
+from ironic.openstack.common import jsonutils
 from ironic.openstack.common import lockutils
 from ironic.openstack.common import log as logging
 
@@ -39,31 +68,343 @@ img_cache_opts = [
                 default=False,
                 help='Run image downloads and raw format conversions in '
                      'parallel.'),
+    cfg.IntOpt('max_concurrent_image_downloads',
+               default=8,
+               help='Maximum number of image downloads and raw format '
+                    'conversions running at the same time when '
+                    'parallel_image_downloads is set. Requests for an '
+                    'image being downloaded wait for that download instead '
+                    'of starting another one.'),
+    cfg.FloatOpt('image_cache_high_water_mark',
+                 default=1.0,
+                 help='Fraction of the cache size which the master images '
+                      'must exceed after a download for the cache to be '
+                      'cleaned up. Images older than the cache TTL are '
+                      'otherwise removed by the clean ups done when nodes '
+                      'are torn down.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(img_cache_opts)
 
+INDEX_FILE = '.index.json'
+
+# Minimum number of seconds between saves of an index for uses of images
+INDEX_SAVE_INTERVAL = 60
+
+# master directory -> _CacheIndex
+_INDEXES = {}
+
+# master image path -> Event sent when its download finishes
+_DOWNLOADS = {}
+
+# maximum number of concurrent downloads -> Semaphore
+_DOWNLOAD_SLOTS = {}
+
+
+def _get_download_slots():
+    limit = 1
+    if CONF.parallel_image_downloads:
+        limit = CONF.max_concurrent_image_downloads
+    slots = _DOWNLOAD_SLOTS.get(limit)
+    if slots is None:
+        slots = semaphore.Semaphore(limit)
+        _DOWNLOAD_SLOTS[limit] = slots
+    return slots
+
+
+class EvictionPolicy(object):
+    """Order in which the master images of a cache are evicted."""
+
+    def key(self, entry):
+        """Return the eviction key of an index entry, lowest goes first."""
+        raise NotImplementedError()
+
+    def order(self, index):
+        """Iterate over (name, entry) of an index, first to evict first."""
+        return index.ordered(self.__class__.__name__, self.key)
+
+    def evicted(self, index, entry):
+        """Called for every master image evicted from an index."""
+
+
+class LRUPolicy(EvictionPolicy):
+    """Evict the least recently used images first."""
+
+    def order(self, index):
+        return iter(index)
+
+
+class LFUPolicy(EvictionPolicy):
+    """Evict the least frequently used images first."""
+
+    def key(self, entry):
+        return entry['uses'], entry['last_used']
+
+
+class GDSFPolicy(EvictionPolicy):
+    """Evict the images with the lowest Greedy-Dual-Size-Frequency first.
+
+    The priority of an image is the index clock at its last use plus its
+    number of uses per byte. The clock is raised to the priority of every
+    evicted image, so images which are not used any more eventually go,
+    however small or popular they used to be.
+    """
+
+    def key(self, entry):
+        return entry['clock'] + float(entry['uses']) / max(entry['size'], 1)
+
+    def evicted(self, index, entry):
+        index.clock = max(index.clock, self.key(entry))
+
+
+EVICTION_POLICIES = {'lru': LRUPolicy,
+                     'lfu': LFUPolicy,
+                     'gdsf': GDSFPolicy}
+
+
+class _CacheIndex(object):
+    """Index of the master images in a cache directory.
+
+    Entries are dicts with the 'size', 'last_used' time, number of 'uses',
+    last known link count ('nlink'), 'checksum' (None if unknown) of a
+    master image and the value of the index 'clock' at its last use. The
+    index also keeps the cache statistics in 'stats'.
+
+    The index is saved when images are added or removed, but uses of images
+    are only saved every INDEX_SAVE_INTERVAL seconds: losing some of them
+    only makes eviction slightly less accurate, and the index is rebuilt
+    from the master directory if it is lost.
+    """
+
+    def __init__(self, master_dir):
+        self.master_dir = master_dir
+        self._path = os.path.join(master_dir, INDEX_FILE)
+        self._entries = {}
+        self.total_size = 0
+        self.clock = 0
+        self.stats = collections.defaultdict(int)
+        self._dirty = False
+        self._saved_at = 0
+        # order name -> (key function, heap of (key, name))
+        self._heaps = {}
+        self._load()
+
+    def _load(self):
+        saved = {}
+        try:
+            with open(self._path) as f:
+                data = jsonutils.loads(f.read())
+            saved = dict(data['entries'])
+            self.clock = data.get('clock', 0)
+        except (EnvironmentError, ValueError, KeyError, TypeError) as e:
+            # NOTE: the index may also have been removed or replaced since
+            # it was opened, it is then rebuilt from the directory.
+            if not isinstance(e, EnvironmentError) or e.errno != errno.ENOENT:
+                LOG.warn(_("Ignoring invalid master image cache index "
+                           "%(path)s: %(exc)s"), {'path': self._path,
+                                                  'exc': e})
+
+        for name in os.listdir(self.master_dir):
+            if name.startswith('.'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.master_dir, name))
+            except OSError:
+                # deleted since it was listed
+                continue
+            if not stat_module.S_ISREG(stat.st_mode):
+                continue
+            entry = saved.get(name)
+            if entry is None or entry.get('size') != stat.st_size:
+                # NOTE(dtantsur): Detect most recently accessed files,
+                # seeing atime can be disabled by the mount option
+                # Also include ctime as it changes when image is linked to
+                entry = {'last_used': max(stat.st_mtime, stat.st_atime,
+                                          stat.st_ctime),
+                         'checksum': None}
+            entry.setdefault('uses', 1)
+            entry.setdefault('clock', self.clock)
+            entry['size'] = stat.st_size
+            entry['nlink'] = stat.st_nlink
+            self._entries[name] = entry
+            self.total_size += entry['size']
+
+        if set(saved) != set(self._entries):
+            self.save()
+
+    def save(self):
+        """Persist the index to its file in the master directory."""
+        data = jsonutils.dumps({'clock': self.clock,
+                                'entries': list(self._entries.items())})
+        fd, tmp_path = tempfile.mkstemp(prefix=INDEX_FILE,
+                                        dir=self.master_dir)
+        self._saved_at = time.time()
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.rename(tmp_path, self._path)
+            self._dirty = False
+        except EnvironmentError as exc:
+            utils.unlink_without_raise(tmp_path)
+            LOG.warn(_("Unable to save master image cache index %(path)s: "
+                       "%(exc)s"), {'path': self._path, 'exc': exc})
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        """Iterate over (name, entry), least recently used first."""
+        return self.ordered('lru', _last_used)
+
+    def ordered(self, order, key):
+        """Iterate over (name, entry), lowest key(entry) first.
+
+        The order is kept in a heap, built on the first call for an order
+        name and then updated as images are added and used, so getting the
+        first k entries costs O(k log n) rather than sorting the whole
+        index. Entries which were removed or used since they were pushed
+        are skipped when popped. The entries yielded are pushed back once
+        the iteration ends or is closed.
+
+        :param order: a name for the order, identifying its heap.
+        :param key: a callable returning the key of an entry.
+        """
+        if order not in self._heaps:
+            heap = [(key(entry), name)
+                    for name, entry in self._entries.items()]
+            heapq.heapify(heap)
+            self._heaps[order] = (key, heap)
+        heap = self._heaps[order][1]
+        popped = []
+        seen = set()
+        try:
+            while heap:
+                item = heapq.heappop(heap)
+                entry = self._entries.get(item[1])
+                if (entry is None or key(entry) != item[0] or
+                        item[1] in seen):
+                    continue
+                seen.add(item[1])
+                popped.append(item)
+                yield item[1], entry
+        finally:
+            for item in popped:
+                heapq.heappush(heap, item)
+
+    def _push(self, name, entry):
+        """Update the orders of the index for a new or used entry."""
+        for order, (key, heap) in list(self._heaps.items()):
+            if len(heap) > 2 * len(self._entries) + 16:
+                # Too many stale items, rebuild it on next use.
+                del self._heaps[order]
+                continue
+            heapq.heappush(heap, (key(entry), name))
+
+    def get(self, name):
+        return self._entries.get(name)
+
+    def add(self, name, size, nlink=1, checksum=None):
+        """Record a new master image as just used."""
+        old = self._entries.get(name)
+        if old is not None:
+            self.total_size -= old['size']
+        entry = {'size': size, 'last_used': time.time(), 'uses': 1,
+                 'nlink': nlink, 'checksum': checksum, 'clock': self.clock}
+        self._entries[name] = entry
+        self._push(name, entry)
+        self.total_size += size
+        self.save()
+
+    def touch(self, name):
+        """Record a use of a master image, which was just linked to."""
+        entry = self._entries.get(name)
+        if entry is None:
+            stat = os.stat(os.path.join(self.master_dir, name))
+            self.add(name, stat.st_size, stat.st_nlink)
+            return
+        entry['last_used'] = time.time()
+        entry['uses'] += 1
+        entry['nlink'] += 1
+        entry['clock'] = self.clock
+        self._push(name, entry)
+        self._dirty = True
+        if time.time() - self._saved_at >= INDEX_SAVE_INTERVAL:
+            self.save()
+
+    def remove(self, names):
+        """Drop master images from the index.
+
+        Also saves the uses of images recorded since the last save.
+        """
+        for name in names:
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                self.total_size -= entry['size']
+                self._dirty = True
+        if self._dirty:
+            self.save()
+
+
+def _last_used(entry):
+    return entry['last_used']
+
+
+def _get_index(master_dir):
+    index = _INDEXES.get(master_dir)
+    if index is None:
+        index = _CacheIndex(master_dir)
+        _INDEXES[master_dir] = index
+    return index
+
 
 class ImageCache(object):
     """Class handling access to cache for master images."""
 
     def __init__(self, master_dir, cache_size, cache_ttl,
-                 image_service=None):
+                 image_service=None, eviction_policy='lru'):
         """Constructor.
 
         :param master_dir: cache directory to work on
         :param cache_size: desired maximum cache size in bytes
         :param cache_ttl: cache entity TTL in seconds
         :param image_service: Glance image service to use, None for default
+        :param eviction_policy: name of the policy choosing the images to
+                                evict when the cache is too large, one of
+                                EVICTION_POLICIES
         """
         self.master_dir = master_dir
         self._cache_size = cache_size
         self._cache_ttl = cache_ttl
         self._image_service = image_service
+        self._policy = EVICTION_POLICIES[eviction_policy]()
         if master_dir is not None:
             fileutils.ensure_tree(master_dir)
 
+    def _get_index(self):
+        return _get_index(self.master_dir)
+
+    def get_stats(self):
+        """Return the cache statistics.
+
+        :returns: a dict with, since the conductor started, the number of
+                  cache 'hits', 'misses' and 'evictions', the number of
+                  'downloads' and the time (in seconds) spent downloading
+                  ('download_time'), the number of requests which waited
+                  for another request's download ('waits') and the time
+                  spent waiting for downloads or for a free download slot
+                  ('wait_time'); and the number ('images') and total
+                  'size' of the cached master images.
+        """
+        if self.master_dir is None:
+            return {}
+        index = self._get_index()
+        stats = dict((key, index.stats[key])
+                     for key in ('hits', 'misses', 'evictions', 'downloads',
+                                 'download_time', 'waits', 'wait_time'))
+        stats.update(images=len(index), size=index.total_size)
+        return stats
+
     def fetch_image(self, uuid, dest_path, ctx=None):
         """Fetch image with given uuid to the destination path.
 
@@ -75,14 +416,9 @@ class ImageCache(object):
         :param dest_path: destination file path
         :param ctx: context
         """
-        img_download_lock_name = 'download-image'
         if self.master_dir is None:
             #NOTE(ghe): We don't share images between instances/hosts
-            if not CONF.parallel_image_downloads:
-                with lockutils.lock(img_download_lock_name, 'ironic-'):
-                    images.fetch_to_raw(ctx, uuid, dest_path,
-                                        self._image_service)
-            else:
+            with _get_download_slots():
                 images.fetch_to_raw(ctx, uuid, dest_path,
                                     self._image_service)
             return
@@ -91,40 +427,78 @@ class ImageCache(object):
 
         master_file_name = service_utils.parse_image_ref(uuid)[0]
         master_path = os.path.join(self.master_dir, master_file_name)
+        index = self._get_index()
 
-        if CONF.parallel_image_downloads:
-            img_download_lock_name = 'download-image:%s' % master_file_name
-
-        # TODO(dtantsur): lock expiration time
-        with lockutils.lock(img_download_lock_name, 'ironic-'):
-            if os.path.exists(dest_path):
-                LOG.debug("Destination %(dest)s already exists for "
-                            "image %(uuid)s" %
-                          {'uuid': uuid,
-                           'dest': dest_path})
-                return
+        if os.path.exists(dest_path):
+            LOG.debug("Destination %(dest)s already exists for "
+                        "image %(uuid)s" %
+                      {'uuid': uuid,
+                       'dest': dest_path})
+            return
 
+        while True:
             try:
                 # NOTE(dtantsur): ensure we're not in the middle of clean up
                 with lockutils.lock('master_image', 'ironic-'):
                     os.link(master_path, dest_path)
+                    index.touch(master_file_name)
             except OSError:
-                LOG.info(_("Master cache miss for image %(uuid)s, "
-                           "starting download") %
-                         {'uuid': uuid})
+                pass
             else:
                 LOG.debug("Master cache hit for image %(uuid)s",
                           {'uuid': uuid})
+                index.stats['hits'] += 1
                 return
 
-            self._download_image(uuid, master_path, dest_path, ctx=ctx)
+            download = _DOWNLOADS.get(master_path)
+            if download is None:
+                break
+            # NOTE: another request is downloading this image, it is in
+            # the cache once that download is done
+            LOG.debug("Waiting for the download of image %(uuid)s",
+                      {'uuid': uuid})
+            started = time.time()
+            try:
+                download.wait()
+            finally:
+                index.stats['waits'] += 1
+                index.stats['wait_time'] += time.time() - started
+
+        LOG.info(_("Master cache miss for image %(uuid)s, "
+                   "starting download") %
+                 {'uuid': uuid})
+        index.stats['misses'] += 1
+        download = event.Event()
+        _DOWNLOADS[master_path] = download
+        try:
+            started = time.time()
+            with _get_download_slots():
+                index.stats['wait_time'] += time.time() - started
+                started = time.time()
+                self._download_image(uuid, master_path, dest_path, ctx=ctx)
+            elapsed = time.time() - started
+            index.stats['downloads'] += 1
+            index.stats['download_time'] += elapsed
+            LOG.debug("Downloaded image %(uuid)s in %(time).2f seconds",
+                      {'uuid': uuid, 'time': elapsed})
+        except Exception:
+            download.send_exception(*sys.exc_info())
+            raise
+        else:
+            download.send()
+        finally:
+            del _DOWNLOADS[master_path]
 
-        # NOTE(dtantsur): we increased cache size - time to clean up
-        self.clean_up()
+        # NOTE(dtantsur): we increased cache size - time to clean up,
+        # if it has grown past the high-water mark
+        high_water = self._cache_size * CONF.image_cache_high_water_mark
+        if index.total_size > high_water:
+            self.clean_up()
 
     def _download_image(self, uuid, master_path, dest_path, ctx=None):
         """Download image from Glance and store at a given path.
-        This method should be called with uuid-specific lock taken.
+        This method should be called by the only request downloading
+        the image.
 
         :param uuid: image UUID or href to fetch
         :param master_path: destination master path
@@ -136,12 +510,15 @@ class ImageCache(object):
         tmp_dir = tempfile.mkdtemp(dir=self.master_dir)
         tmp_path = os.path.join(tmp_dir, uuid)
         try:
-            images.fetch_to_raw(ctx, uuid, tmp_path,
-                                self._image_service)
+            checksum = images.fetch_to_raw(ctx, uuid, tmp_path,
+                                           self._image_service)
             # NOTE(dtantsur): no need for global lock here - master_path
             # will have link count >1 at any moment, so won't be cleaned up
             os.link(tmp_path, master_path)
             os.link(master_path, dest_path)
+            self._get_index().add(os.path.basename(master_path),
+                                  os.path.getsize(master_path), nlink=2,
+                                  checksum=checksum)
         finally:
             utils.rmtree_without_raise(tmp_dir)
 
@@ -149,9 +526,12 @@ class ImageCache(object):
     def clean_up(self, amount=None):
         """Clean up directory with images, keeping cache of the latest images.
 
-        Files with link count >1 are never deleted.
+        Drops the images older than TTL, then the images chosen by the
+        eviction policy until the cache fits its size. Files with link
+        count >1 are never deleted.
         Protected by global lock, so that no one messes with master images
-        after we get listing and before we actually delete files.
+        after we choose the files to delete and before we actually delete
+        them.
 
         :param amount: if present, amount of space to reclaim in bytes,
                        cleaning will stop, if this goal was reached,
@@ -164,107 +544,96 @@ class ImageCache(object):
                   {'dir': self.master_dir})
 
         amount_copy = amount
-        listing = _find_candidates_for_deletion(self.master_dir)
-        survived, amount = self._clean_up_too_old(listing, amount)
-        if amount is not None and amount <= 0:
-            return
-        amount = self._clean_up_ensure_cache_size(survived, amount)
-        if amount is not None and amount > 0:
-            LOG.warn(_("Cache clean up was unable to reclaim %(required)d MiB "
-                       "of disk space, still %(left)d MiB required"),
-                     {'required': amount_copy / 1024 / 1024,
-                      'left': amount / 1024 / 1024})
-
-    def _clean_up_too_old(self, listing, amount):
-        """Clean up stage 1: drop images that are older than TTL.
-
-        This method removes files all files older than TTL seconds
-        unless 'amount' is non-None. If 'amount' is non-None,
-        it starts removing files older than TTL seconds,
-        oldest first, until the required 'amount' of space is reclaimed.
-
-        :param listing: list of tuples (file name, last used time)
-        :param amount: if not None, amount of space to reclaim in bytes,
-                       cleaning will stop, if this goal was reached,
-                       even if it is possible to clean up more files
-        :returns: tuple (list of files left after clean up,
-                         amount still to reclaim)
-        """
-        threshold = time.time() - self._cache_ttl
-        survived = []
-        for file_name, last_used, stat in listing:
-            if last_used < threshold:
-                try:
-                    os.unlink(file_name)
-                except EnvironmentError as exc:
-                    LOG.warn(_("Unable to delete file %(name)s from "
-                               "master image cache: %(exc)s") %
-                             {'name': file_name, 'exc': exc})
-                else:
-                    if amount is not None:
-                        amount -= stat.st_size
-                        if amount <= 0:
-                            amount = 0
-                            break
-            else:
-                survived.append((file_name, last_used, stat))
-        return survived, amount
-
-    def _clean_up_ensure_cache_size(self, listing, amount):
-        """Clean up stage 2: try to ensure cache size < threshold.
-        Try to delete the oldest files until conditions is satisfied
-        or no more files are eligable for delition.
-
-        :param listing: list of tuples (file name, last used time)
-        :param amount: amount of space to reclaim, if possible.
-                       if amount is not None, it has higher priority than
-                       cache size in settings
-        :returns: amount of space still required after clean up
-        """
-        # NOTE(dtantsur): Sort listing to delete the oldest files first
-        listing = sorted(listing,
-                         key=lambda entry: entry[1],
-                         reverse=True)
-        total_listing = (os.path.join(self.master_dir, f)
-                         for f in os.listdir(self.master_dir))
-        total_size = sum(os.path.getsize(f)
-                         for f in total_listing)
-        while listing and (total_size > self._cache_size or
-               (amount is not None and amount > 0)):
-            file_name, last_used, stat = listing.pop()
+        index = self._get_index()
+        victims, missing = self._find_victims(index, amount)
+        deleted = []
+        for name, size in victims:
             try:
-                os.unlink(file_name)
+                os.unlink(os.path.join(self.master_dir, name))
             except EnvironmentError as exc:
                 LOG.warn(_("Unable to delete file %(name)s from "
                            "master image cache: %(exc)s") %
-                         {'name': file_name, 'exc': exc})
+                         {'name': name, 'exc': exc})
             else:
-                total_size -= stat.st_size
+                deleted.append(name)
+                self._policy.evicted(index, index.get(name))
                 if amount is not None:
-                    amount -= stat.st_size
+                    amount -= size
+        index.stats['evictions'] += len(deleted)
+        if deleted or missing:
+            index.remove(deleted + missing)
 
-        if total_size > self._cache_size:
+        if amount is not None and amount > 0:
+            LOG.warn(_("Cache clean up was unable to reclaim %(required)d MiB "
+                       "of disk space, still %(left)d MiB required"),
+                     {'required': amount_copy / 1024 / 1024,
+                      'left': amount / 1024 / 1024})
+        elif amount is None and index.total_size > self._cache_size:
             LOG.info(_("After cleaning up cache dir %(dir)s "
                        "cache size %(actual)d is still larger than "
                        "threshold %(expected)d") %
-                     {'dir': self.master_dir, 'actual': total_size,
+                     {'dir': self.master_dir, 'actual': index.total_size,
                       'expected': self._cache_size})
-        return max(amount, 0)
 
+    def _candidates(self, index, threshold):
+        """Iterate over the images older than threshold, then all images.
 
-def _find_candidates_for_deletion(master_dir):
-    """Find files eligible for deletion i.e. with link count ==1.
-
-    :param master_dir: directory to operate on
-    :returns: iterator yielding tuples (file name, last used time, stat)
-    """
-    for filename in os.listdir(master_dir):
-        filename = os.path.join(master_dir, filename)
-        stat = os.stat(filename)
-        if not os.path.isfile(filename) or stat.st_nlink > 1:
-            continue
-        # NOTE(dtantsur): Detect most recently accessed files,
-        # seeing atime can be disabled by the mount option
-        # Also include ctime as it changes when image is linked to
-        last_used_time = max(stat.st_mtime, stat.st_atime, stat.st_ctime)
-        yield filename, last_used_time, stat
+        The expired images come least recently used first, then all the
+        images in the order of the eviction policy. Each order is closed
+        once done with, or when this generator is, giving back the images
+        which were not evicted to the index.
+        """
+        with contextlib.closing(iter(index)) as lru:
+            for name, entry in lru:
+                if entry['last_used'] >= threshold:
+                    break
+                yield name, entry
+        with contextlib.closing(self._policy.order(index)) as order:
+            for item in order:
+                yield item
+
+    def _find_victims(self, index, amount):
+        """Choose the master images to delete.
+
+        Images older than TTL are chosen first, least recently used first,
+        then the images in the order of the eviction policy. Images are
+        chosen, if 'amount' is None, while they are older than TTL or the
+        cache is larger than its size, otherwise until 'amount' bytes are
+        reclaimed. Only the images looked at are stat'ed, to skip those
+        with link count >1.
+
+        :param index: the _CacheIndex of the cache
+        :param amount: if not None, amount of space to reclaim in bytes
+        :returns: tuple (list of tuples (file name, size) to delete,
+                         list of indexed file names which no longer exist)
+        """
+        threshold = time.time() - self._cache_ttl
+        total_size = index.total_size
+        victims = []
+        missing = []
+        seen = set()
+        with contextlib.closing(self._candidates(index, threshold)) as names:
+            for name, entry in names:
+                if name in seen:
+                    continue
+                seen.add(name)
+                if amount is None:
+                    if (entry['last_used'] >= threshold and
+                            total_size <= self._cache_size):
+                        break
+                elif amount <= 0:
+                    break
+                try:
+                    stat = os.stat(os.path.join(self.master_dir, name))
+                except OSError:
+                    missing.append(name)
+                    total_size -= entry['size']
+                    continue
+                entry['nlink'] = stat.st_nlink
+                if stat.st_nlink > 1:
+                    continue
+                victims.append((name, entry['size']))
+                total_size -= entry['size']
+                if amount is not None:
+                    amount -= entry['size']
+        return victims, missing
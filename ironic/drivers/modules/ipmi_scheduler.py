@@ -0,0 +1,185 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Scheduling of the commands sent to BMCs.
+
+Some BMCs misbehave when they receive commands too often, so at least
+[ipmi]min_command_interval seconds are kept between the end of a command
+and the start of the next one to the same BMC. :class:`Scheduler` queues
+the commands for each BMC address in arrival order and spaces them out,
+while commands to different BMCs never wait for each other. It also:
+
+* lets a command share the result of an identical one which is already
+  queued or running, e.g. concurrent power status queries;
+* if [ipmi]adaptive_command_interval is set, widens the interval of a BMC
+  whose commands fail and keeps it above the observed command latency,
+  narrowing it back to min_command_interval as the BMC recovers;
+* keeps per-BMC queue depth and wait time statistics.
+"""
+
+import collections
+import sys
+import time
+
+from eventlet import event
+from eventlet import semaphore
+from oslo.config import cfg
+import six
+
+opts = [
+    cfg.BoolOpt('adaptive_command_interval',
+                default=False,
+                help='Adapt the interval between the IPMI operations sent '
+                     'to a server to how it responds: double it, up to '
+                     'retry_timeout, after a failed operation and keep it '
+                     'above the average operation time. It never goes '
+                     'below min_command_interval.'),
+    ]
+
+# NOTE: retry_timeout and min_command_interval are registered by
+# ironic.drivers.modules.ipminative, which imports this module, so they
+# cannot be imported here with import_opt.
+CONF = cfg.CONF
+CONF.register_opts(opts, group='ipmi')
+
+# Weight of the latest command in the average command latency.
+LATENCY_WEIGHT = 0.2
+
+
+class _BMC(object):
+    """Scheduling state of one BMC."""
+
+    def __init__(self):
+        self.lock = semaphore.Semaphore()
+        # earliest time at which the next command may start
+        self.next_time = 0
+        self.interval = None
+        self.latency = None
+        self.waiting = 0
+        self.in_flight = {}
+        self.stats = collections.defaultdict(int)
+
+
+class Scheduler(object):
+    """Queues and spaces out the commands sent to each BMC."""
+
+    def __init__(self):
+        self._bmcs = {}
+
+    def reset(self):
+        """Forget all the BMCs."""
+        self._bmcs = {}
+
+    def execute(self, address, func, coalesce_key=None):
+        """Run a command for a BMC once it is its turn.
+
+        :param address: the address of the BMC.
+        :param func: a callable without arguments sending the command.
+        :param coalesce_key: if not None, a hashable identifying a command
+                             without side effects. A command with the same
+                             key queued or running for the BMC is waited
+                             for instead, and its result or exception is
+                             shared.
+        :returns: what func returns.
+        """
+        bmc = self._bmcs.setdefault(address, _BMC())
+        if coalesce_key is None:
+            return self._run(bmc, func)
+
+        pending = bmc.in_flight.get(coalesce_key)
+        if pending is not None:
+            bmc.stats['coalesced'] += 1
+            return pending.wait()
+
+        pending = event.Event()
+        bmc.in_flight[coalesce_key] = pending
+        try:
+            result = self._run(bmc, func)
+        except Exception:
+            exc_info = sys.exc_info()
+            del bmc.in_flight[coalesce_key]
+            pending.send_exception(*exc_info)
+            six.reraise(*exc_info)
+        del bmc.in_flight[coalesce_key]
+        pending.send(result)
+        return result
+
+    def _run(self, bmc, func):
+        queued_at = time.time()
+        bmc.waiting += 1
+        try:
+            bmc.lock.acquire()
+        finally:
+            bmc.waiting -= 1
+
+        try:
+            time_till_next_command = bmc.next_time - time.time()
+            if time_till_next_command > 0:
+                time.sleep(time_till_next_command)
+            started_at = time.time()
+            bmc.stats['commands'] += 1
+            bmc.stats['wait_time'] += started_at - queued_at
+            try:
+                result = func()
+            except Exception:
+                bmc.stats['failures'] += 1
+                self._adapt(bmc, time.time() - started_at, failed=True)
+                raise
+            self._adapt(bmc, time.time() - started_at, failed=False)
+            return result
+        finally:
+            bmc.next_time = time.time() + self._get_interval(bmc)
+            bmc.lock.release()
+
+    def _get_interval(self, bmc):
+        if bmc.interval is None or not CONF.ipmi.adaptive_command_interval:
+            return CONF.ipmi.min_command_interval
+        return bmc.interval
+
+    def _adapt(self, bmc, duration, failed):
+        if bmc.latency is None:
+            bmc.latency = duration
+        else:
+            bmc.latency += LATENCY_WEIGHT * (duration - bmc.latency)
+
+        minimum = CONF.ipmi.min_command_interval
+        interval = max(bmc.interval or 0, minimum)
+        if failed:
+            interval = min(max(interval * 2, 1), CONF.ipmi.retry_timeout)
+        else:
+            interval = interval / 2.0
+        bmc.interval = max(interval, bmc.latency, minimum)
+
+    def get_stats(self):
+        """Return the scheduling statistics of every BMC.
+
+        :returns: a dict mapping each BMC address to a dict with the
+                  number of commands waiting for their turn
+                  ('queue_depth'), of commands run ('commands'), failed
+                  ('failures') and answered by an identical command
+                  ('coalesced'), the total time commands waited for their
+                  turn in seconds ('wait_time') and the current interval
+                  between commands ('interval').
+        """
+        return dict((address, {'queue_depth': bmc.waiting,
+                               'commands': bmc.stats['commands'],
+                               'failures': bmc.stats['failures'],
+                               'coalesced': bmc.stats['coalesced'],
+                               'wait_time': bmc.stats['wait_time'],
+                               'interval': self._get_interval(bmc)})
+                    for address, bmc in self._bmcs.items())
+
+
+SCHEDULER = Scheduler()
@@ -27,6 +27,7 @@ from ironic.common import i18n
 from ironic.common import states
 from ironic.conductor import task_manager
 from ironic.drivers import base
+from ironic.drivers.modules import ipmi_scheduler
 from ironic.openstack.common import importutils
 from ironic.openstack.common import log as logging
 
@@ -92,6 +93,28 @@ def _parse_driver_info(node):
     return bmc_info
 
 
+def _ipmi_call(driver_info, method, *args, **kwargs):
+    """Call a pyghmi command on the node's BMC when it is its turn.
+
+    :param driver_info: the bmc access info for a node.
+    :param method: the name of the pyghmi Command method to call.
+    :returns: what the method returns.
+    :raises: IpmiException from pyghmi.
+    """
+    def _call():
+        ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
+                                       userid=driver_info['username'],
+                                       password=driver_info['password'])
+        return getattr(ipmicmd, method)(*args, **kwargs)
+
+    coalesce_key = None
+    if method == 'get_power':
+        coalesce_key = (driver_info['username'], driver_info['password'],
+                        method)
+    return ipmi_scheduler.SCHEDULER.execute(driver_info['address'], _call,
+                                            coalesce_key=coalesce_key)
+
+
 def _power_on(driver_info):
     """Turn the power on for this node.
 
@@ -105,11 +128,8 @@ def _power_on(driver_info):
     msg = _("IPMI power on failed for node %(node_id)s with the "
             "following error: %(error)s")
     try:
-        ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                           userid=driver_info['username'],
-                           password=driver_info['password'])
-        wait = CONF.ipmi.retry_timeout
-        ret = ipmicmd.set_power('on', wait)
+        ret = _ipmi_call(driver_info, 'set_power', 'on',
+                         CONF.ipmi.retry_timeout)
     except pyghmi_exception.IpmiException as e:
         LOG.warning(msg % {'node_id': driver_info['uuid'], 'error': str(e)})
         raise exception.IPMIFailure(cmd=str(e))
@@ -135,11 +155,8 @@ def _power_off(driver_info):
     msg = _("IPMI power off failed for node %(node_id)s with the "
             "following error: %(error)s")
     try:
-        ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                           userid=driver_info['username'],
-                           password=driver_info['password'])
-        wait = CONF.ipmi.retry_timeout
-        ret = ipmicmd.set_power('off', wait)
+        ret = _ipmi_call(driver_info, 'set_power', 'off',
+                         CONF.ipmi.retry_timeout)
     except pyghmi_exception.IpmiException as e:
         LOG.warning(msg % {'node_id': driver_info['uuid'], 'error': str(e)})
         raise exception.IPMIFailure(cmd=str(e))
@@ -167,11 +184,8 @@ def _reboot(driver_info):
     msg = _("IPMI power reboot failed for node %(node_id)s with the "
             "following error: %(error)s")
     try:
-        ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                           userid=driver_info['username'],
-                           password=driver_info['password'])
-        wait = CONF.ipmi.retry_timeout
-        ret = ipmicmd.set_power('boot', wait)
+        ret = _ipmi_call(driver_info, 'set_power', 'boot',
+                         CONF.ipmi.retry_timeout)
     except pyghmi_exception.IpmiException as e:
         LOG.warning(msg % {'node_id': driver_info['uuid'], 'error': str(e)})
         raise exception.IPMIFailure(cmd=str(e))
@@ -194,10 +208,7 @@ def _power_status(driver_info):
     """
 
     try:
-        ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                           userid=driver_info['username'],
-                           password=driver_info['password'])
-        ret = ipmicmd.get_power()
+        ret = _ipmi_call(driver_info, 'get_power')
     except pyghmi_exception.IpmiException as e:
         LOG.warning(_("IPMI get power state failed for node %(node_id)s "
                       "with the following error: %(error)s")
@@ -336,11 +347,8 @@ class NativeIPMIManagement(base.ManagementInterface):
                 "Invalid boot device %s specified.") % device)
         driver_info = _parse_driver_info(task.node)
         try:
-            ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                               userid=driver_info['username'],
-                               password=driver_info['password'])
             bootdev = _BOOT_DEVICES_MAP[device]
-            ipmicmd.set_bootdev(bootdev, persist=persistent)
+            _ipmi_call(driver_info, 'set_bootdev', bootdev, persist=persistent)
         except pyghmi_exception.IpmiException as e:
             LOG.error(_LE("IPMI set boot device failed for node %(node_id)s "
                           "with the following error: %(error)s"),
@@ -367,10 +375,7 @@ class NativeIPMIManagement(base.ManagementInterface):
         driver_info = _parse_driver_info(task.node)
         response = {'boot_device': None, 'persistent': None}
         try:
-            ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                               userid=driver_info['username'],
-                               password=driver_info['password'])
-            ret = ipmicmd.get_bootdev()
+            ret = _ipmi_call(driver_info, 'get_bootdev')
             # FIXME(lucasagomes): pyghmi doesn't seem to handle errors
             # consistently, for some errors it raises an exception
             # others it just returns a dictionary with the error.
@@ -389,12 +394,13 @@ class NativeIPMIManagement(base.ManagementInterface):
                                             if hdev == bootdev), None)
         return response
 
-    def get_sensors_data(self, task):
+    def get_sensors_data(self, task, sensor_types=None):
         """Get sensors data.
 
         Not implemented by this driver.
 
         :param task: a TaskManager instance.
+        :param sensor_types: list of the sensor types to get.
 
         """
         raise NotImplementedError()
@@ -34,7 +34,6 @@ import os
 import re
 import stat
 import tempfile
-import time
 
 from oslo.config import cfg
 
@@ -45,10 +44,12 @@ from ironic.common import states
 from ironic.common import utils
 from ironic.conductor import task_manager
 from ironic.drivers import base
+from ironic.drivers import utils as driver_utils
 from ironic.drivers.modules import console_utils
+from ironic.drivers.modules import ipmi_scheduler
+from ironic.drivers.modules import ipmitool_shell
 from ironic.openstack.common import excutils
 from ironic.openstack.common import log as logging
-from ironic.openstack.common import loopingcall
 from ironic.openstack.common import processutils
 
 
@@ -82,8 +83,8 @@ CONSOLE_PROPERTIES = {
                             "console access.")
 }
 
-LAST_CMD_TIME = {}
 TIMING_SUPPORT = None
+SHELL_SESSIONS = ipmitool_shell.ShellSessionPool()
 
 
 def _is_timing_supported(is_supported=None):
@@ -199,17 +200,12 @@ def _parse_driver_info(node):
            }
 
 
-def _exec_ipmitool(driver_info, command):
-    """Execute the ipmitool command.
-
-    This uses the lanplus interface to communicate with the BMC device driver.
+def _get_ipmitool_args(driver_info, pw_file):
+    """Return the ipmitool command line to reach a node's BMC.
 
     :param driver_info: the ipmitool parameters for accessing a node.
-    :param command: the ipmitool command to be executed.
-    :returns: (stdout, stderr) from executing the command.
-    :raises: some Exception from making the password file or from executing
-        the command.
-
+    :param pw_file: the path of a file containing the BMC password.
+    :returns: a list of arguments, without the ipmitool command to run.
     """
     args = ['ipmitool',
             '-I',
@@ -233,44 +229,75 @@ def _exec_ipmitool(driver_info, command):
         args.append('-N')
         args.append(str(CONF.ipmi.min_command_interval))
 
+    args.append('-f')
+    args.append(pw_file)
+    return args
+
+
+@contextlib.contextmanager
+def _get_ipmitool_shell_args(driver_info):
+    """Yield the command line to start an 'ipmitool shell' for a node.
+
+    The password file only exists within the context.
+    """
     # 'ipmitool' command will prompt password if there is no '-f' option,
     # we set it to '\0' to write a password file to support empty password
     with _make_password_file(driver_info['password'] or '\0') as pw_file:
-        args.append('-f')
-        args.append(pw_file)
-        args.extend(command.split(" "))
-        # NOTE(deva): ensure that no communications are sent to a BMC more
-        #             often than once every min_command_interval seconds.
-        time_till_next_poll = CONF.ipmi.min_command_interval - (
-                time.time() - LAST_CMD_TIME.get(driver_info['address'], 0))
-        if time_till_next_poll > 0:
-            time.sleep(time_till_next_poll)
-        try:
-            out, err = utils.execute(*args)
-        finally:
-            LAST_CMD_TIME[driver_info['address']] = time.time()
-        return out, err
+        yield _get_ipmitool_args(driver_info, pw_file) + ['shell']
+
 
+def _exec_ipmitool(driver_info, command):
+    """Execute the ipmitool command.
 
-def _sleep_time(iter):
-    """Return the time-to-sleep for the n'th iteration of a retry loop.
-    This implementation increases exponentially.
+    This uses the lanplus interface to communicate with the BMC device driver.
+    If CONF.ipmi.use_shell_sessions is set, the command is sent to a shared
+    'ipmitool shell' session for the BMC instead of a new ipmitool process.
 
-    :param iter: iteration number
-    :returns: number of seconds to sleep
+    :param driver_info: the ipmitool parameters for accessing a node.
+    :param command: the ipmitool command to be executed.
+    :returns: (stdout, stderr) from executing the command.
+    :raises: some Exception from making the password file or from executing
+        the command.
 
     """
-    if iter <= 1:
-        return 1
-    return iter ** 2
+    # NOTE(deva): ensure that no communications are sent to a BMC more
+    #             often than once every min_command_interval seconds.
+    #             Concurrent identical power status queries share a single
+    #             ipmitool run.
+    if command == 'power status':
+        coalesce_key = (driver_info['username'], driver_info['password'],
+                        driver_info.get('priv_level'), command)
+    else:
+        coalesce_key = None
+
+    if CONF.ipmi.use_shell_sessions:
+        key = (driver_info['address'], driver_info['username'],
+               driver_info['password'], driver_info.get('priv_level'))
+        return ipmi_scheduler.SCHEDULER.execute(
+                driver_info['address'],
+                lambda: SHELL_SESSIONS.execute(
+                    key, command,
+                    lambda: _get_ipmitool_shell_args(driver_info)),
+                coalesce_key=coalesce_key)
+
+    def _run():
+        # 'ipmitool' command will prompt password if there is no '-f'
+        # option, we set it to '\0' to write a password file to support
+        # empty password
+        with _make_password_file(driver_info['password'] or '\0') as pw_file:
+            args = _get_ipmitool_args(driver_info, pw_file)
+            args.extend(command.split(" "))
+            return utils.execute(*args)
+
+    return ipmi_scheduler.SCHEDULER.execute(driver_info['address'], _run,
+                                            coalesce_key=coalesce_key)
 
 
 def _set_and_wait(target_state, driver_info):
-    """Helper function for DynamicLoopingCall.
+    """Change the power state and wait for the node to reach it.
 
-    This method changes the power state and polls the BMCuntil the desired
-    power state is reached, or CONF.ipmi.retry_timeout would be exceeded by the
-    next iteration.
+    This method changes the power state and polls the BMC until the desired
+    power state is reached, or CONF.ipmi.retry_timeout is exceeded.
 
     This method assumes the caller knows the current power state and does not
     check it prior to changing the power state. Most BMCs should be fine, but
@@ -280,7 +307,6 @@ def _set_and_wait(target_state, driver_info):
     :param target_state: desired power state
     :param driver_info: the ipmitool parameters for accessing a node.
     :returns: one of ironic.common.states
-    :raises: IPMIFailure on an error from ipmitool (from _power_status call).
 
     """
     if target_state == states.POWER_ON:
@@ -288,43 +314,33 @@ def _set_and_wait(target_state, driver_info):
     elif target_state == states.POWER_OFF:
         state_name = "off"
 
-    def _wait(mutable):
+    try:
+        _exec_ipmitool(driver_info, "power %s" % state_name)
+    except Exception:
+        # Log failures but keep checking, the BMC may have acted anyway
+        LOG.warning(_("IPMI power %(state)s failed for node %(node)s."),
+                     {'state': state_name, 'node': driver_info['uuid']})
+
+    def _get_state():
         try:
-            # Only issue power change command once
-            if mutable['iter'] < 0:
-                _exec_ipmitool(driver_info, "power %s" % state_name)
-            else:
-                mutable['power'] = _power_status(driver_info)
+            return _power_status(driver_info)
         except Exception:
             # Log failures but keep trying
-            LOG.warning(_("IPMI power %(state)s failed for node %(node)s."),
-                         {'state': state_name, 'node': driver_info['uuid']})
-        finally:
-            mutable['iter'] += 1
-
-        if mutable['power'] == target_state:
-            raise loopingcall.LoopingCallDone()
-
-        sleep_time = _sleep_time(mutable['iter'])
-        if (sleep_time + mutable['total_time']) > CONF.ipmi.retry_timeout:
-            # Stop if the next loop would exceed maximum retry_timeout
-            LOG.error(_('IPMI power %(state)s timed out after '
-                        '%(tries)s retries on node %(node_id)s.'),
-                        {'state': state_name, 'tries': mutable['iter'],
-                        'node_id': driver_info['uuid']})
-            mutable['power'] = states.ERROR
-            raise loopingcall.LoopingCallDone()
-        else:
-            mutable['total_time'] += sleep_time
-            return sleep_time
-
-    # Use mutable objects so the looped method can change them.
-    # Start 'iter' from -1 so that the first two checks are one second apart.
-    status = {'power': None, 'iter': -1, 'total_time': 0}
-
-    timer = loopingcall.DynamicLoopingCall(_wait, status)
-    timer.start().wait()
-    return status['power']
+            LOG.warning(_("IPMI power status failed for node %(node)s."),
+                         {'node': driver_info['uuid']})
+
+    # NOTE: the checks cannot be more frequent than min_command_interval
+    #       anyway, the scheduler would hold them back.
+    state = driver_utils.wait_for_power_state(
+            _get_state, target_state, CONF.ipmi.retry_timeout,
+            max_interval=max(CONF.ipmi.min_command_interval, 1))
+    if state != target_state:
+        LOG.error(_('IPMI power %(state)s timed out after '
+                    '%(timeout)s seconds on node %(node_id)s.'),
+                    {'state': state_name,
+                     'timeout': CONF.ipmi.retry_timeout,
+                     'node_id': driver_info['uuid']})
+    return state
 
 
 def _power_on(driver_info):
@@ -374,12 +390,42 @@ def _power_status(driver_info):
         return states.ERROR
 
 
+# Have only three sensor type name IDs: 'Sensor Type (Analog)'
+# 'Sensor Type (Discrete)' and 'Sensor Type (Threshold)'
+SENSOR_TYPE_KEYS = ('Sensor Type (Analog)', 'Sensor Type (Discrete)',
+                    'Sensor Type (Threshold)')
+SENSOR_TYPE_RE = re.compile(r'^\s*Sensor Type \((?:Analog|Discrete|Threshold)'
+                            r'\)\s*:\s*(\S+)', re.MULTILINE)
+
+
+def _get_sensor_type(node, sensor_data_dict):
+    for key in SENSOR_TYPE_KEYS:
+        try:
+            return sensor_data_dict[key].split(' ', 1)[0]
+        except KeyError:
+            continue
+
+    raise exception.FailedToParseSensorData(
+        node=node.uuid,
+        error=(_("parse ipmi sensor data failed, unknown sensor type"
+            " data: %(sensors_data)s"), {'sensors_data': sensor_data_dict}))
+
+
+def _iter_sdr_records(sensors_data):
+    """Yield the blank line separated records of 'sdr -v' output."""
+    start = 0
+    while True:
+        end = sensors_data.find('\n\n', start)
+        if end == -1:
+            yield sensors_data[start:]
+            return
+        yield sensors_data[start:end]
+        start = end + 2
+
+
 def _process_sensor(sensor_data):
-    sensor_data_fields = sensor_data.split('\n')
     sensor_data_dict = {}
-    for field in sensor_data_fields:
-        if not field:
-            continue
+    for field in sensor_data.split('\n'):
         kv_value = field.split(':')
         if len(kv_value) != 2:
             continue
@@ -388,24 +434,44 @@ def _process_sensor(sensor_data):
     return sensor_data_dict
 
 
-def _get_sensor_type(node, sensor_data_dict):
-    # Have only three sensor type name IDs: 'Sensor Type (Analog)'
-    # 'Sensor Type (Discrete)' and 'Sensor Type (Threshold)'
+def _iter_ipmi_sensors(node, sensors_data, sensor_types=None):
+    """Parse 'ipmitool sdr -v' output one record at a time.
 
-    for key in ('Sensor Type (Analog)', 'Sensor Type (Discrete)',
-                'Sensor Type (Threshold)'):
-        try:
-            return sensor_data_dict[key].split(' ', 1)[0]
-        except KeyError:
+    The sensor type and the presence of a reading are looked up in the raw
+    record text, so records which would be dropped are never split into a
+    dict.
+
+    :param sensors_data: the sensor data returned by ipmitool command.
+    :param sensor_types: set of lower-case sensor types to return, or None
+                         for all of them.
+    :returns: a generator of (sensor type, sensor data dict) tuples for the
+              sensors which have a 'Sensor Reading'.
+    :raises: FailedToParseSensorData if a record has no sensor type.
+
+    """
+    for sensor_data in _iter_sdr_records(sensors_data):
+        has_reading = 'Sensor Reading' in sensor_data
+        if sensor_types is not None or not has_reading:
+            match = SENSOR_TYPE_RE.search(sensor_data)
+            # records without a sensor type go on to fail parsing below
+            if match:
+                if (sensor_types is not None and
+                        match.group(1).lower() not in sensor_types):
+                    continue
+                # ignore the sensors which has no current 'Sensor Reading'
+                if not has_reading:
+                    continue
+
+        sensor_data_dict = _process_sensor(sensor_data)
+        if not sensor_data_dict:
             continue
 
-    raise exception.FailedToParseSensorData(
-        node=node.uuid,
-        error=(_("parse ipmi sensor data failed, unknown sensor type"
-            " data: %(sensors_data)s"), {'sensors_data': sensor_data_dict}))
+        sensor_type = _get_sensor_type(node, sensor_data_dict)
+        if 'Sensor Reading' in sensor_data_dict:
+            yield sensor_type, sensor_data_dict
 
 
-def _parse_ipmi_sensors_data(node, sensors_data):
+def _parse_ipmi_sensors_data(node, sensors_data, sensor_types=None):
     """Parse the IPMI sensors data and format to the dict grouping by type.
 
     We run 'ipmitool' command with 'sdr -v' options, which can return sensor
@@ -414,6 +480,8 @@ def _parse_ipmi_sensors_data(node, sensors_data):
     out via notification bus and consumed by Ceilometer Collector.
 
     :param sensors_data: the sensor data returned by ipmitool command.
+    :param sensor_types: list of the sensor types to return; None or a list
+                         containing 'ALL' returns every type.
     :returns: the sensor data with JSON format, grouped by sensor type.
     :raises: FailedToParseSensorData when error encountered during parsing.
 
@@ -422,21 +490,20 @@ def _parse_ipmi_sensors_data(node, sensors_data):
     if not sensors_data:
         return sensors_data_dict
 
-    sensors_data_array = sensors_data.split('\n\n')
-    for sensor_data in sensors_data_array:
-        sensor_data_dict = _process_sensor(sensor_data)
-        if not sensor_data_dict:
-            continue
-
-        sensor_type = _get_sensor_type(node, sensor_data_dict)
+    if sensor_types is not None:
+        sensor_types = set(t.lower() for t in sensor_types)
+        if 'all' in sensor_types:
+            sensor_types = None
 
-        # ignore the sensors which has no current 'Sensor Reading' data
-        if 'Sensor Reading' in sensor_data_dict:
-            sensors_data_dict.setdefault(sensor_type,
-                {})[sensor_data_dict['Sensor ID']] = sensor_data_dict
+    found = False
+    for sensor_type, sensor_data_dict in _iter_ipmi_sensors(
+            node, sensors_data, sensor_types):
+        found = True
+        sensors_data_dict.setdefault(sensor_type,
+            {})[sensor_data_dict['Sensor ID']] = sensor_data_dict
 
     # get nothing, no valid sensor data
-    if not sensors_data_dict:
+    if not found and sensor_types is None:
         raise exception.FailedToParseSensorData(
             node=node.uuid,
             error=(_("parse ipmi sensor data failed, get nothing with input"
@@ -648,10 +715,12 @@ class IPMIManagement(base.ManagementInterface):
         response['persistent'] = 'Options apply to all future boots' in out
         return response
 
-    def get_sensors_data(self, task):
+    def get_sensors_data(self, task, sensor_types=None):
         """Get sensors data.
 
         :param task: a TaskManager instance.
+        :param sensor_types: list of the sensor types to get, None or a
+                             list containing 'All' for every type.
         :raises: FailedToGetSensorData when getting the sensor data fails.
         :raises: FailedToParseSensorData when parsing sensor data fails.
         :raises: InvalidParameterValue if required ipmi parameters are missing
@@ -668,7 +737,7 @@ class IPMIManagement(base.ManagementInterface):
             raise exception.FailedToGetSensorData(node=task.node.uuid,
                                                   error=str(pee))
 
-        return _parse_ipmi_sensors_data(task.node, out)
+        return _parse_ipmi_sensors_data(task.node, out, sensor_types)
 
 
 class VendorPassthru(base.VendorInterface):
@@ -832,9 +901,12 @@ class IPMIShellinaboxConsole(base.ConsoleInterface):
         if CONF.debug:
             ipmi_cmd += " -v"
         ipmi_cmd += " sol activate"
-        console_utils.start_shellinabox_console(driver_info['uuid'],
-                                                driver_info['port'],
-                                                ipmi_cmd)
+        # shellinabox starts the SOL session right away, so it has to wait
+        # for its turn like any other command sent to the BMC.
+        ipmi_scheduler.SCHEDULER.execute(
+                driver_info['address'],
+                lambda: console_utils.start_shellinabox_console(
+                    driver_info['uuid'], driver_info['port'], ipmi_cmd))
 
     def stop_console(self, task):
         """Stop the remote console session for the node."""
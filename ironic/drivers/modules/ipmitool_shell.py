@@ -0,0 +1,237 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Long-lived 'ipmitool shell' sessions.
+
+Running ipmitool once per command means forking a process and going through
+a full RMCP+ session handshake with the BMC every time. A
+:class:`ShellSession` keeps one 'ipmitool shell' process per BMC and feeds
+it commands on stdin, so consecutive commands reuse the authenticated
+session. Sessions are kept in a :class:`ShellSessionPool` and closed once
+they have been idle for [ipmi]shell_session_idle_timeout seconds.
+"""
+
+import collections
+import errno
+import fcntl
+import os
+import time
+
+import eventlet
+from eventlet.green import os as green_os
+from eventlet.green import subprocess
+from eventlet import semaphore
+from oslo.config import cfg
+
+from ironic.common import i18n
+from ironic.openstack.common import log as logging
+from ironic.openstack.common import processutils
+
+opts = [
+    cfg.BoolOpt('use_shell_sessions',
+                default=False,
+                help='Send ipmitool commands through a long-lived '
+                     '"ipmitool shell" process per BMC, reusing its '
+                     'session, instead of running ipmitool for every '
+                     'command.'),
+    cfg.IntOpt('shell_session_idle_timeout',
+               default=60,
+               help='Time (in seconds) after which an idle ipmitool shell '
+                    'session is closed.'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(opts, group='ipmi')
+CONF.import_opt('retry_timeout',
+                'ironic.drivers.modules.ipminative',
+                group='ipmi')
+
+LOG = logging.getLogger(__name__)
+
+_LW = i18n._LW
+
+PROMPT = 'ipmitool> '
+
+
+def _set_nonblocking(f):
+    flags = fcntl.fcntl(f.fileno(), fcntl.F_GETFL)
+    fcntl.fcntl(f.fileno(), fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+class ShellSession(object):
+    """An 'ipmitool shell' process talking to one BMC."""
+
+    def __init__(self, args):
+        """Start the shell and wait for its first prompt.
+
+        :param args: the ipmitool command line, ending with 'shell'.
+        :raises: ProcessExecutionError if the shell fails to start.
+        """
+        self.args = args
+        self.last_used = time.time()
+        self.process = subprocess.Popen(args,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE,
+                                        close_fds=True)
+        _set_nonblocking(self.process.stdout)
+        _set_nonblocking(self.process.stderr)
+        try:
+            self._read_until_prompt(' '.join(args))
+            err = self._read_stderr()
+        except Exception:
+            self.close()
+            raise
+        if err:
+            # NOTE: the shell is running, as it printed its prompt; errors
+            # talking to the BMC show up on the commands themselves.
+            LOG.warning(_LW('ipmitool shell %(args)s started with '
+                            'warnings: %(err)s'),
+                        {'args': ' '.join(args), 'err': err})
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def _read_until_prompt(self, command):
+        output = ''
+        with eventlet.Timeout(2 * CONF.ipmi.retry_timeout, False):
+            while not output.endswith(PROMPT):
+                chunk = green_os.read(self.process.stdout.fileno(), 4096)
+                if not chunk:
+                    raise processutils.ProcessExecutionError(
+                            stdout=output, cmd=command,
+                            description='ipmitool shell exited')
+                output += chunk
+            return output[:-len(PROMPT)]
+        raise processutils.ProcessExecutionError(
+                stdout=output, cmd=command,
+                description='Timed out waiting for ipmitool shell')
+
+    def _read_stderr(self):
+        # ipmitool writes any error before printing the next prompt, so by
+        # now it is already in the pipe.
+        err = ''
+        while True:
+            try:
+                chunk = os.read(self.process.stderr.fileno(), 4096)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return err
+                raise
+            if not chunk:
+                return err
+            err += chunk
+
+    def execute(self, command):
+        """Run a command in the shell.
+
+        :param command: the ipmitool command, e.g. 'power status'.
+        The shell does not report the exit status of commands, and ipmitool
+        writes harmless warnings to stderr, so a command only fails if it
+        printed nothing but errors.
+
+        :returns: (stdout, stderr) of the command.
+        :raises: ProcessExecutionError if the command wrote to stderr and
+                 nothing to stdout, or if the shell died or timed out; the
+                 session is then closed in the latter case.
+        """
+        try:
+            self.process.stdin.write(command + '\n')
+            self.process.stdin.flush()
+            out = self._read_until_prompt(command)
+            err = self._read_stderr()
+        except Exception:
+            self.close()
+            raise
+        finally:
+            self.last_used = time.time()
+
+        # Drop the echo of the command, if the shell echoes its input.
+        echo = command + '\n'
+        if out.startswith(echo):
+            out = out[len(echo):]
+        if err:
+            if not out.strip():
+                raise processutils.ProcessExecutionError(stdout=out,
+                                                         stderr=err,
+                                                         cmd=command)
+            LOG.warning(_LW('ipmitool command "%(cmd)s" wrote to stderr: '
+                            '%(err)s'), {'cmd': command, 'err': err})
+        return out, err
+
+    def close(self):
+        """Stop the shell process."""
+        try:
+            self.process.stdin.close()
+            if self.alive:
+                self.process.terminate()
+            self.process.wait()
+        except Exception as e:
+            LOG.warning(_LW('Failed to stop ipmitool shell %(args)s: '
+                            '%(error)s'),
+                        {'args': ' '.join(self.args), 'error': e})
+
+
+class ShellSessionPool(object):
+    """Shell sessions keyed by BMC credentials.
+
+    Commands to the same key are serialized on a single session; commands
+    to different keys run concurrently.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._locks = collections.defaultdict(semaphore.Semaphore)
+
+    def execute(self, key, command, get_args):
+        """Run a command on the session for key, starting it if needed.
+
+        :param key: a hashable identifying the BMC and its credentials.
+        :param command: the ipmitool command to run.
+        :param get_args: a callable returning a context manager which
+                         yields the ipmitool command line to start a shell
+                         with. It is only called if a new session is
+                         needed, and the shell has read its arguments by
+                         the time the context exits.
+        :returns: (stdout, stderr) of the command.
+        :raises: ProcessExecutionError
+        """
+        self.evict_idle()
+        with self._locks[key]:
+            session = self._sessions.get(key)
+            if session is None or not session.alive:
+                with get_args() as args:
+                    session = ShellSession(args)
+                self._sessions[key] = session
+            try:
+                return session.execute(command)
+            except processutils.ProcessExecutionError:
+                if not session.alive:
+                    self._sessions.pop(key, None)
+                raise
+
+    def evict_idle(self):
+        """Close the sessions idle for longer than the idle timeout."""
+        limit = time.time() - CONF.ipmi.shell_session_idle_timeout
+        for key, session in list(self._sessions.items()):
+            if session.last_used < limit and not self._locks[key].locked():
+                del self._sessions[key]
+                session.close()
+
+    def close_all(self):
+        """Close every session."""
+        for key in list(self._sessions):
+            self._sessions.pop(key).close()
@@ -84,6 +84,14 @@ pxe_opts = [
                default=10080,
                help='Maximum TTL (in minutes) for old master images in '
                'cache.'),
+    cfg.StrOpt('image_cache_eviction_policy',
+               default='lru',
+               choices=['lru', 'lfu', 'gdsf'],
+               help='Order in which master images are evicted once the '
+               'images older than the TTL are gone and the cache is still '
+               'too large: least recently used first (lru), least '
+               'frequently used first (lfu) or fewest uses per byte first, '
+               'ageing out images unused for a while (gdsf).'),
     ]
 
 LOG = logging.getLogger(__name__)
@@ -260,7 +268,8 @@ class PXEImageCache(image_cache.ImageCache):
             cache_size=CONF.pxe.image_cache_size * 1024 * 1024,
             # min -> sec
             cache_ttl=CONF.pxe.image_cache_ttl * 60,
-            image_service=image_service)
+            image_service=image_service,
+            eviction_policy=CONF.pxe.image_cache_eviction_policy)
 
 
 class TFTPImageCache(PXEImageCache):
@@ -19,6 +19,9 @@ python-seamicroclient.
 Provides vendor passthru methods for SeaMicro specific functionality.
 """
 
+import time
+
+from eventlet import semaphore
 from oslo.config import cfg
 
 from ironic.common import boot_devices
@@ -27,9 +30,9 @@ from ironic.common import i18n
 from ironic.common import states
 from ironic.conductor import task_manager
 from ironic.drivers import base
+from ironic.drivers import utils as driver_utils
 from ironic.openstack.common import importutils
 from ironic.openstack.common import log as logging
-from ironic.openstack.common import loopingcall
 
 seamicroclient = importutils.try_import('seamicroclient')
 if seamicroclient:
@@ -42,7 +45,14 @@ opts = [
                help='Maximum retries for SeaMicro operations'),
     cfg.IntOpt('action_timeout',
                default=10,
-               help='Seconds to wait for power action to be completed')
+               help='Seconds to wait for power action to be completed'),
+    cfg.IntOpt('server_list_ttl',
+               default=10,
+               help='Time (in seconds) for which the list of the servers '
+                    'of a chassis, with their power states, is reused once '
+                    'retrieved. It is retrieved again after a power action '
+                    'on one of the servers. Set to 0 to retrieve it every '
+                    'time.'),
 ]
 
 _LE = i18n._LE
@@ -75,20 +85,58 @@ OPTIONAL_PROPERTIES = {
 COMMON_PROPERTIES = REQUIRED_PROPERTIES.copy()
 COMMON_PROPERTIES.update(OPTIONAL_PROPERTIES)
 
+# (api_endpoint, username, api_version) -> (password, client)
+_CLIENTS = {}
+_CLIENTS_LOCK = semaphore.Semaphore()
+
+# (api_endpoint, username, api_version) -> (time listed, {server id: server})
+_SERVER_LISTS = {}
+
 
 def _get_client(*args, **kwargs):
     """Creates the python-seamicro_client
 
+    Clients are cached per API endpoint, username and API version and
+    shared by all the greenthreads, so the authentication token of a client
+    is reused until it expires.
+
     :param kwargs: A dict of keyword arguments to be passed to the method,
                    which should contain: 'username', 'password',
                    'auth_url', 'api_version' parameters.
     :returns: SeaMicro API client.
     """
 
-    cl_kwargs = {'username': kwargs['username'],
-                 'password': kwargs['password'],
-                 'auth_url': kwargs['api_endpoint']}
-    return seamicro_client.Client(kwargs['api_version'], **cl_kwargs)
+    key = _get_client_key(kwargs)
+    with _CLIENTS_LOCK:
+        password, s_client = _CLIENTS.get(key, (None, None))
+        if s_client is None or password != kwargs['password']:
+            cl_kwargs = {'username': kwargs['username'],
+                         'password': kwargs['password'],
+                         'auth_url': kwargs['api_endpoint']}
+            s_client = seamicro_client.Client(kwargs['api_version'],
+                                              **cl_kwargs)
+            _CLIENTS[key] = (kwargs['password'], s_client)
+    return s_client
+
+
+def _get_client_key(driver_info):
+    return (driver_info['api_endpoint'], driver_info['username'],
+            driver_info['api_version'])
+
+
+def _call_client(driver_info, method):
+    """Call a SeaMicro API client method, authenticating again if needed.
+
+    :param driver_info: SeaMicro driver info.
+    :param method: a callable taking the SeaMicro API client.
+    :returns: what method returns.
+    """
+    try:
+        return method(_get_client(**driver_info))
+    except seamicro_client_exception.Unauthorized:
+        # The token of the cached client expired, log in again
+        _CLIENTS.pop(_get_client_key(driver_info), None)
+        return method(_get_client(**driver_info))
 
 
 def _parse_driver_info(node):
@@ -125,15 +173,32 @@ def _parse_driver_info(node):
 def _get_server(driver_info):
     """Get server from server_id."""
 
-    s_client = _get_client(**driver_info)
-    return s_client.servers.get(driver_info['server_id'])
+    return _call_client(driver_info, lambda s_client:
+                        s_client.servers.get(driver_info['server_id']))
+
+
+def _server_action(driver_info, action):
+    """Get a callable sending a power action to the server of a node.
+
+    The server is fetched again along with each action, so that both are
+    retried with a new token if the token of the cached client expired.
+
+    :param driver_info: SeaMicro driver info.
+    :param action: the name of the server method, e.g. 'power_on'.
+    :returns: a callable taking no arguments.
+    """
+
+    def _action():
+        return _call_client(driver_info, lambda s_client: getattr(
+            s_client.servers.get(driver_info['server_id']), action)())
+    return _action
 
 
 def _get_volume(driver_info, volume_id):
     """Get volume from volume_id."""
 
-    s_client = _get_client(**driver_info)
-    return s_client.volumes.get(volume_id)
+    return _call_client(driver_info,
+                        lambda s_client: s_client.volumes.get(volume_id))
 
 
 def _get_power_status(node):
@@ -149,12 +214,7 @@ def _get_power_status(node):
     seamicro_info = _parse_driver_info(node)
     try:
         server = _get_server(seamicro_info)
-        if not hasattr(server, 'active') or server.active is None:
-            return states.ERROR
-        if not server.active:
-            return states.POWER_OFF
-        elif server.active:
-            return states.POWER_ON
+        return _get_server_power_state(server)
 
     except seamicro_client_exception.NotFound:
         raise exception.NodeNotFound(node=node.uuid)
@@ -164,6 +224,103 @@ def _get_power_status(node):
         raise exception.ServiceUnavailable(message=ex.message)
 
 
+def _get_server_power_state(server):
+    if not hasattr(server, 'active') or server.active is None:
+        return states.ERROR
+    if not server.active:
+        return states.POWER_OFF
+    return states.POWER_ON
+
+
+def _list_servers(driver_info):
+    """List the servers of a chassis, reusing a recent list.
+
+    :param driver_info: SeaMicro driver info.
+    :returns: a dict mapping server IDs to servers.
+    """
+    key = _get_client_key(driver_info)
+    listed_at, servers = _SERVER_LISTS.get(key, (0, None))
+    if servers is None or (time.time() - listed_at >=
+                           CONF.seamicro.server_list_ttl):
+        servers = _call_client(driver_info,
+                               lambda s_client: s_client.servers.list())
+        servers = dict((server.id, server) for server in servers)
+        _SERVER_LISTS[key] = (time.time(), servers)
+    return servers
+
+
+def _get_power_states(nodes):
+    """Get current power states of nodes of the same chassis
+
+    All the servers of the chassis are listed with a single request.
+
+    :param nodes: a list of Ironic nodes sharing the same API endpoint
+        and credentials.
+    :raises: InvalidParameterValue if required seamicro parameters are
+        missing.
+    :raises: ServiceUnavailable on an error from SeaMicro Client.
+    :returns: a list with the power state of each node, or the exception
+        for it, e.g. NodeNotFound if its server is not in the chassis.
+    """
+    seamicro_info = _parse_driver_info(nodes[0])
+    try:
+        servers = _list_servers(seamicro_info)
+    except seamicro_client_exception.ClientException as ex:
+        LOG.error(_("SeaMicro client exception %(msg)s for node %(uuid)s"),
+                  {'msg': ex.message, 'uuid': nodes[0].uuid})
+        raise exception.ServiceUnavailable(message=ex.message)
+
+    power_states = []
+    for node in nodes:
+        try:
+            server = servers.get(_parse_driver_info(node)['server_id'])
+        except exception.InvalidParameterValue as e:
+            power_states.append(e)
+            continue
+        if server is None:
+            power_states.append(exception.NodeNotFound(node=node.uuid))
+        else:
+            power_states.append(_get_server_power_state(server))
+    return power_states
+
+
+def _wait_for_power_state(node, target_state, action, timeout):
+    """Wait for a node to reach a power state, repeating the action.
+
+    The action is repeated every timeout seconds while the node has not
+    reached the target state, at most CONF.seamicro.max_retry times.
+
+    :param node: Ironic node one of :class:`ironic.db.models.Node`
+    :param target_state: the power state to wait for.
+    :param action: a callable sending the power action again.
+    :param timeout: Time in seconds to wait for each action to complete.
+    :returns: target_state, or states.ERROR if the node did not reach it.
+    """
+    # the power state of the server in the list of the chassis is outdated
+    _SERVER_LISTS.pop(_get_client_key(_parse_driver_info(node)), None)
+    retries = [0]
+    last_action = [time.time()]
+
+    def _get_state():
+        state = _get_power_status(node)
+        if (state != target_state
+                and time.time() - last_action[0] >= timeout
+                and retries[0] < CONF.seamicro.max_retry):
+            retries[0] += 1
+            last_action[0] = time.time()
+            try:
+                action()
+            except seamicro_client_exception.ClientException:
+                LOG.warning(_("Power action failed for node %s."),
+                            node.uuid)
+        return state
+
+    return driver_utils.wait_for_power_state(
+            _get_state, target_state,
+            timeout * (CONF.seamicro.max_retry + 1),
+            initial_interval=min(1, timeout), max_interval=timeout)
+
+
 def _power_on(node, timeout=None):
     """Power ON this node
 
@@ -175,32 +332,16 @@ def _power_on(node, timeout=None):
     """
     if timeout is None:
         timeout = CONF.seamicro.action_timeout
-    state = [None]
-    retries = [0]
-    seamicro_info = _parse_driver_info(node)
-    server = _get_server(seamicro_info)
+    if _get_power_status(node) == states.POWER_ON:
+        return states.POWER_ON
 
-    def _wait_for_power_on(state, retries):
-        """Called at an interval until the node is powered on."""
-
-        state[0] = _get_power_status(node)
-        if state[0] == states.POWER_ON:
-            raise loopingcall.LoopingCallDone()
-
-        if retries[0] > CONF.seamicro.max_retry:
-            state[0] = states.ERROR
-            raise loopingcall.LoopingCallDone()
-        try:
-            retries[0] += 1
-            server.power_on()
-        except seamicro_client_exception.ClientException:
-            LOG.warning(_("Power-on failed for node %s."),
-                        node.uuid)
-
-    timer = loopingcall.FixedIntervalLoopingCall(_wait_for_power_on,
-                                                 state, retries)
-    timer.start(interval=timeout).wait()
-    return state[0]
+    power_on = _server_action(_parse_driver_info(node), 'power_on')
+    try:
+        power_on()
+    except seamicro_client_exception.ClientException:
+        LOG.warning(_("Power-on failed for node %s."),
+                    node.uuid)
+    return _wait_for_power_state(node, states.POWER_ON, power_on, timeout)
 
 
 def _power_off(node, timeout=None):
@@ -214,32 +355,16 @@ def _power_off(node, timeout=None):
     """
     if timeout is None:
         timeout = CONF.seamicro.action_timeout
-    state = [None]
-    retries = [0]
-    seamicro_info = _parse_driver_info(node)
-    server = _get_server(seamicro_info)
-
-    def _wait_for_power_off(state, retries):
-        """Called at an interval until the node is powered off."""
-
-        state[0] = _get_power_status(node)
-        if state[0] == states.POWER_OFF:
-            raise loopingcall.LoopingCallDone()
+    if _get_power_status(node) == states.POWER_OFF:
+        return states.POWER_OFF
 
-        if retries[0] > CONF.seamicro.max_retry:
-            state[0] = states.ERROR
-            raise loopingcall.LoopingCallDone()
-        try:
-            retries[0] += 1
-            server.power_off()
-        except seamicro_client_exception.ClientException:
-            LOG.warning(_("Power-off failed for node %s."),
-                        node.uuid)
-
-    timer = loopingcall.FixedIntervalLoopingCall(_wait_for_power_off,
-                                                 state, retries)
-    timer.start(interval=timeout).wait()
-    return state[0]
+    power_off = _server_action(_parse_driver_info(node), 'power_off')
+    try:
+        power_off()
+    except seamicro_client_exception.ClientException:
+        LOG.warning(_("Power-off failed for node %s."),
+                    node.uuid)
+    return _wait_for_power_state(node, states.POWER_OFF, power_off, timeout)
 
 
 def _reboot(node, timeout=None):
@@ -252,34 +377,9 @@ def _reboot(node, timeout=None):
     """
     if timeout is None:
         timeout = CONF.seamicro.action_timeout
-    state = [None]
-    retries = [0]
-    seamicro_info = _parse_driver_info(node)
-    server = _get_server(seamicro_info)
-
-    def _wait_for_reboot(state, retries):
-        """Called at an interval until the node is rebooted successfully."""
-
-        state[0] = _get_power_status(node)
-        if state[0] == states.POWER_ON:
-            raise loopingcall.LoopingCallDone()
-
-        if retries[0] > CONF.seamicro.max_retry:
-            state[0] = states.ERROR
-            raise loopingcall.LoopingCallDone()
-
-        try:
-            retries[0] += 1
-            server.reset()
-        except seamicro_client_exception.ClientException:
-            LOG.warning(_("Reboot failed for node %s."),
-                        node.uuid)
-
-    timer = loopingcall.FixedIntervalLoopingCall(_wait_for_reboot,
-                                                 state, retries)
-    server.reset()
-    timer.start(interval=timeout).wait()
-    return state[0]
+    reset = _server_action(_parse_driver_info(node), 'reset')
+    reset()
+    return _wait_for_power_state(node, states.POWER_ON, reset, timeout)
 
 
 def _validate_volume(driver_info, volume_id):
@@ -304,8 +404,8 @@ def _validate_volume(driver_info, volume_id):
 def _get_pools(driver_info, filters=None):
     """Get SeaMicro storage pools matching given filters."""
 
-    s_client = _get_client(**driver_info)
-    return s_client.pools.list(filters=filters)
+    return _call_client(driver_info,
+                        lambda s_client: s_client.pools.list(filters=filters))
 
 
 def _create_volume(driver_info, volume_size):
@@ -318,8 +418,8 @@ def _create_volume(driver_info, volume_size):
 
     least_used_pool = sorted(ironic_pools,
                              key=lambda x: x.freeSize)[0]
-    return _get_client(**driver_info).volumes.create(volume_size,
-                                                     least_used_pool)
+    return _call_client(driver_info, lambda s_client:
+                        s_client.volumes.create(volume_size, least_used_pool))
 
 
 class Power(base.PowerInterface):
@@ -356,6 +456,33 @@ class Power(base.PowerInterface):
         """
         return _get_power_status(task.node)
 
+    def get_power_endpoint(self, driver_info):
+        """Return the chassis and credentials a node is accessed with.
+
+        :param driver_info: the 'driver_info' property of the node.
+        :returns: a tuple of the API endpoint, API version and credentials
+            of the node, or None if the API endpoint is not set.
+        """
+        if not driver_info.get('seamicro_api_endpoint'):
+            return None
+        return (driver_info['seamicro_api_endpoint'],
+                driver_info.get('seamicro_api_version', "2"),
+                driver_info.get('seamicro_username'),
+                driver_info.get('seamicro_password'))
+
+    def get_power_states(self, tasks):
+        """Get the current power states of nodes of the same chassis.
+
+        :param tasks: a list of TaskManager instances containing the nodes
+            to act on.
+        :raises: InvalidParameterValue if required seamicro parameters are
+            missing.
+        :raises: ServiceUnavailable on an error from SeaMicro Client.
+        :returns: a list with the power state of each node, one of
+            :class:`ironic.common.states`, or NodeNotFound.
+        """
+        return _get_power_states([task.node for task in tasks])
+
     @task_manager.require_exclusive_lock
     def set_power_state(self, task, pstate):
         """Turn the power on or off.
@@ -560,11 +687,12 @@ class Management(base.ManagementInterface):
         # it's implemented.
         return {'boot_device': None, 'persistent': None}
 
-    def get_sensors_data(self, task):
+    def get_sensors_data(self, task, sensor_types=None):
         """Get sensors data method.
 
         Not implemented by this driver.
         :param task: a TaskManager instance.
+        :param sensor_types: list of the sensor types to get.
 
         """
         raise NotImplementedError()
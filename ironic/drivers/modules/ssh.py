@@ -26,6 +26,7 @@ Currently supported environments are:
 """
 
 import os
+import time
 
 from oslo.config import cfg
 
@@ -33,10 +34,10 @@ from ironic.common import boot_devices
 from ironic.common import exception
 from ironic.common import i18n
 from ironic.common import states
-from ironic.common import utils
 from ironic.conductor import task_manager
 from ironic.drivers import base
 from ironic.drivers import utils as driver_utils
+from ironic.drivers.modules import ssh_pool
 from ironic.openstack.common.gettextutils import _
 from ironic.openstack.common import log as logging
 from ironic.openstack.common import processutils
@@ -47,14 +48,34 @@ libvirt_opts = [
                help='libvirt uri')
 ]
 
+inventory_opts = [
+    cfg.IntOpt('inventory_cache_ttl',
+               default=10,
+               help='Time (in seconds) for which the list of the VMs of a '
+                    'hypervisor, with their MAC addresses and power '
+                    'states, is reused once retrieved. It is retrieved '
+                    'again after a power action on one of the VMs. Set to '
+                    '0 to retrieve it for every operation.'),
+]
+
 _LW = i18n._LW
 _LE = i18n._LE
 
 CONF = cfg.CONF
 CONF.register_opts(libvirt_opts, group='ssh')
+CONF.register_opts(inventory_opts, group='ssh')
 
 LOG = logging.getLogger(__name__)
 
+SSH_CONNECTIONS = ssh_pool.SSHConnectionPool()
+
+# (host, port, username, base_cmd) -> _Inventory of the hypervisor
+_INVENTORIES = {}
+
+# Lines of the inventory command output announcing a VM and its power state
+_VM_MARKER = '::vm::'
+_RUNNING_MARKER = '::running::'
+
 REQUIRED_PROPERTIES = {
     'ssh_address': _("IP address or hostname of the node to ssh into. "
                      "Required."),
@@ -300,40 +321,32 @@ def _get_power_status(ssh_obj, driver_info):
     :raises: NodeNotFound
 
     """
-    power_state = None
-    cmd_to_exec = "%s %s" % (driver_info['cmd_set']['base_cmd'],
-                             driver_info['cmd_set']['list_running'])
-    running_list = _ssh_execute(ssh_obj, cmd_to_exec)
-    # Command should return a list of running vms. If the current node is
-    # not listed then we can assume it is not powered on.
-    node_name = _get_hosts_name_for_node(ssh_obj, driver_info)
-    if node_name:
-        for node in running_list:
-            if not node:
-                continue
-            if node_name in node:
-                power_state = states.POWER_ON
-                break
-        if not power_state:
-            power_state = states.POWER_OFF
-    else:
+    node_name, inventory = _find_vm(ssh_obj, driver_info)
+    return _get_vm_power_state(inventory, node_name, driver_info)
+
+
+def _get_vm_power_state(inventory, node_name, driver_info):
+    if not node_name:
         err_msg = _('Node "%(host)s" with MAC address %(mac)s not found.')
         LOG.error(err_msg, {'host': driver_info['host'],
                             'mac': driver_info['macs']})
 
         raise exception.NodeNotFound(node=driver_info['host'])
 
-    return power_state
+    if node_name in inventory.running:
+        return states.POWER_ON
+    return states.POWER_OFF
 
 
 def _get_connection(node):
-    """Returns an SSH client connected to a node.
+    """Lease an SSH client connected to a node from the connection pool.
 
     :param node: the Node.
-    :returns: paramiko.SSHClient, an active ssh connection.
+    :returns: a context manager yielding a paramiko.SSHClient, an active
+        ssh connection.
 
     """
-    return utils.ssh_connect(_parse_driver_info(node))
+    return SSH_CONNECTIONS.connection(_parse_driver_info(node))
 
 
 def _get_hosts_name_for_node(ssh_obj, driver_info):
@@ -344,38 +357,139 @@ def _get_hosts_name_for_node(ssh_obj, driver_info):
     :returns: the name or None if not found.
 
     """
-    matched_name = None
-    cmd_to_exec = "%s %s" % (driver_info['cmd_set']['base_cmd'],
-                             driver_info['cmd_set']['list_all'])
-    full_node_list = _ssh_execute(ssh_obj, cmd_to_exec)
-    LOG.debug("Retrieved Node List: %s" % repr(full_node_list))
-    # for each node check Mac Addresses
-    for node in full_node_list:
-        if not node:
-            continue
-        LOG.debug("Checking Node: %s's Mac address." % node)
-        cmd_to_exec = "%s %s" % (driver_info['cmd_set']['base_cmd'],
-                                 driver_info['cmd_set']['get_node_macs'])
-        cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', node)
-        hosts_node_mac_list = _ssh_execute(ssh_obj, cmd_to_exec)
-
-        for host_mac in hosts_node_mac_list:
-            if not host_mac:
-                continue
-            for node_mac in driver_info['macs']:
-                if not node_mac:
-                    continue
-                if _normalize_mac(host_mac) in _normalize_mac(node_mac):
-                    LOG.debug("Found Mac address: %s" % node_mac)
-                    matched_name = node
-                    break
-
-            if matched_name:
-                break
-        if matched_name:
-            break
-
-    return matched_name
+    return _find_vm(ssh_obj, driver_info)[0]
+
+
+class _Inventory(object):
+    """The VMs of a hypervisor, their MAC addresses and power states."""
+
+    def __init__(self, vms, running):
+        # list of (VM name, list of MAC addresses), in listing order
+        self.vms = vms
+        # names of the running VMs
+        self.running = running
+        self.loaded_at = time.time()
+
+    def is_expired(self):
+        return time.time() - self.loaded_at >= CONF.ssh.inventory_cache_ttl
+
+    def find_vm(self, node_macs):
+        """Return the name of the VM with one of the MACs, or None."""
+        for name, host_macs in self.vms:
+            for host_mac in host_macs:
+                for node_mac in node_macs:
+                    if not node_mac:
+                        continue
+                    if _normalize_mac(host_mac) in _normalize_mac(node_mac):
+                        LOG.debug("Found Mac address: %s" % node_mac)
+                        return name
+
+
+def _inventory_key(driver_info):
+    return (driver_info['host'], driver_info['port'],
+            driver_info.get('username'), driver_info['cmd_set']['base_cmd'])
+
+
+def _get_inventory_cmd(cmd_set):
+    """Build the command listing all the VMs of a hypervisor at once.
+
+    The command prints a _VM_MARKER line followed by the MAC addresses of
+    each VM and, as the list_running command lists either all the running
+    VMs or whether a single VM is running, the output of list_running
+    after a _RUNNING_MARKER line once or for each VM.
+
+    """
+    base_cmd = cmd_set['base_cmd']
+    per_vm_running = '{_NodeName_}' in cmd_set['list_running']
+
+    def _for_vm(cmd):
+        # commands in the loop must not read the list of VMs from stdin
+        return '{ %s %s; } </dev/null' % (
+            base_cmd, cmd.replace('{_NodeName_}', '"$vm"'))
+
+    loop = ['[ -n "$vm" ] || continue', 'echo "%s$vm"' % _VM_MARKER,
+            _for_vm(cmd_set['get_node_macs'])]
+    if per_vm_running:
+        loop += ['echo "%s"' % _RUNNING_MARKER,
+                 _for_vm(cmd_set['list_running'])]
+    cmd = '%s %s | while IFS= read -r vm; do %s; done' % (
+        base_cmd, cmd_set['list_all'], '; '.join(loop))
+    if not per_vm_running:
+        cmd += '; echo "%s"; %s %s' % (_RUNNING_MARKER, base_cmd,
+                                      cmd_set['list_running'])
+    return cmd
+
+
+def _parse_inventory(output, per_vm_running):
+    vms = []
+    running = set()
+    running_list = []
+    vm, lines = None, []
+    for line in output:
+        if line.startswith(_VM_MARKER):
+            vm, lines = line[len(_VM_MARKER):], []
+            if vm:
+                vms.append((vm, lines))
+        elif line == _RUNNING_MARKER:
+            lines = running_list
+        elif line:
+            if lines is running_list and per_vm_running:
+                # the command only prints something if the VM is running
+                running.add(vm)
+            else:
+                lines.append(line)
+
+    # list_running prints a line per running VM, including its name
+    for name, macs in vms:
+        if any(name in line for line in running_list):
+            running.add(name)
+    return _Inventory(vms, running)
+
+
+def _load_inventory(ssh_obj, driver_info):
+    """List the VMs of the node's hypervisor and cache the list.
+
+    :param ssh_obj: paramiko.SSHClient, an active ssh connection.
+    :param driver_info: information for accessing the node.
+    :returns: an _Inventory.
+    :raises: SSHCommandFailed on an error from ssh.
+
+    """
+    cmd_set = driver_info['cmd_set']
+    output = _ssh_execute(ssh_obj, _get_inventory_cmd(cmd_set))
+    inventory = _parse_inventory(output,
+                                 '{_NodeName_}' in cmd_set['list_running'])
+    LOG.debug("Retrieved Node List: %s" % repr([n for n, m in inventory.vms]))
+    _INVENTORIES[_inventory_key(driver_info)] = inventory
+    return inventory
+
+
+def _find_vm(ssh_obj, driver_info):
+    """Find the node's VM in the inventory of its hypervisor.
+
+    A cached inventory is used unless it is expired or does not include
+    the VM, e.g. if it was created after the inventory was loaded.
+
+    :param ssh_obj: paramiko.SSHClient, an active ssh connection.
+    :param driver_info: information for accessing the node.
+    :returns: a tuple of the name of the VM, or None if not found, and the
+        _Inventory of the hypervisor.
+    :raises: SSHCommandFailed on an error from ssh.
+
+    """
+    inventory = _INVENTORIES.get(_inventory_key(driver_info))
+    if inventory is not None and not inventory.is_expired():
+        name = inventory.find_vm(driver_info['macs'])
+        if name is not None:
+            return name, inventory
+
+    inventory = _load_inventory(ssh_obj, driver_info)
+    return inventory.find_vm(driver_info['macs']), inventory
+
+
+def _invalidate_inventory(driver_info):
+    """Forget the cached inventory of the node's hypervisor."""
+    _INVENTORIES.pop(_inventory_key(driver_info), None)
 
 
 def _power_on(ssh_obj, driver_info):
@@ -395,7 +509,10 @@ def _power_on(ssh_obj, driver_info):
                                  driver_info['cmd_set']['start_cmd'])
     cmd_to_power_on = cmd_to_power_on.replace('{_NodeName_}', node_name)
 
-    _ssh_execute(ssh_obj, cmd_to_power_on)
+    try:
+        _ssh_execute(ssh_obj, cmd_to_power_on)
+    finally:
+        _invalidate_inventory(driver_info)
 
     current_pstate = _get_power_status(ssh_obj, driver_info)
     if current_pstate == states.POWER_ON:
@@ -421,7 +538,10 @@ def _power_off(ssh_obj, driver_info):
                                   driver_info['cmd_set']['stop_cmd'])
     cmd_to_power_off = cmd_to_power_off.replace('{_NodeName_}', node_name)
 
-    _ssh_execute(ssh_obj, cmd_to_power_off)
+    try:
+        _ssh_execute(ssh_obj, cmd_to_power_off)
+    finally:
+        _invalidate_inventory(driver_info)
 
     current_pstate = _get_power_status(ssh_obj, driver_info)
     if current_pstate == states.POWER_OFF:
@@ -457,7 +577,8 @@ class SSHPower(base.PowerInterface):
             raise exception.InvalidParameterValue(_("Node %s does not have "
                               "any port associated with it.") % task.node.uuid)
         try:
-            _get_connection(task.node)
+            with _get_connection(task.node):
+                pass
         except exception.SSHConnectFailed as e:
             raise exception.InvalidParameterValue(_("SSH connection cannot"
                                                     " be established: %s") % e)
@@ -477,8 +598,52 @@ class SSHPower(base.PowerInterface):
         """
         driver_info = _parse_driver_info(task.node)
         driver_info['macs'] = driver_utils.get_node_mac_addresses(task)
-        ssh_obj = _get_connection(task.node)
-        return _get_power_status(ssh_obj, driver_info)
+        with _get_connection(task.node) as ssh_obj:
+            return _get_power_status(ssh_obj, driver_info)
+
+    def get_power_endpoint(self, driver_info):
+        """Return the hypervisor and credentials a node is accessed with.
+
+        :param driver_info: the 'driver_info' property of the node.
+        :returns: a tuple of the SSH address, port, username, credentials
+            and virt_type of the node, or None if the address is not set.
+        """
+        if not driver_info.get('ssh_address'):
+            return None
+        return tuple(driver_info.get(key) for key in (
+            'ssh_address', 'ssh_port', 'ssh_username', 'ssh_password',
+            'ssh_key_contents', 'ssh_key_filename', 'ssh_virt_type'))
+
+    def get_power_states(self, tasks):
+        """Get the current power states of nodes of the same hypervisor.
+
+        The VMs of the hypervisor are listed once for all the nodes.
+
+        :param tasks: a list of TaskManager instances containing the nodes
+            to act on.
+        :returns: a list with the power state of each node, or the
+            exception raised getting it, e.g. NodeNotFound.
+        :raises: InvalidParameterValue if any connection parameters are
+            incorrect.
+        :raises: SSHCommandFailed on an error from ssh.
+        :raises: SSHConnectFailed if ssh failed to connect to the host.
+        """
+        driver_info = _parse_driver_info(tasks[0].node)
+        with _get_connection(tasks[0].node) as ssh_obj:
+            inventory = _load_inventory(ssh_obj, driver_info)
+
+        power_states = []
+        for task in tasks:
+            try:
+                driver_info = _parse_driver_info(task.node)
+                driver_info['macs'] = driver_utils.get_node_mac_addresses(
+                                                                        task)
+                node_name = inventory.find_vm(driver_info['macs'])
+                power_states.append(
+                    _get_vm_power_state(inventory, node_name, driver_info))
+            except Exception as e:
+                power_states.append(e)
+        return power_states
 
     @task_manager.require_exclusive_lock
     def set_power_state(self, task, pstate):
@@ -498,15 +663,14 @@ class SSHPower(base.PowerInterface):
         """
         driver_info = _parse_driver_info(task.node)
         driver_info['macs'] = driver_utils.get_node_mac_addresses(task)
-        ssh_obj = _get_connection(task.node)
-
-        if pstate == states.POWER_ON:
-            state = _power_on(ssh_obj, driver_info)
-        elif pstate == states.POWER_OFF:
-            state = _power_off(ssh_obj, driver_info)
-        else:
-            raise exception.InvalidParameterValue(_("set_power_state called "
-                    "with invalid power state %s.") % pstate)
+        with _get_connection(task.node) as ssh_obj:
+            if pstate == states.POWER_ON:
+                state = _power_on(ssh_obj, driver_info)
+            elif pstate == states.POWER_OFF:
+                state = _power_off(ssh_obj, driver_info)
+            else:
+                raise exception.InvalidParameterValue(_("set_power_state "
+                        "called with invalid power state %s.") % pstate)
 
         if state != pstate:
             raise exception.PowerStateFailure(pstate=pstate)
@@ -527,12 +691,12 @@ class SSHPower(base.PowerInterface):
         """
         driver_info = _parse_driver_info(task.node)
         driver_info['macs'] = driver_utils.get_node_mac_addresses(task)
-        ssh_obj = _get_connection(task.node)
-        current_pstate = _get_power_status(ssh_obj, driver_info)
-        if current_pstate == states.POWER_ON:
-            _power_off(ssh_obj, driver_info)
+        with _get_connection(task.node) as ssh_obj:
+            current_pstate = _get_power_status(ssh_obj, driver_info)
+            if current_pstate == states.POWER_ON:
+                _power_off(ssh_obj, driver_info)
 
-        state = _power_on(ssh_obj, driver_info)
+            state = _power_on(ssh_obj, driver_info)
 
         if state != states.POWER_ON:
             raise exception.PowerStateFailure(pstate=states.POWER_ON)
@@ -591,9 +755,10 @@ class SSHManagement(base.ManagementInterface):
             raise exception.InvalidParameterValue(_(
                 "Invalid boot device %s specified.") % device)
         driver_info['macs'] = driver_utils.get_node_mac_addresses(task)
-        ssh_obj = _get_connection(node)
         try:
-            _set_boot_device(ssh_obj, driver_info, _BOOT_DEVICES_MAP[device])
+            with _get_connection(node) as ssh_obj:
+                _set_boot_device(ssh_obj, driver_info,
+                                 _BOOT_DEVICES_MAP[device])
         except NotImplementedError:
             LOG.error(_LE("Failed to set boot device for node %(node)s, "
                           "virt_type %(vtype)s does not support this "
@@ -623,10 +788,11 @@ class SSHManagement(base.ManagementInterface):
         node = task.node
         driver_info = _parse_driver_info(node)
         driver_info['macs'] = driver_utils.get_node_mac_addresses(task)
-        ssh_obj = _get_connection(node)
         response = {'boot_device': None, 'persistent': None}
         try:
-            response['boot_device'] = _get_boot_device(ssh_obj, driver_info)
+            with _get_connection(node) as ssh_obj:
+                response['boot_device'] = _get_boot_device(ssh_obj,
+                                                           driver_info)
         except NotImplementedError:
             LOG.warning(_LW("Failed to get boot device for node %(node)s, "
                             "virt_type %(vtype)s does not support this "
@@ -634,12 +800,13 @@ class SSHManagement(base.ManagementInterface):
                         {'node': node.uuid, 'vtype': driver_info['virt_type']})
         return response
 
-    def get_sensors_data(self, task):
+    def get_sensors_data(self, task, sensor_types=None):
         """Get sensors data.
 
         Not implemented by this driver.
 
         :param task: a TaskManager instance.
+        :param sensor_types: list of the sensor types to get.
 
         """
         raise NotImplementedError()
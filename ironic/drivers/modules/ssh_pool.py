@@ -0,0 +1,157 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Pool of SSH connections to hypervisors.
+
+Many nodes of the SSH driver are usually VMs on the same few hypervisors,
+so opening a new connection, with a full key exchange and authentication,
+for every power operation is wasteful. :class:`SSHConnectionPool` keeps the
+connections once an operation is done with them and hands them to the next
+operation with the same credentials. A connection is only used by one
+operation at a time, at most [ssh]max_connections_per_host connections to
+a host are in use at once, and idle connections are closed after
+[ssh]connection_idle_timeout seconds.
+"""
+
+import collections
+import contextlib
+import time
+
+from eventlet import semaphore
+from oslo.config import cfg
+
+from ironic.common import i18n
+from ironic.common import utils
+from ironic.openstack.common import log as logging
+
+opts = [
+    cfg.IntOpt('max_connections_per_host',
+               default=4,
+               help='Maximum number of SSH connections to a host in use at '
+                    'the same time. Further operations on the host wait '
+                    'for a connection to be released.'),
+    cfg.IntOpt('connection_idle_timeout',
+               default=60,
+               help='Time (in seconds) after which an idle SSH connection '
+                    'is closed. Set to 0 to close connections as soon as '
+                    'they are released.'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(opts, group='ssh')
+
+LOG = logging.getLogger(__name__)
+
+_LW = i18n._LW
+
+
+def _is_healthy(client):
+    transport = client.get_transport()
+    return transport is not None and transport.is_active()
+
+
+def _close(client):
+    try:
+        client.close()
+    except Exception as e:
+        LOG.warning(_LW('Failed to close SSH connection: %s'), e)
+
+
+class SSHConnectionPool(object):
+    """SSH connections keyed by host, port and credentials."""
+
+    def __init__(self):
+        # key -> list of (client, time released), most recent last
+        self._idle = collections.defaultdict(list)
+        self._slots = {}
+        self._stats = collections.defaultdict(int)
+
+    @contextlib.contextmanager
+    def connection(self, info):
+        """Lease a connection to a host.
+
+        :param info: a dict of connection parameters, as taken by
+                     utils.ssh_connect.
+        :returns: a context manager yielding a paramiko.SSHClient, which is
+                  given back to the pool when the context exits.
+        :raises: SSHConnectFailed
+        """
+        self.evict_idle()
+        host = (info.get('host'), info.get('port', 22))
+        slots = self._slots.get(host)
+        if slots is None:
+            slots = semaphore.Semaphore(CONF.ssh.max_connections_per_host)
+            self._slots[host] = slots
+
+        key = host + (info.get('username'), info.get('password'),
+                      info.get('key_contents'), info.get('key_filename'))
+        with slots:
+            client = self._checkout(key, info)
+            try:
+                yield client
+            finally:
+                self._checkin(key, client)
+
+    def _checkout(self, key, info):
+        idle = self._idle.get(key)
+        while idle:
+            client, released = idle.pop()
+            if _is_healthy(client):
+                self._stats['reused'] += 1
+                return client
+            _close(client)
+
+        client = utils.ssh_connect(info)
+        self._stats['connects'] += 1
+        return client
+
+    def _checkin(self, key, client):
+        if CONF.ssh.connection_idle_timeout > 0 and _is_healthy(client):
+            self._idle[key].append((client, time.time()))
+        else:
+            _close(client)
+
+    def evict_idle(self):
+        """Close the connections idle for longer than the idle timeout."""
+        limit = time.time() - CONF.ssh.connection_idle_timeout
+        for key, idle in list(self._idle.items()):
+            expired = [c for c, released in idle if released < limit]
+            if not expired:
+                continue
+            idle[:] = [(c, r) for c, r in idle if r >= limit]
+            if not idle:
+                del self._idle[key]
+            for client in expired:
+                self._stats['evicted'] += 1
+                _close(client)
+
+    def close_all(self):
+        """Close every idle connection."""
+        for key in list(self._idle):
+            for client, released in self._idle.pop(key):
+                _close(client)
+
+    def get_stats(self):
+        """Return the pool statistics.
+
+        :returns: a dict with the number of connections opened
+                  ('connects'), of connects avoided by reusing a connection
+                  ('reused'), of idle connections closed ('evicted') and
+                  of connections currently idle ('idle').
+        """
+        return {'connects': self._stats['connects'],
+                'reused': self._stats['reused'],
+                'evicted': self._stats['evicted'],
+                'idle': sum(len(idle) for idle in self._idle.values())}
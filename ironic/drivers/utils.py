@@ -12,9 +12,18 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import random
+import time
+
 from ironic.common import exception
+from ironic.common import states
 from ironic.drivers import base
 
+# Growth factor of the interval between power state checks.
+POWER_WAIT_BACKOFF = 1.5
+# Maximum relative deviation applied to every interval.
+POWER_WAIT_JITTER = 0.1
+
 
 def _raise_unsupported_error(method=None):
     if method:
@@ -105,3 +114,46 @@ def get_node_mac_addresses(task):
     :returns: A list of MAC addresses in the format xx:xx:xx:xx:xx:xx.
     """
     return [p.address for p in task.ports]
+
+
+def wait_for_power_state(get_state, target_state, timeout,
+                         initial_interval=1, max_interval=10):
+    """Wait for a node to reach a power state after a power action.
+
+    The state is first checked initial_interval seconds after the call,
+    then at intervals growing by POWER_WAIT_BACKOFF up to max_interval, so
+    that a quick transition is noticed quickly while a slow one does not
+    flood the BMC. Each interval is randomly stretched or shrunk by up to
+    POWER_WAIT_JITTER, so that nodes powered on together do not poll their
+    BMCs in lockstep. The wait returns as soon as one of its own checks
+    finds the target state.
+
+    This only changes how often the state is polled: the caller still holds
+    the node's exclusive lock for the whole wait, and nothing notifies the
+    wait when the node reaches the state.
+
+    :param get_state: a callable without arguments returning the current
+                      power state of the node, or None if it could not be
+                      determined.
+    :param target_state: the power state to wait for.
+    :param timeout: maximum time in seconds to sleep between checks in
+                    total. The time spent checking is not counted.
+    :param initial_interval: time in seconds before the first check.
+    :param max_interval: maximum time in seconds between two checks.
+    :returns: target_state, or states.ERROR if it was not reached in time.
+    """
+    waited = 0
+    interval = initial_interval
+    while True:
+        sleep_time = min(interval * random.uniform(1 - POWER_WAIT_JITTER,
+                                                   1 + POWER_WAIT_JITTER),
+                         timeout - waited)
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+            waited += sleep_time
+
+        if get_state() == target_state:
+            return target_state
+        if waited >= timeout:
+            return states.ERROR
+        interval = min(interval * POWER_WAIT_BACKOFF, max_interval)
@@ -37,8 +37,11 @@ from oslo.config import cfg
 from ironic.db.sqlalchemy import migration
 from ironic.db.sqlalchemy import models
 
+from ironic.common.glance_service import base_image_service
+from ironic.common import hash_ring
 from ironic.common import paths
 from ironic.db.sqlalchemy import api as sqla_api
+from ironic.drivers.modules import ipmi_scheduler
 from ironic.objects import base as objects_base
 from ironic.openstack.common import log as logging
 from ironic.tests import conf_fixture
@@ -177,6 +180,21 @@ class TestCase(testtools.TestCase):
                 objects_base.IronicObject._obj_classes)
         self.addCleanup(self._restore_obj_registry)
 
+        # NOTE: The hash rings are shared process-wide; make sure they are
+        # not carried over from one test to the next.
+        hash_ring.HashRingManager.reset()
+        self.addCleanup(hash_ring.HashRingManager.reset)
+
+        # NOTE: Likewise for the BMC command schedule, so that a test does
+        # not wait for the commands sent by the previous one.
+        ipmi_scheduler.SCHEDULER.reset()
+        self.addCleanup(ipmi_scheduler.SCHEDULER.reset)
+
+        # NOTE: And for the image metadata cached from glance, as the tests
+        # reuse the same image ids for different images.
+        base_image_service.METADATA_CACHE.reset()
+        self.addCleanup(base_image_service.METADATA_CACHE.reset)
+
         self.addCleanup(self._clear_attrs)
         self.useFixture(fixtures.EnvironmentVariable('http_proxy'))
         self.policy = self.useFixture(policy_fixture.PolicyFixture())
@@ -25,6 +25,7 @@ from oslo import messaging
 
 from ironic.common import driver_factory
 from ironic.common import exception
+from ironic.common import hash_ring as hash
 from ironic.common import states
 from ironic.common import utils as ironic_utils
 from ironic.conductor import manager
@@ -881,6 +882,39 @@ class MiscTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
         self.assertFalse(self.service._mapped_to_this_conductor(n['uuid'],
                                                                 'otherdriver'))
 
+    def test__get_driver_hash_ranges(self):
+        self.config(hash_partition_exponent=4)
+        self._start_service()
+        self.assertEqual([('fake', 0, 1 << 32)],
+                         self.service._get_driver_hash_ranges())
+
+    def test__get_driver_hash_ranges_not_in_ring(self):
+        self._start_service()
+        with mock.patch.object(self.service.ring_manager,
+                               'get_hash_ring') as mock_get_ring:
+            mock_get_ring.side_effect = exception.DriverNotFound('fake')
+            self.assertEqual([], self.service._get_driver_hash_ranges())
+
+    def test__get_driver_hash_ranges_selects_mapped_nodes(self):
+        self._start_service()
+        self.dbapi.register_conductor({'hostname': 'other-host',
+                                       'drivers': ['fake']})
+        self.service.ring_manager.refresh()
+        for i in range(20):
+            obj_utils.create_test_node(self.context, driver='fake',
+                                       id=i + 1,
+                                       uuid=ironic_utils.generate_uuid())
+        filters = {'driver_hash_ranges':
+                       self.service._get_driver_hash_ranges()}
+        mapped = self.dbapi.get_nodeinfo_list(columns=['uuid'],
+                                              filters=filters)
+        all_nodes = self.dbapi.get_nodeinfo_list(columns=['uuid'])
+        self.assertTrue(0 < len(mapped) < len(all_nodes))
+        for (node_uuid,) in all_nodes:
+            self.assertEqual(
+                self.service._mapped_to_this_conductor(node_uuid, 'fake'),
+                (node_uuid,) in mapped)
+
     def test_validate_driver_interfaces(self):
         node = obj_utils.create_test_node(self.context, driver='fake')
         ret = self.service.validate_driver_interfaces(self.context,
@@ -939,6 +973,191 @@ class MiscTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
         self.assertFalse(node.maintenance)
 
 
+@_mock_record_keepalive
+class CheckConductorMembershipTestCase(_ServiceSetUpMixin,
+                                       tests_db_base.DbTestCase):
+    def setUp(self):
+        super(CheckConductorMembershipTestCase, self).setUp()
+        self.config(hash_partition_exponent=4)
+        # NOTE: the class decorator only applies to the test methods, do not
+        # let the keepalive run in the worker pool which tests wait for.
+        with mock.patch.object(manager.ConductorManager,
+                               '_conductor_service_record_keepalive'):
+            self._start_service()
+
+    def _join(self):
+        # The first membership check takes over the nodes of this conductor
+        with mock.patch.object(self.service, 'rebalance_node_ring'):
+            self.service._check_conductor_membership(self.context)
+
+    def _create_node_mapped_to(self, host, **kwargs):
+        ring = self.service.ring_manager.get_hash_ring('fake')
+        while True:
+            node_uuid = ironic_utils.generate_uuid()
+            if ring.get_hosts(node_uuid)[0] == host:
+                break
+        return obj_utils.create_test_node(self.context, driver='fake',
+                                          uuid=node_uuid, **kwargs)
+
+    @mock.patch.object(manager.ConductorManager, 'rebalance_node_ring')
+    def test_no_change(self, rebalance_mock):
+        self._join()
+        generation = self.service.ring_manager.generation
+        self.service._check_conductor_membership(self.context)
+        self.assertEqual(generation, self.service._ring_generation)
+        self.assertFalse(rebalance_mock.called)
+
+    @mock.patch.object(manager.ConductorManager, 'rebalance_node_ring')
+    def test_this_conductor_joined(self, rebalance_mock):
+        self.service._check_conductor_membership(self.context)
+
+        moved = rebalance_mock.call_args[0][1]
+        self.assertEqual(['fake'], list(moved))
+        self.assertEqual(set(range(16)), moved['fake'])
+
+    def test_this_conductor_joined_nodes_taken_over(self):
+        self.dbapi.register_conductor({'hostname': 'other-host',
+                                       'drivers': ['fake']})
+        self.service.ring_manager.refresh()
+        node = self._create_node_mapped_to(
+                self.hostname, id=1,
+                instance_uuid=ironic_utils.generate_uuid())
+        self._create_node_mapped_to(
+                'other-host', id=2, instance_uuid=ironic_utils.generate_uuid())
+
+        with mock.patch.object(self.driver.deploy, 'prepare') as prepare_mock:
+            with mock.patch.object(self.driver.deploy,
+                                   'take_over') as take_over_mock:
+                self.service._check_conductor_membership(self.context)
+                self.service._worker_pool.waitall()
+
+        self.assertEqual(1, prepare_mock.call_count)
+        self.assertEqual(1, take_over_mock.call_count)
+        task = take_over_mock.call_args[0][0]
+        self.assertEqual(node.uuid, task.node.uuid)
+        self.assertEqual({}, self.service._takeover_partitions)
+
+    @mock.patch.object(manager.ConductorManager, 'rebalance_node_ring')
+    def test_conductor_joined(self, rebalance_mock):
+        self._join()
+        generation = self.service.ring_manager.generation
+        self.dbapi.register_conductor({'hostname': 'other-host',
+                                       'drivers': ['fake']})
+        self.service._check_conductor_membership(self.context)
+
+        self.assertEqual(generation + 1, self.service._ring_generation)
+        moved = rebalance_mock.call_args[0][1]
+        self.assertEqual(['fake'], list(moved))
+        # half of the partitions moved to the new conductor
+        self.assertEqual(8, len(moved['fake']))
+        ring = self.service.ring_manager.get_hash_ring('fake')
+        self.assertIs(ring, self.service._hash_rings['fake'])
+        for partition in moved['fake']:
+            self.assertEqual('other-host',
+                             ring.hosts[ring.part2host[partition]])
+
+    @mock.patch.object(manager.ConductorManager, 'rebalance_node_ring')
+    def test_other_driver_changed(self, rebalance_mock):
+        self._join()
+        self.dbapi.register_conductor({'hostname': 'other-host',
+                                       'drivers': ['otherdriver']})
+        self.service._check_conductor_membership(self.context)
+        self.assertIn('otherdriver', self.service._hash_rings)
+        self.assertFalse(rebalance_mock.called)
+
+    def test_membership_unchanged_rings_not_loaded(self):
+        self._join()
+        with mock.patch.object(hash.HashRingManager,
+                               '_load_hash_rings') as load_mock:
+            self.service._check_conductor_membership(self.context)
+            self.assertFalse(load_mock.called)
+
+    def test_conductor_left_nodes_taken_over(self):
+        self.dbapi.register_conductor({'hostname': 'other-host',
+                                       'drivers': ['fake']})
+        self._join()
+        node = self._create_node_mapped_to(
+                'other-host', id=1, instance_uuid=ironic_utils.generate_uuid())
+        self._create_node_mapped_to('other-host', id=2, instance_uuid=None)
+        self._create_node_mapped_to(
+                'other-host', id=3, instance_uuid=ironic_utils.generate_uuid(),
+                maintenance=True)
+
+        self.dbapi.unregister_conductor('other-host')
+        with mock.patch.object(self.driver.deploy, 'prepare') as prepare_mock:
+            with mock.patch.object(self.driver.deploy,
+                                   'take_over') as take_over_mock:
+                self.service._check_conductor_membership(self.context)
+                self.service._worker_pool.waitall()
+
+        self.assertEqual(1, prepare_mock.call_count)
+        self.assertEqual(1, take_over_mock.call_count)
+        task = take_over_mock.call_args[0][0]
+        self.assertEqual(node.uuid, task.node.uuid)
+        node.refresh()
+        self.assertIsNone(node.reservation)
+
+    def test_conductor_left_worker_pool_full(self):
+        self.dbapi.register_conductor({'hostname': 'other-host',
+                                       'drivers': ['fake']})
+        self._join()
+        node = self._create_node_mapped_to(
+                'other-host', instance_uuid=ironic_utils.generate_uuid())
+
+        self.dbapi.unregister_conductor('other-host')
+        with mock.patch.object(self.service, '_spawn_worker') as spawn_mock:
+            spawn_mock.side_effect = exception.NoFreeConductorWorker()
+            with mock.patch.object(self.driver.deploy,
+                                   'take_over') as take_over_mock:
+                self.service._check_conductor_membership(self.context)
+
+        self.assertFalse(take_over_mock.called)
+        node.refresh()
+        self.assertIsNone(node.reservation)
+        ring = self.service._hash_rings['fake']
+        self.assertEqual({'fake': set([ring.get_partition(node.uuid)])},
+                         self.service._takeover_partitions)
+
+        # retried on the next check, without any membership change
+        with mock.patch.object(self.driver.deploy,
+                               'take_over') as take_over_mock:
+            self.service._check_conductor_membership(self.context)
+            self.service._worker_pool.waitall()
+
+        self.assertEqual(1, take_over_mock.call_count)
+        self.assertEqual({}, self.service._takeover_partitions)
+
+    def test_conductor_left_node_locked(self):
+        self.dbapi.register_conductor({'hostname': 'other-host',
+                                       'drivers': ['fake']})
+        self._join()
+        node = self._create_node_mapped_to(
+                'other-host', instance_uuid=ironic_utils.generate_uuid())
+        self.dbapi.reserve_node('other-host', node.id)
+
+        self.dbapi.unregister_conductor('other-host')
+        with mock.patch.object(self.driver.deploy,
+                               'take_over') as take_over_mock:
+            with mock.patch.object(task_manager, 'acquire',
+                                   wraps=task_manager.acquire) as acq_mock:
+                self.service._check_conductor_membership(self.context)
+                self.service._worker_pool.waitall()
+
+        self.assertFalse(take_over_mock.called)
+        acq_mock.assert_called_once_with(self.context, node.uuid,
+                                         retry=False)
+        self.assertIn('fake', self.service._takeover_partitions)
+
+        self.dbapi.release_node('other-host', node.id)
+        with mock.patch.object(self.driver.deploy,
+                               'take_over') as take_over_mock:
+            self.service._check_conductor_membership(self.context)
+            self.service._worker_pool.waitall()
+
+        self.assertEqual(1, take_over_mock.call_count)
+        self.assertEqual({}, self.service._takeover_partitions)
+
+
 @_mock_record_keepalive
 class ConsoleTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
     def test_set_console_mode_worker_pool_full(self):
@@ -1254,10 +1473,12 @@ class UpdatePortTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
                                           driver='fake')
         self._start_service()
         CONF.set_override('send_sensor_data', True, group='conductor')
+        CONF.set_override('send_sensor_data_types', ['Fan'],
+                          group='conductor')
         acquire_mock.return_value.__enter__.return_value.driver = self.driver
         with mock.patch.object(self.driver.management,
                                'get_sensors_data') as get_sensors_data_mock:
-            get_sensors_data_mock.return_value = 'fake-sensor-data'
+            get_sensors_data_mock.return_value = {'Fan': {}}
             _mapped_to_this_conductor_mock.return_value = True
             get_nodeinfo_list_mock.return_value = [(node.uuid, node.driver,
                                                  node.instance_uuid)]
@@ -1265,7 +1486,7 @@ class UpdatePortTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
             self.assertTrue(get_nodeinfo_list_mock.called)
             self.assertTrue(_mapped_to_this_conductor_mock.called)
             self.assertTrue(acquire_mock.called)
-            self.assertTrue(get_sensors_data_mock.called)
+            get_sensors_data_mock.assert_called_once_with(mock.ANY, ['Fan'])
 
     @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
     @mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
@@ -1288,6 +1509,120 @@ class UpdatePortTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
             self.assertFalse(acquire_mock.called)
             self.assertFalse(get_sensors_data_mock.called)
 
+    @mock.patch.object(manager.ConductorManager, '_get_sensor_data_message')
+    @mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
+    def test___send_sensor_data_not_batched(self, get_nodeinfo_list_mock,
+                                            get_message_mock):
+        self._start_service()
+        CONF.set_override('send_sensor_data', True, group='conductor')
+        get_nodeinfo_list_mock.return_value = [('uuid1', 'fake', 'inst1'),
+                                               ('uuid2', 'fake', 'inst2'),
+                                               ('uuid3', 'fake', 'inst3')]
+        get_message_mock.side_effect = ['message1', None, 'message3']
+
+        with mock.patch.object(self.service, 'notifier') as notifier_mock:
+            self.service._send_sensor_data(self.context)
+
+        get_message_mock.assert_has_calls(
+            [mock.call(self.context, 'uuid1', 'fake', 'inst1'),
+             mock.call(self.context, 'uuid2', 'fake', 'inst2'),
+             mock.call(self.context, 'uuid3', 'fake', 'inst3')],
+            any_order=True)
+        self.assertEqual(
+            [mock.call(self.context, 'hardware.ipmi.metrics', 'message1'),
+             mock.call(self.context, 'hardware.ipmi.metrics', 'message3')],
+            notifier_mock.info.call_args_list)
+
+    @mock.patch.object(manager.ConductorManager, '_get_sensor_data_message')
+    @mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
+    def test___send_sensor_data_batched(self, get_nodeinfo_list_mock,
+                                        get_message_mock):
+        self._start_service()
+        CONF.set_override('send_sensor_data', True, group='conductor')
+        self.config(send_sensor_data_batch_size=2, group='conductor')
+        get_nodeinfo_list_mock.return_value = [
+            ('uuid%d' % i, 'fake', 'inst%d' % i) for i in range(4)]
+        get_message_mock.side_effect = ['message0', 'message1', None,
+                                        'message3']
+
+        with mock.patch.object(self.service, 'notifier') as notifier_mock:
+            self.service._send_sensor_data(self.context)
+
+        self.assertEqual(2, notifier_mock.info.call_count)
+        payloads = [c[0][2]['payload']
+                    for c in notifier_mock.info.call_args_list]
+        self.assertEqual([['message0', 'message1'], ['message3']], payloads)
+        for c in notifier_mock.info.call_args_list:
+            self.assertEqual('hardware.ipmi.metrics', c[0][1])
+            self.assertEqual('hardware.ipmi.metrics.update',
+                             c[0][2]['event_type'])
+
+    @mock.patch.object(manager.ConductorManager, '_get_sensor_data_message')
+    @mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
+    def test___send_sensor_data_concurrent(self, get_nodeinfo_list_mock,
+                                           get_message_mock):
+        self._start_service()
+        CONF.set_override('send_sensor_data', True, group='conductor')
+        self.config(send_sensor_data_workers=2, group='conductor')
+        get_nodeinfo_list_mock.return_value = [
+            ('uuid%d' % i, 'fake', 'inst%d' % i) for i in range(4)]
+        running = []
+        max_running = []
+
+        def _get_message(context, node_uuid, driver, instance_uuid):
+            running.append(node_uuid)
+            max_running.append(len(running))
+            eventlet.sleep(0.01)
+            running.remove(node_uuid)
+            return node_uuid
+
+        get_message_mock.side_effect = _get_message
+
+        with mock.patch.object(self.service, 'notifier') as notifier_mock:
+            self.service._send_sensor_data(self.context)
+
+        self.assertEqual(2, max(max_running))
+        self.assertEqual(['uuid%d' % i for i in range(4)],
+                         [c[0][2] for c in notifier_mock.info.call_args_list])
+
+    @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
+    @mock.patch.object(task_manager, 'acquire')
+    def test__get_sensor_data_message_not_mapped(self, acquire_mock,
+                                                 mapped_mock):
+        self._start_service()
+        mapped_mock.return_value = False
+        self.assertIsNone(self.service._get_sensor_data_message(
+                              self.context, 'uuid', 'fake', 'inst'))
+        self.assertFalse(acquire_mock.called)
+
+    @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
+    @mock.patch.object(task_manager, 'acquire')
+    def test__get_sensor_data_message_error(self, acquire_mock, mapped_mock):
+        self._start_service()
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = exception.NodeNotFound(node='uuid')
+        self.assertIsNone(self.service._get_sensor_data_message(
+                              self.context, 'uuid', 'fake', 'inst'))
+
+    @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
+    @mock.patch.object(task_manager, 'acquire')
+    def test__get_sensor_data_message(self, acquire_mock, mapped_mock):
+        self._start_service()
+        mapped_mock.return_value = True
+        acquire_mock.return_value.__enter__.return_value.driver = self.driver
+        sensors_data = {'Temperature': {'Temp1': {'Sensor Reading': '25'}}}
+        with mock.patch.object(self.driver.management,
+                               'get_sensors_data') as get_sensors_data_mock:
+            get_sensors_data_mock.return_value = sensors_data
+            message = self.service._get_sensor_data_message(
+                              self.context, 'uuid', 'fake', 'inst')
+
+        self.assertEqual('uuid', message['node_uuid'])
+        self.assertEqual('inst', message['instance_uuid'])
+        self.assertEqual('hardware.ipmi.metrics.update',
+                         message['event_type'])
+        self.assertEqual(sensors_data, message['payload'])
+
 
 class ManagerSpawnWorkerTestCase(tests_base.TestCase):
     def setUp(self):
@@ -1498,11 +1833,31 @@ class ManagerDoSyncPowerStateTestCase(tests_base.TestCase):
 
         self.assertFalse(node_power_action.called)
 
+    def test_queried_state(self, node_power_action):
+        self.node.power_state = states.POWER_ON
+
+        self.service._do_sync_power_state(self.task, states.POWER_OFF)
+
+        self.assertFalse(self.power.get_power_state.called)
+        self.node.save.assert_called_once_with(self.context)
+        self.assertEqual(states.POWER_OFF, self.node.power_state)
+
+    def test_queried_state_exception(self, node_power_action):
+        self.node.power_state = states.POWER_ON
+
+        self.service._do_sync_power_state(self.task,
+                                          exception.IronicException('foo'))
+
+        self.assertFalse(self.power.get_power_state.called)
+        self.assertFalse(self.node.save.called)
+        self.assertEqual(states.POWER_ON, self.node.power_state)
+        self.assertEqual(1,
+                         self.service.power_state_sync_count[self.node.uuid])
+
 
 @mock.patch.object(manager.ConductorManager, '_do_sync_power_state')
 @mock.patch.object(task_manager, 'acquire')
 @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
-@mock.patch.object(objects.Node, 'get_by_id')
 @mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
 class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_base.TestCase):
     def setUp(self):
@@ -1512,13 +1867,31 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_base.TestCase):
         self.service.dbapi = self.dbapi
         self.context = context.get_admin_context()
         self.node = self._create_node()
-        self.filters = {'reserved': False, 'maintenance': False}
-        self.columns = ['id', 'uuid', 'driver']
+        self.hash_ranges = [('fake', 0, 1 << 31)]
+        p = mock.patch.object(self.service, '_get_driver_hash_ranges',
+                              return_value=self.hash_ranges)
+        p.start()
+        self.addCleanup(p.stop)
+        self.driver = mock.Mock(spec_set=drivers_base.BaseDriver)
+        self.driver.power.get_power_endpoint.return_value = None
+        p = mock.patch.object(self.service, '_get_driver',
+                              return_value=self.driver)
+        p.start()
+        self.addCleanup(p.stop)
+        self.filters = {'reserved': False, 'maintenance': False,
+                        'provision_state_not_in': [states.DEPLOYWAIT],
+                        'driver_hash_ranges': self.hash_ranges}
+        self.columns = ['id', 'uuid', 'driver', 'driver_info']
+        self.lock_filters = {'maintenance': False,
+                             'provision_state_not_in': [states.DEPLOYWAIT]}
 
-    def test_node_not_mapped(self, get_nodeinfo_mock, get_node_mock,
+    def _acquire_call(self, node_id):
+        return mock.call(self.context, node_id, filters=self.lock_filters,
+                         retry=False)
+
+    def test_node_not_mapped(self, get_nodeinfo_mock,
                              mapped_mock, acquire_mock, sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
         mapped_mock.return_value = False
 
         self.service._sync_power_states(self.context)
@@ -1527,79 +1900,12 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_base.TestCase):
                 columns=self.columns, filters=self.filters)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
-        self.assertFalse(get_node_mock.called)
-        self.assertFalse(acquire_mock.called)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_disappeared(self, get_nodeinfo_mock, get_node_mock,
-                              mapped_mock, acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
-        mapped_mock.return_value = True
-        get_node_mock.side_effect = exception.NodeNotFound(node=self.node.uuid)
-
-        self.service._sync_power_states(self.context)
-
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(acquire_mock.called)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_in_deploywait(self, get_nodeinfo_mock, get_node_mock,
-                                mapped_mock, acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
-        self.node.provision_state = states.DEPLOYWAIT
-
-        self.service._sync_power_states(self.context)
-
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
         self.assertFalse(acquire_mock.called)
         self.assertFalse(sync_mock.called)
 
-    def test_node_in_maintenance(self, get_nodeinfo_mock, get_node_mock,
-                                 mapped_mock, acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
-        self.node.maintenance = True
-
-        self.service._sync_power_states(self.context)
-
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(acquire_mock.called)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_has_reservation(self, get_nodeinfo_mock, get_node_mock,
-                                  mapped_mock, acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
-        self.node.reservation = 'fake'
-
-        self.service._sync_power_states(self.context)
-
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(acquire_mock.called)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_locked_on_acquire(self, get_nodeinfo_mock, get_node_mock,
+    def test_node_locked_on_acquire(self, get_nodeinfo_mock,
                                     mapped_mock, acquire_mock, sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
         mapped_mock.return_value = True
         acquire_mock.side_effect = exception.NodeLocked(node=self.node.uuid,
                                                         host='fake')
@@ -1610,40 +1916,17 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_base.TestCase):
                 columns=self.columns, filters=self.filters)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        acquire_mock.assert_called_once_with(self.context, self.node.id)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_in_deploywait_on_acquire(self, get_nodeinfo_mock,
-                                           get_node_mock, mapped_mock,
-                                           acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
-        mapped_mock.return_value = True
-        task = self._create_task(
-                node_attrs=dict(provision_state=states.DEPLOYWAIT,
-                                id=self.node.id))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
-
-        self.service._sync_power_states(self.context)
-
-        get_nodeinfo_mock.assert_called_once_with(
-                columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        acquire_mock.assert_called_once_with(self.context, self.node.id)
+        self.assertEqual([self._acquire_call(self.node.id)],
+                         acquire_mock.call_args_list)
         self.assertFalse(sync_mock.called)
 
-    def test_node_in_maintenance_on_acquire(self, get_nodeinfo_mock,
-                                            get_node_mock, mapped_mock,
-                                            acquire_mock, sync_mock):
+    def test_node_constraints_not_met_on_acquire(self, get_nodeinfo_mock,
+                                                 mapped_mock, acquire_mock,
+                                                 sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
         mapped_mock.return_value = True
-        task = self._create_task(
-                node_attrs=dict(maintenance=True, id=self.node.id))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
+        acquire_mock.side_effect = exception.NodeConstraintsNotMet(
+                                                    node=self.node.uuid)
 
         self.service._sync_power_states(self.context)
 
@@ -1651,15 +1934,13 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_base.TestCase):
                 columns=self.columns, filters=self.filters)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        acquire_mock.assert_called_once_with(self.context, self.node.id)
+        self.assertEqual([self._acquire_call(self.node.id)],
+                         acquire_mock.call_args_list)
         self.assertFalse(sync_mock.called)
 
     def test_node_disappears_on_acquire(self, get_nodeinfo_mock,
-                                        get_node_mock, mapped_mock,
-                                        acquire_mock, sync_mock):
+                                        mapped_mock, acquire_mock, sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
         mapped_mock.return_value = True
         acquire_mock.side_effect = exception.NodeNotFound(node=self.node.uuid,
                                                           host='fake')
@@ -1670,14 +1951,13 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_base.TestCase):
                 columns=self.columns, filters=self.filters)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        acquire_mock.assert_called_once_with(self.context, self.node.id)
+        self.assertEqual([self._acquire_call(self.node.id)],
+                         acquire_mock.call_args_list)
         self.assertFalse(sync_mock.called)
 
-    def test_single_node(self, get_nodeinfo_mock, get_node_mock,
+    def test_single_node(self, get_nodeinfo_mock,
                          mapped_mock, acquire_mock, sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        get_node_mock.return_value = self.node
         mapped_mock.return_value = True
         task = self._create_task(node_attrs=dict(id=self.node.id))
         acquire_mock.side_effect = self._get_acquire_side_effect(task)
@@ -1688,63 +1968,36 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_base.TestCase):
                 columns=self.columns, filters=self.filters)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
-        get_node_mock.assert_called_once_with(self.context, self.node.id)
-        acquire_mock.assert_called_once_with(self.context, self.node.id)
+        self.assertEqual([self._acquire_call(self.node.id)],
+                         acquire_mock.call_args_list)
         sync_mock.assert_called_once_with(task)
 
     def test__sync_power_state_multiple_nodes(self, get_nodeinfo_mock,
-                                              get_node_mock, mapped_mock,
-                                              acquire_mock, sync_mock):
-        # Create 11 nodes:
+                                              mapped_mock, acquire_mock,
+                                              sync_mock):
+        # Create 6 nodes:
         # 1st node: Should acquire and try to sync
         # 2nd node: Not mapped to this conductor
-        # 3rd node: In DEPLOYWAIT provision_state
-        # 4th node: In maintenance mode
-        # 5th node: Has a reservation
-        # 6th node: Disappears after getting nodeinfo list.
-        # 7th node: task_manger.acquire() fails due to lock
-        # 8th node: task_manger.acquire() fails due to node disappearing
-        # 9th node: In DEPLOYWAIT provision_state acquire()
-        # 10th node: In maintenance mode on acquire()
-        # 11th node: Should acquire and try to sync
+        # 3rd node: task_manger.acquire() fails due to lock
+        # 4th node: task_manger.acquire() fails due to node disappearing
+        # 5th node: In DEPLOYWAIT or maintenance on acquire()
+        # 6th node: Should acquire and try to sync
         nodes = []
-        get_node_map = {}
         mapped_map = {}
-        for i in range(1, 12):
-            attrs = {'id': i,
-                     'uuid': ironic_utils.generate_uuid()}
-            if i == 3:
-                attrs['provision_state'] = states.DEPLOYWAIT
-            elif i == 4:
-                attrs['maintenance'] = True
-            elif i == 5:
-                attrs['reservation'] = 'fake'
-
-            n = self._create_node(**attrs)
+        for i in range(1, 7):
+            n = self._create_node(id=i, uuid=ironic_utils.generate_uuid())
             nodes.append(n)
             mapped_map[n.uuid] = False if i == 2 else True
-            get_node_map[n.uuid] = n
 
         tasks = [self._create_task(node_attrs=dict(id=1)),
-                 exception.NodeLocked(node=7, host='fake'),
-                 exception.NodeNotFound(node=8, host='fake'),
-                 self._create_task(
-                     node_attrs=dict(id=9,
-                                     provision_state=states.DEPLOYWAIT)),
-                 self._create_task(
-                     node_attrs=dict(id=10, maintenance=True)),
-                 self._create_task(node_attrs=dict(id=11))]
-
-        def _get_node_side_effect(ctxt, node_id):
-            if node_id == 6:
-                # Make this node disappear
-                raise exception.NodeNotFound(node=node_id)
-            return nodes[node_id - 1]
+                 exception.NodeLocked(node=3, host='fake'),
+                 exception.NodeNotFound(node=4, host='fake'),
+                 exception.NodeConstraintsNotMet(node=5),
+                 self._create_task(node_attrs=dict(id=6))]
 
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
                 nodes)
         mapped_mock.side_effect = lambda x, y: mapped_map[x]
-        get_node_mock.side_effect = _get_node_side_effect
         acquire_mock.side_effect = self._get_acquire_side_effect(tasks)
 
         with mock.patch.object(eventlet, 'sleep') as sleep_mock:
@@ -1756,16 +2009,179 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_base.TestCase):
                 columns=self.columns, filters=self.filters)
         mapped_calls = [mock.call(n.uuid, n.driver) for n in nodes]
         self.assertEqual(mapped_calls, mapped_mock.call_args_list)
-        get_node_calls = [mock.call(self.context, n.id)
-                for n in nodes[:1] + nodes[2:]]
-        self.assertEqual(get_node_calls,
-                         get_node_mock.call_args_list)
-        acquire_calls = [mock.call(self.context, n.id)
-                for n in nodes[:1] + nodes[6:]]
+        acquire_calls = [self._acquire_call(n.id)
+                         for n in nodes[:1] + nodes[2:]]
         self.assertEqual(acquire_calls, acquire_mock.call_args_list)
-        sync_calls = [mock.call(tasks[0]), mock.call(tasks[5])]
+        sync_calls = [mock.call(tasks[0]), mock.call(tasks[4])]
+        self.assertEqual(sync_calls, sync_mock.call_args_list)
+
+    def _create_nodes_and_tasks(self, count):
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid())
+                 for i in range(1, count + 1)]
+        tasks = [self._create_task(node=n) for n in nodes]
+        return nodes, tasks
+
+    def test_concurrent_sync(self, get_nodeinfo_mock,
+                             mapped_mock, acquire_mock, sync_mock):
+        self.config(sync_power_state_workers=2, group='conductor')
+        nodes, tasks = self._create_nodes_and_tasks(3)
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = self._get_acquire_side_effect(tasks)
+        running = []
+        max_running = []
+
+        def _sync(task):
+            running.append(task)
+            max_running.append(len(running))
+            eventlet.sleep(0.01)
+            running.remove(task)
+
+        sync_mock.side_effect = _sync
+
+        self.service._sync_power_states(self.context)
+
+        self.assertEqual(3, sync_mock.call_count)
+        self.assertEqual(2, max(max_running))
+
+    def test_unexpected_error(self, get_nodeinfo_mock,
+                              mapped_mock, acquire_mock, sync_mock):
+        nodes, tasks = self._create_nodes_and_tasks(2)
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = self._get_acquire_side_effect(tasks)
+        sync_mock.side_effect = [Exception('boom'), None]
+
+        self.service._sync_power_states(self.context)
+
+        sync_calls = [mock.call(tasks[0]), mock.call(tasks[1])]
         self.assertEqual(sync_calls, sync_mock.call_args_list)
 
+    @mock.patch.object(manager, 'time')
+    def test_pass_timeout(self, time_mock, get_nodeinfo_mock,
+                          mapped_mock, acquire_mock, sync_mock):
+        self.config(sync_power_state_pass_timeout=10, group='conductor')
+        nodes, tasks = self._create_nodes_and_tasks(3)
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = self._get_acquire_side_effect(tasks)
+        # start, 1st node, 2nd node, 3rd node, end of pass
+        time_mock.time.side_effect = [0, 1, 11, 12, 12]
+
+        self.service._sync_power_states(self.context)
+
+        sync_mock.assert_called_once_with(tasks[0])
+
+    def _batch_task(self, node):
+        task = mock.MagicMock(spec_set=['node', 'driver', 'release_resources',
+                                        '__enter__', '__exit__'])
+        task.__enter__.return_value = task
+        task.node = node
+        task.driver = self.driver
+        return task
+
+    def test_batch(self, get_nodeinfo_mock, mapped_mock, acquire_mock,
+                   sync_mock):
+        self.config(sync_power_state_batch_size=2, group='conductor')
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                   driver='fake', driver_info={'host': host})
+                 for i, host in enumerate(['a', 'b', 'a', 'a'], 1)]
+        tasks = dict((n.id, self._batch_task(n)) for n in nodes)
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = lambda context, node_id, **kw: (
+                tasks[node_id])
+        self.driver.power.get_power_endpoint.side_effect = (
+                lambda info: info['host'])
+        self.driver.power.get_power_states.side_effect = (
+                lambda tasks: [states.POWER_ON] * len(tasks))
+
+        self.service._sync_power_states(self.context)
+
+        # nodes 1 and 3 share a batch, nodes 2 and 4 are synced on their own
+        self.assertEqual(
+            [mock.call([tasks[1], tasks[3]])],
+            self.driver.power.get_power_states.call_args_list)
+        self.assertEqual([mock.call(tasks[1], states.POWER_ON),
+                          mock.call(tasks[2]),
+                          mock.call(tasks[3], states.POWER_ON),
+                          mock.call(tasks[4])],
+                         sorted(sync_mock.call_args_list,
+                                key=lambda c: c[0][0].node.id))
+        for node_id in (1, 3):
+            tasks[node_id].release_resources.assert_called_once_with()
+
+    def test_batch_skips_nodes(self, get_nodeinfo_mock, mapped_mock,
+                               acquire_mock, sync_mock):
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                   driver='fake')
+                 for i in range(1, 5)]
+        task = self._batch_task(nodes[0])
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.side_effect = lambda uuid, driver: uuid != nodes[1].uuid
+        acquire_mock.side_effect = [
+                task, exception.NodeLocked(node=3, host='fake'),
+                exception.NodeNotFound(node=4)]
+        self.driver.power.get_power_endpoint.return_value = 'endpoint'
+        self.driver.power.get_power_states.return_value = [states.POWER_OFF]
+
+        self.service._sync_power_states(self.context)
+
+        self.driver.power.get_power_states.assert_called_once_with([task])
+        sync_mock.assert_called_once_with(task, states.POWER_OFF)
+        task.release_resources.assert_called_once_with()
+
+    def test_batch_get_power_states_fails(self, get_nodeinfo_mock,
+                                          mapped_mock, acquire_mock,
+                                          sync_mock):
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                   driver='fake')
+                 for i in range(1, 3)]
+        tasks = [self._batch_task(n) for n in nodes]
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = tasks
+        self.driver.power.get_power_endpoint.return_value = 'endpoint'
+        error = exception.SSHConnectFailed(host='fake')
+        self.driver.power.get_power_states.side_effect = error
+        sync_mock.side_effect = [Exception('boom'), None]
+
+        self.service._sync_power_states(self.context)
+
+        self.assertEqual([mock.call(tasks[0], error),
+                          mock.call(tasks[1], error)],
+                         sync_mock.call_args_list)
+        for task in tasks:
+            task.release_resources.assert_called_once_with()
+
+    def test_batch_get_power_states_length_mismatch(self, get_nodeinfo_mock,
+                                                    mapped_mock,
+                                                    acquire_mock, sync_mock):
+        nodes = [self._create_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                   driver='fake')
+                 for i in range(1, 4)]
+        tasks = [self._batch_task(n) for n in nodes]
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+                nodes)
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = tasks
+        self.driver.power.get_power_endpoint.return_value = 'endpoint'
+        self.driver.power.get_power_states.return_value = [states.POWER_ON]
+
+        self.service._sync_power_states(self.context)
+
+        self.assertEqual([mock.call(task, None) for task in tasks],
+                         sync_mock.call_args_list)
+        for task in tasks:
+            task.release_resources.assert_called_once_with()
+
+
 
 @mock.patch.object(task_manager, 'acquire')
 @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
@@ -1785,9 +2201,15 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn, tests_base.TestCase):
         self.node2 = self._create_node(provision_state=states.DEPLOYWAIT)
         self.task2 = self._create_task(node=self.node2)
 
+        self.hash_ranges = [('fake', 0, 1 << 31)]
+        p = mock.patch.object(self.service, '_get_driver_hash_ranges',
+                              return_value=self.hash_ranges)
+        p.start()
+        self.addCleanup(p.stop)
         self.filters = {'reserved': False, 'maintenance': False,
                         'provisioned_before': 300,
-                        'provision_state': states.DEPLOYWAIT}
+                        'provision_state': states.DEPLOYWAIT,
+                        'driver_hash_ranges': self.hash_ranges}
         self.columns = ['uuid', 'driver']
 
     def _assert_get_nodeinfo_args(self, get_nodeinfo_mock):
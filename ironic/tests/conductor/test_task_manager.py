@@ -54,7 +54,8 @@ class TaskManagerTestCase(tests_base.TestCase):
             self.assertEqual(get_driver_mock.return_value, task.driver)
             self.assertFalse(task.shared)
 
-        reserve_mock.assert_called_once_with(self.host, 'fake-node-id')
+        reserve_mock.assert_called_once_with(self.host, 'fake-node-id',
+                                             filters=None)
         get_ports_mock.assert_called_once_with(self.node.id)
         get_driver_mock.assert_called_once_with(self.node.driver)
         release_mock.assert_called_once_with(self.host, self.node.id)
@@ -72,7 +73,8 @@ class TaskManagerTestCase(tests_base.TestCase):
             self.assertEqual(get_driver_mock.return_value, task.driver)
             self.assertFalse(task.shared)
 
-        reserve_mock.assert_called_once_with(self.host, 'fake-node-id')
+        reserve_mock.assert_called_once_with(self.host, 'fake-node-id',
+                                             filters=None)
         get_ports_mock.assert_called_once_with(self.node.id)
         get_driver_mock.assert_called_once_with('fake-driver')
         release_mock.assert_called_once_with(self.host, self.node.id)
@@ -84,12 +86,13 @@ class TaskManagerTestCase(tests_base.TestCase):
         node2 = mock.Mock(spec_set=objects.Node)
 
         reserve_mock.return_value = self.node
-        get_ports_mock.return_value = mock.sentinel.ports1
+        ports = {self.node.id: mock.sentinel.ports1,
+                 node2.id: mock.sentinel.ports2}
+        get_ports_mock.side_effect = lambda node_id: ports[node_id]
         get_driver_mock.return_value = mock.sentinel.driver1
 
         with task_manager.TaskManager(self.context, 'node-id1') as task:
             reserve_mock.return_value = node2
-            get_ports_mock.return_value = mock.sentinel.ports2
             get_driver_mock.return_value = mock.sentinel.driver2
             with task_manager.TaskManager(self.context, 'node-id2') as task2:
                 self.assertEqual(self.context, task.context)
@@ -103,8 +106,8 @@ class TaskManagerTestCase(tests_base.TestCase):
                 self.assertEqual(mock.sentinel.driver2, task2.driver)
                 self.assertFalse(task2.shared)
 
-        self.assertEqual([mock.call(self.host, 'node-id1'),
-                          mock.call(self.host, 'node-id2')],
+        self.assertEqual([mock.call(self.host, 'node-id1', filters=None),
+                          mock.call(self.host, 'node-id2', filters=None)],
                          reserve_mock.call_args_list)
         self.assertEqual([mock.call(self.node.id), mock.call(node2.id)],
                          get_ports_mock.call_args_list)
@@ -149,27 +152,111 @@ class TaskManagerTestCase(tests_base.TestCase):
                           self.context,
                           'fake-node-id')
 
-        reserve_mock.assert_called_with(self.host, 'fake-node-id')
+        reserve_mock.assert_called_with(self.host, 'fake-node-id',
+                                        filters=None)
         self.assertEqual(retry_attempts, reserve_mock.call_count)
         self.assertFalse(get_ports_mock.called)
         self.assertFalse(get_driver_mock.called)
         self.assertFalse(release_mock.called)
         self.assertFalse(node_get_mock.called)
 
+    def test_excl_lock_reserve_exception_no_retry(self, get_ports_mock,
+                                                  get_driver_mock,
+                                                  reserve_mock, release_mock,
+                                                  node_get_mock):
+        self.config(node_locked_retry_attempts=3, group='conductor')
+        reserve_mock.side_effect = exception.NodeLocked(node='foo',
+                                                        host='foo')
+
+        self.assertRaises(exception.NodeLocked,
+                          task_manager.TaskManager,
+                          self.context,
+                          'fake-node-id',
+                          retry=False)
+
+        self.assertEqual(1, reserve_mock.call_count)
+        self.assertFalse(release_mock.called)
+
+    def test_excl_lock_with_filters(self, get_ports_mock, get_driver_mock,
+                                    reserve_mock, release_mock,
+                                    node_get_mock):
+        reserve_mock.return_value = self.node
+        filters = {'maintenance': False}
+        with task_manager.TaskManager(self.context, 'fake-node-id',
+                                      filters=filters) as task:
+            self.assertEqual(self.node, task.node)
+
+        reserve_mock.assert_called_once_with(self.host, 'fake-node-id',
+                                             filters=filters)
+        release_mock.assert_called_once_with(self.host, self.node.id)
+
+    def test_excl_lock_constraints_not_met(self, get_ports_mock,
+                                           get_driver_mock, reserve_mock,
+                                           release_mock, node_get_mock):
+        self.config(node_locked_retry_attempts=3, group='conductor')
+        reserve_mock.side_effect = exception.NodeConstraintsNotMet(
+                                                            node='foo')
+
+        self.assertRaises(exception.NodeConstraintsNotMet,
+                          task_manager.TaskManager,
+                          self.context,
+                          'fake-node-id',
+                          filters={'maintenance': False})
+
+        self.assertEqual(1, reserve_mock.call_count)
+        self.assertFalse(get_ports_mock.called)
+        self.assertFalse(release_mock.called)
+
+    def test_excl_lock_ports_loaded_once(self, get_ports_mock,
+                                         get_driver_mock, reserve_mock,
+                                         release_mock, node_get_mock):
+        reserve_mock.return_value = self.node
+        with task_manager.TaskManager(self.context, 'fake-node-id') as task:
+            self.assertFalse(get_ports_mock.called)
+            self.assertEqual(get_ports_mock.return_value, task.ports)
+            self.assertEqual(get_ports_mock.return_value, task.ports)
+
+        get_ports_mock.assert_called_once_with(self.node.id)
+        self.assertIsNone(task.ports)
+
+    def test_excl_lock_ports_not_loaded(self, get_ports_mock,
+                                        get_driver_mock, reserve_mock,
+                                        release_mock, node_get_mock):
+        reserve_mock.return_value = self.node
+        stats = task_manager.get_port_query_stats()
+        with task_manager.TaskManager(self.context, 'fake-node-id'):
+            pass
+
+        self.assertFalse(get_ports_mock.called)
+        self.assertEqual({'loaded': stats['loaded'],
+                          'avoided': stats['avoided'] + 1},
+                         task_manager.get_port_query_stats())
+
+    def test_port_query_stats_loaded(self, get_ports_mock,
+                                     get_driver_mock, reserve_mock,
+                                     release_mock, node_get_mock):
+        reserve_mock.return_value = self.node
+        stats = task_manager.get_port_query_stats()
+        with task_manager.TaskManager(self.context, 'fake-node-id') as task:
+            task.ports
+
+        self.assertEqual({'loaded': stats['loaded'] + 1,
+                          'avoided': stats['avoided']},
+                         task_manager.get_port_query_stats())
+
     def test_excl_lock_get_ports_exception(self, get_ports_mock,
                                            get_driver_mock, reserve_mock,
                                            release_mock, node_get_mock):
         reserve_mock.return_value = self.node
         get_ports_mock.side_effect = exception.IronicException('foo')
 
-        self.assertRaises(exception.IronicException,
-                          task_manager.TaskManager,
-                          self.context,
-                          'fake-node-id')
+        with task_manager.TaskManager(self.context, 'fake-node-id') as task:
+            self.assertRaises(exception.IronicException,
+                              getattr, task, 'ports')
 
-        reserve_mock.assert_called_once_with(self.host, 'fake-node-id')
+        reserve_mock.assert_called_once_with(self.host, 'fake-node-id',
+                                             filters=None)
         get_ports_mock.assert_called_once_with(self.node.id)
-        self.assertFalse(get_driver_mock.called)
         release_mock.assert_called_once_with(self.host, self.node.id)
         self.assertFalse(node_get_mock.called)
 
@@ -185,8 +272,9 @@ class TaskManagerTestCase(tests_base.TestCase):
                           self.context,
                           'fake-node-id')
 
-        reserve_mock.assert_called_once_with(self.host, 'fake-node-id')
-        get_ports_mock.assert_called_once_with(self.node.id)
+        reserve_mock.assert_called_once_with(self.host, 'fake-node-id',
+                                             filters=None)
+        self.assertFalse(get_ports_mock.called)
         get_driver_mock.assert_called_once_with(self.node.driver)
         release_mock.assert_called_once_with(self.host, self.node.id)
         self.assertFalse(node_get_mock.called)
@@ -251,17 +339,15 @@ class TaskManagerTestCase(tests_base.TestCase):
         node_get_mock.return_value = self.node
         get_ports_mock.side_effect = exception.IronicException('foo')
 
-        self.assertRaises(exception.IronicException,
-                          task_manager.TaskManager,
-                          self.context,
-                          'fake-node-id',
-                          shared=True)
+        with task_manager.TaskManager(self.context, 'fake-node-id',
+                                      shared=True) as task:
+            self.assertRaises(exception.IronicException,
+                              getattr, task, 'ports')
 
         self.assertFalse(reserve_mock.called)
         self.assertFalse(release_mock.called)
         node_get_mock.assert_called_once_with(self.context, 'fake-node-id')
         get_ports_mock.assert_called_once_with(self.node.id)
-        self.assertFalse(get_driver_mock.called)
 
     def test_shared_lock_get_driver_exception(self, get_ports_mock,
                                               get_driver_mock, reserve_mock,
@@ -279,7 +365,7 @@ class TaskManagerTestCase(tests_base.TestCase):
         self.assertFalse(reserve_mock.called)
         self.assertFalse(release_mock.called)
         node_get_mock.assert_called_once_with(self.context, 'fake-node-id')
-        get_ports_mock.assert_called_once_with(self.node.id)
+        self.assertFalse(get_ports_mock.called)
         get_driver_mock.assert_called_once_with(self.node.driver)
 
     def test_spawn_after(self, get_ports_mock, get_driver_mock,
@@ -49,6 +49,7 @@ from oslo.db.sqlalchemy import utils as db_utils
 import sqlalchemy
 import sqlalchemy.exc
 
+from ironic.common import hash_ring
 from ironic.common import utils
 from ironic.db.sqlalchemy import migration
 from ironic.db.sqlalchemy import models
@@ -317,6 +318,22 @@ class MigrationCheckersMixin(object):
             (sqlalchemy.exc.IntegrityError, exception.DBDuplicateEntry),
             nodes.insert().execute, data)
 
+    def _pre_upgrade_4f399b21ae71(self, engine):
+        nodes = db_utils.get_table(engine, 'nodes')
+        data = {'driver': 'fake', 'uuid': utils.generate_uuid()}
+        nodes.insert().values(data).execute()
+        return data
+
+    def _check_4f399b21ae71(self, engine, data):
+        nodes = db_utils.get_table(engine, 'nodes')
+        col_names = [column.name for column in nodes.c]
+        self.assertIn('uuid_hash', col_names)
+        self.assertIsInstance(nodes.c.uuid_hash.type,
+                              sqlalchemy.types.BigInteger)
+        node = nodes.select(nodes.c.uuid == data['uuid']).execute().first()
+        self.assertEqual(hash_ring.get_hash_key(data['uuid']),
+                         node['uuid_hash'])
+
 
 class TestMigrationsMySQL(MigrationCheckersMixin,
                           WalkVersionsMixin,
@@ -83,6 +83,25 @@ class DbConductorTestCase(base.DbTestCase):
                 self.dbapi.touch_conductor,
                 'bad-hostname')
 
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_get_active_conductor_registrations(self, mock_utcnow):
+        past = datetime.datetime(2000, 1, 1, 0, 0)
+        present = past + datetime.timedelta(minutes=2)
+
+        mock_utcnow.return_value = past
+        self._create_test_cdr(id=1, hostname='host-one', created_at=past,
+                              updated_at=past)
+        mock_utcnow.return_value = present
+        self._create_test_cdr(id=2, hostname='host-two', created_at=present,
+                              updated_at=present)
+
+        self.config(heartbeat_timeout=60, group='conductor')
+        self.assertEqual(set([('host-two', present)]),
+                         self.dbapi.get_active_conductor_registrations())
+        self.assertEqual(set([('host-one', past), ('host-two', present)]),
+                         self.dbapi.get_active_conductor_registrations(
+                                 interval=300))
+
     @mock.patch.object(timeutils, 'utcnow')
     def test_get_active_driver_dict_one_host_no_driver(self, mock_utcnow):
         h = 'fake-host'
@@ -21,6 +21,7 @@ import mock
 import six
 
 from ironic.common import exception
+from ironic.common import hash_ring
 from ironic.common import states
 from ironic.common import utils as ironic_utils
 from ironic.db import api as dbapi
@@ -43,6 +44,11 @@ class DbNodeTestCase(base.DbTestCase):
     def test_create_node(self):
         self._create_test_node()
 
+    def test_create_node_sets_uuid_hash(self):
+        n = self._create_test_node()
+        res = self.dbapi.get_nodeinfo_list(columns=['uuid_hash'])
+        self.assertEqual([(hash_ring.get_hash_key(n['uuid']),)], res)
+
     def test_create_node_nullable_chassis_id(self):
         n = utils.get_test_node()
         del n['chassis_id']
@@ -140,6 +146,17 @@ class DbNodeTestCase(base.DbTestCase):
         res = self.dbapi.get_node_list(filters={'maintenance': False})
         self.assertEqual([1], [r.id for r in res])
 
+    def test_get_nodeinfo_list_provision_state_not_in(self):
+        for i, state in enumerate([states.NOSTATE, states.ACTIVE,
+                                   states.DEPLOYWAIT], 1):
+            n = utils.get_test_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                    provision_state=state)
+            self.dbapi.create_node(n)
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'provision_state_not_in': [states.DEPLOYWAIT]})
+        self.assertEqual([1, 2], sorted(r[0] for r in res))
+
     @mock.patch.object(timeutils, 'utcnow')
     def test_get_nodeinfo_list_provision(self, mock_utcnow):
         past = datetime.datetime(2000, 1, 1, 0, 0)
@@ -168,6 +185,29 @@ class DbNodeTestCase(base.DbTestCase):
                                                     states.DEPLOYWAIT})
         self.assertEqual([2], [r[0] for r in res])
 
+    def test_get_nodeinfo_list_driver_hash_ranges(self):
+        hashes = {}
+        for i in range(1, 11):
+            n = utils.get_test_node(id=i, uuid=ironic_utils.generate_uuid(),
+                                    driver='driver-%d' % (i % 2))
+            self.dbapi.create_node(n)
+            hashes[i] = hash_ring.get_hash_key(n['uuid'])
+
+        ranges = [('driver-0', 0, 3 << 30),
+                  ('driver-1', 1 << 31, 1 << 32)]
+        res = self.dbapi.get_nodeinfo_list(
+                filters={'driver_hash_ranges': ranges})
+        expected = [i for i in hashes
+                    if (i % 2 == 0 and hashes[i] < 3 << 30) or
+                       (i % 2 == 1 and hashes[i] >= 1 << 31)]
+        self.assertEqual(sorted(expected), sorted(r[0] for r in res))
+
+    def test_get_nodeinfo_list_no_driver_hash_ranges(self):
+        self._create_test_node()
+        res = self.dbapi.get_nodeinfo_list(
+                filters={'driver_hash_ranges': []})
+        self.assertEqual([], res)
+
     def test_get_node_list(self):
         uuids = []
         for i in range(1, 6):
@@ -371,6 +411,51 @@ class DbNodeTestCase(base.DbTestCase):
         res = self.dbapi.get_node_by_uuid(uuid)
         self.assertEqual(r1, res.reservation)
 
+    def test_reserve_node_with_filters(self):
+        n = self._create_test_node(provision_state=states.ACTIVE)
+        uuid = n['uuid']
+
+        r1 = 'fake-reservation'
+        self.dbapi.reserve_node(r1, uuid,
+                                filters={'maintenance': False,
+                                         'provision_state_not_in':
+                                             [states.DEPLOYWAIT]})
+
+        res = self.dbapi.get_node_by_uuid(uuid)
+        self.assertEqual(r1, res.reservation)
+
+    def test_reserve_node_nostate_with_filters(self):
+        n = self._create_test_node(provision_state=states.NOSTATE)
+        uuid = n['uuid']
+
+        self.dbapi.reserve_node('fake-reservation', uuid,
+                                filters={'provision_state_not_in':
+                                             [states.DEPLOYWAIT]})
+
+        res = self.dbapi.get_node_by_uuid(uuid)
+        self.assertEqual('fake-reservation', res.reservation)
+
+    def test_reserve_node_constraints_not_met(self):
+        n = self._create_test_node(provision_state=states.DEPLOYWAIT)
+        uuid = n['uuid']
+
+        self.assertRaises(exception.NodeConstraintsNotMet,
+                          self.dbapi.reserve_node, 'fake-reservation', uuid,
+                          filters={'provision_state_not_in':
+                                       [states.DEPLOYWAIT]})
+
+        res = self.dbapi.get_node_by_uuid(uuid)
+        self.assertIsNone(res.reservation)
+
+    def test_reserve_node_locked_with_filters(self):
+        n = self._create_test_node()
+        uuid = n['uuid']
+
+        self.dbapi.reserve_node('r1', uuid)
+        self.assertRaises(exception.NodeLocked,
+                          self.dbapi.reserve_node, 'r2', uuid,
+                          filters={'maintenance': True})
+
     def test_release_reservation(self):
         n = self._create_test_node()
         uuid = n['uuid']
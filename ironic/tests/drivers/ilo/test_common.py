@@ -15,6 +15,9 @@
 
 """Test class for common methods used by iLO modules."""
 
+import time
+
+import fixtures
 import mock
 
 from oslo.config import cfg
@@ -41,6 +44,8 @@ class IloCommonMethodsTestCase(base.TestCase):
         super(IloCommonMethodsTestCase, self).setUp()
         self.dbapi = dbapi.get_instance()
         self.context = context.get_admin_context()
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.ilo.common._ILO_OBJECTS', {}))
 
     def test_parse_driver_info(self):
         node = obj_utils.create_test_node(self.context,
@@ -125,6 +130,46 @@ class IloCommonMethodsTestCase(base.TestCase):
             info['client_port'])
         self.assertEqual('ilo_object', returned_ilo_object)
 
+    @mock.patch.object(ilo_common, 'ilo_client')
+    def test_get_ilo_object_cached(self, ilo_client_mock):
+        node = obj_utils.create_test_node(self.context,
+                                          driver='ilo',
+                                          driver_info=INFO_DICT)
+        ilo_client_mock.IloClient.side_effect = ['ilo_object1',
+                                                 'ilo_object2']
+
+        self.assertEqual('ilo_object1', ilo_common.get_ilo_object(node))
+        self.assertEqual('ilo_object1', ilo_common.get_ilo_object(node))
+        node.driver_info['ilo_password'] = 'new'
+        self.assertEqual('ilo_object2', ilo_common.get_ilo_object(node))
+        self.assertEqual(2, ilo_client_mock.IloClient.call_count)
+
+    @mock.patch.object(time, 'time')
+    @mock.patch.object(ilo_common, 'ilo_client')
+    def test_get_ilo_object_expired(self, ilo_client_mock, time_mock):
+        node = obj_utils.create_test_node(self.context,
+                                          driver='ilo',
+                                          driver_info=INFO_DICT)
+        other_node = obj_utils.create_test_node(
+                self.context, id=2,
+                uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c781',
+                driver='ilo', driver_info=INFO_DICT)
+        ilo_client_mock.IloClient.side_effect = ['ilo_object1',
+                                                 'ilo_object2',
+                                                 'ilo_object3']
+        ttl = ilo_common._ILO_OBJECT_TTL
+
+        time_mock.return_value = 1000
+        self.assertEqual('ilo_object1', ilo_common.get_ilo_object(node))
+        time_mock.return_value = 1000 + ttl - 1
+        self.assertEqual('ilo_object1', ilo_common.get_ilo_object(node))
+        self.assertEqual('ilo_object2',
+                         ilo_common.get_ilo_object(other_node))
+        time_mock.return_value = 1000 + 3 * ttl
+        self.assertEqual('ilo_object3', ilo_common.get_ilo_object(node))
+        # the unused object of the other node was dropped
+        self.assertEqual([node.uuid], list(ilo_common._ILO_OBJECTS))
+
     @mock.patch.object(ilo_common, 'ilo_client')
     def test_get_ilo_license(self, ilo_client_mock):
         node = obj_utils.create_test_node(self.context,
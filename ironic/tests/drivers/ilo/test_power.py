@@ -15,6 +15,9 @@
 
 """Test class for IloPower module."""
 
+import time
+
+import fixtures
 import mock
 from oslo.config import cfg
 
@@ -53,7 +56,12 @@ class IloPowerInternalMethodsTestCase(base.TestCase):
         self.node = self.dbapi.create_node(n)
         self.context = context.get_admin_context()
         CONF.set_override('power_retry', 2, 'ilo')
-        CONF.set_override('power_wait', 0, 'ilo')
+        CONF.set_override('power_wait', 2, 'ilo')
+        sleep_patcher = mock.patch.object(time, 'sleep')
+        self.sleep_mock = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.ilo.common._ILO_OBJECTS', {}))
 
     def test__get_power_state(self, power_ilo_client_mock,
                               common_ilo_client_mock):
@@ -135,6 +143,62 @@ class IloPowerInternalMethodsTestCase(base.TestCase):
         ilo_power._set_power_state(self.node, target_state)
         ilo_mock_object.get_host_power_status.assert_called_with()
         ilo_mock_object.set_host_power.assert_called_once_with('ON')
+        # the first check comes after a second, not after power_wait
+        self.assertTrue(self.sleep_mock.call_args_list[0][0][0] < 2)
+
+    def test__get_power_states(self, power_ilo_client_mock,
+                               common_ilo_client_mock):
+        power_ilo_client_mock.IloError = Exception
+        other = self.dbapi.create_node(db_utils.get_test_node(
+            id=2, uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c782',
+            driver='ilo', driver_info=dict(INFO_DICT, ilo_address='1.2.3.5')))
+        ilo_objects = {}
+
+        def _ilo_object(address, *args):
+            ilo_object = ilo_objects[address] = mock.Mock()
+            ilo_object.get_host_power_status.return_value = 'ON'
+            return ilo_object
+
+        common_ilo_client_mock.IloClient.side_effect = _ilo_object
+
+        pstates = ilo_power._get_power_states([self.node, other])
+
+        self.assertEqual([states.POWER_ON, states.POWER_ON], pstates)
+        self.assertEqual(2, len(ilo_objects))
+
+    def test__get_power_states_fail(self, power_ilo_client_mock,
+                                    common_ilo_client_mock):
+        power_ilo_client_mock.IloError = Exception
+        ilo_mock_object = common_ilo_client_mock.IloClient.return_value
+        ilo_mock_object.get_host_power_status.side_effect = [Exception()]
+
+        pstates = ilo_power._get_power_states([self.node])
+
+        self.assertIsInstance(pstates[0], exception.IloOperationError)
+
+    def test__wait_for_state_change_timeout(self, power_ilo_client_mock,
+                                            common_ilo_client_mock):
+        ilo_mock_object = common_ilo_client_mock.IloClient.return_value
+        ilo_mock_object.get_host_power_status.return_value = 'OFF'
+
+        state = ilo_power._wait_for_state_change(self.node, states.POWER_ON)
+
+        self.assertEqual(states.ERROR, state)
+        slept = sum(c[0][0] for c in self.sleep_mock.call_args_list)
+        self.assertAlmostEqual(4, slept)
+        for call in self.sleep_mock.call_args_list:
+            self.assertTrue(call[0][0] <= 2 * 1.1)
+
+    def test__wait_for_state_change_reboot(self, power_ilo_client_mock,
+                                           common_ilo_client_mock):
+        ilo_mock_object = common_ilo_client_mock.IloClient.return_value
+        ilo_mock_object.get_host_power_status.side_effect = ['ON', 'ON']
+
+        state = ilo_power._wait_for_state_change(self.node, states.POWER_ON,
+                                                 reboot=True)
+
+        self.assertEqual(states.POWER_ON, state)
+        self.assertEqual(2, ilo_mock_object.get_host_power_status.call_count)
 
 
 class IloPowerTestCase(base.TestCase):
@@ -181,6 +245,19 @@ class IloPowerTestCase(base.TestCase):
                              task.driver.power.get_power_state(task))
             mock_get_power.assert_called_once_with(task.node)
 
+    @mock.patch.object(ilo_power, '_get_power_states')
+    def test_get_power_states(self, mock_get_power_states):
+        with task_manager.acquire(self.context, self.node.uuid,
+                                  shared=True) as task:
+            mock_get_power_states.return_value = [states.POWER_ON]
+            self.assertEqual([states.POWER_ON],
+                             task.driver.power.get_power_states([task]))
+            mock_get_power_states.assert_called_once_with([task.node])
+            self.assertEqual(
+                task.driver.power.get_power_endpoint(INFO_DICT),
+                task.driver.power.get_power_endpoint(
+                    dict(INFO_DICT, ilo_address='1.2.3.5')))
+
     @mock.patch.object(ilo_power, '_set_power_state')
     def test_set_power_state(self, mock_set_power):
         with task_manager.acquire(self.context, self.node.uuid,
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import tempfile
+
 import mock
 from oslo.config import cfg
 
@@ -21,6 +23,7 @@ from ironic.common import pxe_utils
 from ironic.common import states
 from ironic.conductor import task_manager
 from ironic.drivers.modules import agent
+from ironic.drivers.modules import image_cache
 from ironic import objects
 from ironic.openstack.common import context
 from ironic.tests.conductor import utils as mgr_utils
@@ -89,6 +92,14 @@ class TestAgentDeploy(db_base.DbTestCase):
             update_neutron_mock.assert_called_once_with(
                 task, CONF.agent.agent_pxe_bootfile_name)
 
+    def test_image_cache_eviction_policy(self):
+        self.config(image_cache_eviction_policy='lfu', group='pxe')
+        self.config(tftp_master_path=tempfile.mkdtemp(), group='pxe')
+
+        cache = agent.AgentTFTPImageCache()
+
+        self.assertIsInstance(cache._policy, image_cache.LFUPolicy)
+
 
 class TestAgentVendor(db_base.DbTestCase):
     def setUp(self):
@@ -68,6 +68,15 @@ class FakeDriverTestCase(base.TestCase):
         self.driver.power.set_power_state(self.task, states.POWER_ON)
         self.driver.power.reboot(self.task)
 
+    def test_power_interface_get_power_states(self):
+        self.assertIsNone(self.driver.power.get_power_endpoint({}))
+        error = exception.NodeNotFound(node='fake')
+        with mock.patch.object(self.driver.power, 'get_power_state',
+                               side_effect=[states.POWER_ON, error]):
+            self.assertEqual([states.POWER_ON, error],
+                             self.driver.power.get_power_states([self.task,
+                                                                 self.task]))
+
     def test_deploy_interface(self):
         self.assertEqual({}, self.driver.deploy.get_properties())
         self.driver.deploy.validate(None)
@@ -16,15 +16,19 @@
 
 """Tests for ImageCache class and helper functions."""
 
-import mock
 import os
 import tempfile
 import time
 
+import eventlet
+import fixtures
+import mock
+
 from ironic.common import exception
 from ironic.common import images
 from ironic.common import utils
 from ironic.drivers.modules import image_cache
+from ironic.openstack.common import jsonutils
 from ironic.tests import base
 
 
@@ -37,8 +41,16 @@ class TestImageCacheFetch(base.TestCase):
 
     def setUp(self):
         super(TestImageCacheFetch, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.image_cache._INDEXES', {}))
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.image_cache._DOWNLOADS', {}))
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.image_cache._DOWNLOAD_SLOTS', {}))
         self.master_dir = tempfile.mkdtemp()
-        self.cache = image_cache.ImageCache(self.master_dir, None, None)
+        self.cache = image_cache.ImageCache(self.master_dir,
+                                            cache_size=10,
+                                            cache_ttl=600)
         self.dest_dir = tempfile.mkdtemp()
         self.dest_path = os.path.join(self.dest_dir, 'dest')
         self.uuid = 'uuid'
@@ -77,6 +89,11 @@ class TestImageCacheFetch(base.TestCase):
         self.assertEqual(os.stat(self.dest_path).st_ino,
                          os.stat(self.master_path).st_ino)
         self.assertFalse(mock_clean_up.called)
+        self.assertEqual(2, self.cache._get_index().get(self.uuid)['nlink'])
+        self.assertEqual({'hits': 1, 'misses': 0, 'evictions': 0,
+                          'downloads': 0, 'download_time': 0, 'waits': 0,
+                          'wait_time': 0, 'images': 1, 'size': 0},
+                         self.cache.get_stats())
 
     @mock.patch.object(image_cache.ImageCache, 'clean_up')
     @mock.patch.object(image_cache.ImageCache, '_download_image')
@@ -86,7 +103,106 @@ class TestImageCacheFetch(base.TestCase):
         self.assertFalse(mock_fetch_to_raw.called)
         mock_download.assert_called_once_with(
             self.uuid, self.master_path, self.dest_path, ctx=None)
-        self.assertTrue(mock_clean_up.called)
+        self.assertFalse(mock_clean_up.called)
+        self.assertEqual(1, self.cache.get_stats()['misses'])
+
+    @mock.patch.object(image_cache.ImageCache, 'clean_up')
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_above_high_water_mark(self, mock_download,
+                                               mock_clean_up,
+                                               mock_fetch_to_raw):
+        self.config(image_cache_high_water_mark=1.5)
+        index = self.cache._get_index()
+        index.add('other', 11)
+        mock_download.side_effect = lambda *args, **kwargs: index.add(
+            self.uuid, 5)
+
+        self.cache.fetch_image(self.uuid, self.dest_path)
+
+        mock_clean_up.assert_called_once_with()
+
+    def _fake_download(self, events=None, error=None):
+        def _download(uuid, master_path, dest_path, ctx=None):
+            if events is not None:
+                events.append(uuid + ' start')
+            eventlet.sleep(0)
+            if events is not None:
+                events.append(uuid + ' end')
+            if error is not None:
+                raise error
+            touch(master_path)
+            os.link(master_path, dest_path)
+            self.cache._get_index().add(uuid, 0, nlink=2)
+        return _download
+
+    def _fetch_concurrently(self, requests):
+        threads = [eventlet.spawn(self.cache.fetch_image, uuid,
+                                  os.path.join(self.dest_dir, dest))
+                   for uuid, dest in requests]
+        results = []
+        for thread in threads:
+            try:
+                results.append(thread.wait())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_single_flight(self, mock_download,
+                                       mock_fetch_to_raw):
+        mock_download.side_effect = self._fake_download()
+
+        self._fetch_concurrently([(self.uuid, 'dest%d' % i)
+                                  for i in range(3)])
+
+        self.assertEqual(1, mock_download.call_count)
+        for i in range(3):
+            dest_path = os.path.join(self.dest_dir, 'dest%d' % i)
+            self.assertEqual(os.stat(dest_path).st_ino,
+                             os.stat(self.master_path).st_ino)
+        stats = self.cache.get_stats()
+        self.assertEqual((1, 1, 2, 2),
+                         (stats['misses'], stats['downloads'],
+                          stats['waits'], stats['hits']))
+        self.assertEqual({}, image_cache._DOWNLOADS)
+
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_single_flight_fail(self, mock_download,
+                                            mock_fetch_to_raw):
+        error = exception.ImageUnacceptable(image_id=self.uuid,
+                                            reason='boom')
+        mock_download.side_effect = self._fake_download(error=error)
+
+        results = self._fetch_concurrently([(self.uuid, 'dest1'),
+                                            (self.uuid, 'dest2')])
+
+        self.assertEqual([error, error], results)
+        self.assertEqual(1, mock_download.call_count)
+        self.assertEqual({}, image_cache._DOWNLOADS)
+
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_one_download_at_a_time(self, mock_download,
+                                                mock_fetch_to_raw):
+        events = []
+        mock_download.side_effect = self._fake_download(events)
+
+        self._fetch_concurrently([('a', 'dest1'), ('b', 'dest2')])
+
+        self.assertEqual(['a start', 'a end', 'b start', 'b end'], events)
+
+    @mock.patch.object(image_cache.ImageCache, '_download_image')
+    def test_fetch_image_parallel_downloads(self, mock_download,
+                                            mock_fetch_to_raw):
+        self.config(parallel_image_downloads=True,
+                    max_concurrent_image_downloads=2)
+        events = []
+        mock_download.side_effect = self._fake_download(events)
+
+        self._fetch_concurrently([('a', 'dest1'), ('b', 'dest2'),
+                                  ('c', 'dest3')])
+
+        self.assertEqual(['a start', 'b start'], events[:2])
+        self.assertTrue(events.index('c start') > events.index('a end'))
 
     def test__download_image(self, mock_fetch_to_raw):
         def _fake_fetch_to_raw(ctx, uuid, tmp_path, *args):
@@ -95,6 +211,7 @@ class TestImageCacheFetch(base.TestCase):
             self.assertNotEqual(os.path.dirname(tmp_path), self.master_dir)
             with open(tmp_path, 'w') as fp:
                 fp.write("TEST")
+            return 'checksum'
 
         mock_fetch_to_raw.side_effect = _fake_fetch_to_raw
         self.cache._download_image(self.uuid, self.master_path, self.dest_path)
@@ -104,61 +221,221 @@ class TestImageCacheFetch(base.TestCase):
                          os.stat(self.master_path).st_ino)
         with open(self.dest_path) as fp:
             self.assertEqual("TEST", fp.read())
+        entry = self.cache._get_index().get(self.uuid)
+        self.assertEqual(4, entry['size'])
+        self.assertEqual('checksum', entry['checksum'])
+
+
+class TestCacheIndex(base.TestCase):
+
+    def setUp(self):
+        super(TestCacheIndex, self).setUp()
+        self.master_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.master_dir,
+                                       image_cache.INDEX_FILE)
+
+    def _write(self, name, data='123'):
+        with open(os.path.join(self.master_dir, name), 'w') as fp:
+            fp.write(data)
+
+    def test_load_from_directory(self):
+        self._write('new', '12345')
+        self._write('old')
+        future = int(time.time()) + 100
+        os.utime(os.path.join(self.master_dir, 'new'), (future, future))
+        os.mkdir(os.path.join(self.master_dir, 'tmpdir'))
+
+        index = image_cache._CacheIndex(self.master_dir)
+
+        self.assertEqual(['old', 'new'], [name for name, entry in index])
+        self.assertEqual(8, index.total_size)
+        self.assertEqual(future, index.get('new')['last_used'])
+        self.assertTrue(os.path.exists(self.index_path))
+
+    def test_persisted(self):
+        self._write('image')
+        index = image_cache._CacheIndex(self.master_dir)
+        index.add('image', 3, checksum='abc')
+
+        index = image_cache._CacheIndex(self.master_dir)
+
+        self.assertEqual({'size': 3, 'nlink': 1, 'checksum': 'abc',
+                          'uses': 1, 'clock': 0, 'last_used': mock.ANY},
+                         index.get('image'))
+
+    def test_load_reconciles(self):
+        self._write('image')
+        self._write('changed')
+        self._write('unknown')
+        entry = {'size': 3, 'last_used': 1, 'nlink': 1, 'checksum': 'abc'}
+        with open(self.index_path, 'w') as fp:
+            fp.write(jsonutils.dumps({'entries': [
+                ['image', entry], ['deleted', entry],
+                ['changed', dict(entry, size=100)]]}))
+
+        index = image_cache._CacheIndex(self.master_dir)
+
+        self.assertEqual(['image', 'changed', 'unknown'],
+                         [name for name, entry in index])
+        self.assertEqual('abc', index.get('image')['checksum'])
+        self.assertIsNone(index.get('changed')['checksum'])
+        self.assertEqual(9, index.total_size)
+
+    @mock.patch.object(image_cache.LOG, 'warn')
+    def test_load_invalid(self, mock_log):
+        self._write('image')
+        with open(self.index_path, 'w') as fp:
+            fp.write('garbage')
+
+        index = image_cache._CacheIndex(self.master_dir)
+
+        self.assertEqual(['image'], [name for name, entry in index])
+        self.assertTrue(mock_log.called)
+
+    def test_load_file_deleted_while_listing(self):
+        self._write('image')
+        real_listdir = os.listdir
+
+        def _listdir(path):
+            return real_listdir(path) + ['deleted']
+
+        with mock.patch.object(os, 'listdir', _listdir):
+            index = image_cache._CacheIndex(self.master_dir)
+
+        self.assertEqual(['image'], [name for name, entry in index])
+
+    @mock.patch.object(image_cache.LOG, 'warn')
+    def test_load_index_replaced(self, mock_log):
+        self._write('image')
+        os.mkdir(self.index_path)
+        self.addCleanup(os.rmdir, self.index_path)
+
+        index = image_cache._CacheIndex(self.master_dir)
+
+        self.assertEqual(['image'], [name for name, entry in index])
+        self.assertTrue(mock_log.called)
+
+    def test_ordered_partial_iteration(self):
+        index = image_cache._CacheIndex(self.master_dir)
+        for name, size in (('a', 3), ('b', 1), ('c', 2)):
+            index.add(name, size)
+
+        def by_size(entry):
+            return entry['size']
+
+        order = index.ordered('size', by_size)
+        self.assertEqual('b', next(order)[0])
+        self.assertEqual('c', next(order)[0])
+        order.close()
+
+        index.remove(['c'])
+        index.add('d', 0)
+        self.assertEqual(['d', 'b', 'a'],
+                         [name for name, entry in
+                          index.ordered('size', by_size)])
+
+    def test_ordered_updated_on_touch(self):
+        self._write('a')
+        self._write('b')
+        index = image_cache._CacheIndex(self.master_dir)
+        first, second = [name for name, entry in index]
+
+        index.touch(first)
+
+        self.assertEqual([second, first], [name for name, entry in index])
+        self.assertEqual([second, first], [name for name, entry in index])
+
+    def test_touch(self):
+        self._write('a')
+        self._write('b')
+        index = image_cache._CacheIndex(self.master_dir)
+        first = next(iter(index))[0]
+
+        index.touch(first)
+
+        self.assertEqual(first, list(index)[-1][0])
+        self.assertEqual(2, index.get(first)['nlink'])
+        self.assertEqual(2, index.get(first)['uses'])
+
+    @mock.patch.object(image_cache._CacheIndex, 'save')
+    def test_touch_saved_periodically(self, mock_save):
+        self._write('a')
+        index = image_cache._CacheIndex(self.master_dir)
+        index._saved_at = time.time()
+        mock_save.reset_mock()
+
+        index.touch('a')
+        self.assertFalse(mock_save.called)
+
+        index._saved_at -= image_cache.INDEX_SAVE_INTERVAL
+        index.touch('a')
+        mock_save.assert_called_once_with()
+
+    def test_remove_saves_uses(self):
+        self._write('a')
+        index = image_cache._CacheIndex(self.master_dir)
+        index.touch('a')
+
+        index.remove([])
+
+        index = image_cache._CacheIndex(self.master_dir)
+        self.assertEqual(2, index.get('a')['uses'])
+
+    def test_remove(self):
+        index = image_cache._CacheIndex(self.master_dir)
+        index.add('a', 3)
+        index.add('b', 4)
+
+        index.remove(['a', 'unknown'])
+
+        self.assertEqual(['b'], [name for name, entry in index])
+        self.assertEqual(4, index.total_size)
 
 
 class TestImageCacheCleanUp(base.TestCase):
 
     def setUp(self):
         super(TestImageCacheCleanUp, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.image_cache._INDEXES', {}))
         self.master_dir = tempfile.mkdtemp()
         self.cache = image_cache.ImageCache(self.master_dir,
                                             cache_size=10,
                                             cache_ttl=600)
 
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size')
-    def test_clean_up_old_deleted(self, mock_clean_size):
-        mock_clean_size.return_value = None
+    def _create_files(self, count, data='123'):
         files = [os.path.join(self.master_dir, str(i))
-                 for i in range(2)]
+                 for i in range(count)]
         for filename in files:
-            touch(filename)
+            with open(filename, 'w') as fp:
+                fp.write(data)
+        return files
+
+    def test_clean_up_old_deleted(self):
+        files = self._create_files(2, data='')
         # NOTE(dtantsur): Can't alter ctime, have to set mtime to the future
         new_current_time = time.time() + 900
         os.utime(files[0], (new_current_time - 100, new_current_time - 100))
         with mock.patch.object(time, 'time', lambda: new_current_time):
             self.cache.clean_up()
 
-        mock_clean_size.assert_called_once_with(mock.ANY, None)
-        survived = mock_clean_size.call_args[0][0]
-        self.assertEqual(1, len(survived))
-        self.assertEqual(files[0], survived[0][0])
-        # NOTE(dtantsur): do not compare milliseconds
-        self.assertEqual(int(new_current_time - 100), int(survived[0][1]))
-        self.assertEqual(int(new_current_time - 100),
-                         int(survived[0][2].st_mtime))
-
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size')
-    def test_clean_up_old_with_amount(self, mock_clean_size):
-        files = [os.path.join(self.master_dir, str(i))
-                 for i in range(2)]
-        for filename in files:
-            open(filename, 'wb').write('X')
+        self.assertTrue(os.path.exists(files[0]))
+        self.assertFalse(os.path.exists(files[1]))
+        self.assertEqual(['0'], [n for n, e in self.cache._get_index()])
+
+    def test_clean_up_old_with_amount(self):
+        files = self._create_files(2, data='X')
         new_current_time = time.time() + 900
         with mock.patch.object(time, 'time', lambda: new_current_time):
             self.cache.clean_up(amount=1)
 
-        self.assertFalse(mock_clean_size.called)
         # Exactly one file is expected to be deleted
         self.assertTrue(any(os.path.exists(f) for f in files))
         self.assertFalse(all(os.path.exists(f) for f in files))
 
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size')
-    def test_clean_up_files_with_links_untouched(self, mock_clean_size):
-        mock_clean_size.return_value = None
-        files = [os.path.join(self.master_dir, str(i))
-                 for i in range(2)]
+    def test_clean_up_files_with_links_untouched(self):
+        files = self._create_files(2, data='')
         for filename in files:
-            touch(filename)
             os.link(filename, filename + 'copy')
 
         new_current_time = time.time() + 900
@@ -167,18 +444,11 @@ class TestImageCacheCleanUp(base.TestCase):
 
         for filename in files:
             self.assertTrue(os.path.exists(filename))
-        mock_clean_size.assert_called_once_with([], None)
 
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_too_old')
-    def test_clean_up_ensure_cache_size(self, mock_clean_ttl):
-        mock_clean_ttl.side_effect = lambda *xx: xx
+    def test_clean_up_ensure_cache_size(self):
         # NOTE(dtantsur): Cache size in test is 10 bytes, we create 6 files
         # with 3 bytes each and expect 3 to be deleted
-        files = [os.path.join(self.master_dir, str(i))
-                 for i in range(6)]
-        for filename in files:
-            with open(filename, 'w') as fp:
-                fp.write('123')
+        files = self._create_files(6)
         # NOTE(dtantsur): Make 3 files 'newer' to check that
         # old ones are deleted first
         new_current_time = time.time() + 100
@@ -192,19 +462,12 @@ class TestImageCacheCleanUp(base.TestCase):
             self.assertTrue(os.path.exists(filename))
         for filename in files[3:]:
             self.assertFalse(os.path.exists(filename))
+        self.assertEqual(9, self.cache._get_index().total_size)
 
-        mock_clean_ttl.assert_called_once_with(mock.ANY, None)
-
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_too_old')
-    def test_clean_up_ensure_cache_size_with_amount(self, mock_clean_ttl):
-        mock_clean_ttl.side_effect = lambda *xx: xx
+    def test_clean_up_ensure_cache_size_with_amount(self):
         # NOTE(dtantsur): Cache size in test is 10 bytes, we create 6 files
         # with 3 bytes each and set amount to be 15, 5 files are to be deleted
-        files = [os.path.join(self.master_dir, str(i))
-                 for i in range(6)]
-        for filename in files:
-            with open(filename, 'w') as fp:
-                fp.write('123')
+        files = self._create_files(6)
         # NOTE(dtantsur): Make 1 file 'newer' to check that
         # old ones are deleted first
         new_current_time = time.time() + 100
@@ -214,22 +477,36 @@ class TestImageCacheCleanUp(base.TestCase):
             self.cache.clean_up(amount=15)
 
         self.assertTrue(os.path.exists(files[0]))
-        for filename in files[5:]:
+        for filename in files[1:]:
             self.assertFalse(os.path.exists(filename))
 
-        mock_clean_ttl.assert_called_once_with(mock.ANY, 15)
+    def test_clean_up_stats_only_candidates(self):
+        self._create_files(6)
+        self.cache._get_index()
+
+        with mock.patch.object(os, 'stat', wraps=os.stat) as mock_stat:
+            self.cache.clean_up()
+
+        # NOTE: 3 of 6 files have to be deleted to fit in 10 bytes
+        self.assertEqual(3, mock_stat.call_count)
+
+    def test_clean_up_file_missing(self):
+        files = self._create_files(2)
+        index = self.cache._get_index()
+        os.unlink(files[0])
+
+        self.cache.clean_up(amount=6)
+
+        self.assertFalse(os.path.exists(files[1]))
+        self.assertEqual([], list(index))
+        self.assertEqual(0, index.total_size)
 
     @mock.patch.object(image_cache.LOG, 'info')
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_too_old')
-    def test_clean_up_cache_still_large(self, mock_clean_ttl, mock_log):
-        mock_clean_ttl.side_effect = lambda *xx: xx
-        # NOTE(dtantsur): Cache size in test is 10 bytes, we create 2 files
+    def test_clean_up_cache_still_large(self, mock_log):
+        # NOTE(dtantsur): Cache size in test is 10 bytes, we create 4 files
         # than cannot be deleted and expected this to be logged
-        files = [os.path.join(self.master_dir, str(i))
-                 for i in range(2)]
+        files = self._create_files(4)
         for filename in files:
-            with open(filename, 'w') as fp:
-                fp.write('123')
             os.link(filename, filename + 'copy')
 
         self.cache.clean_up()
@@ -237,7 +514,6 @@ class TestImageCacheCleanUp(base.TestCase):
         for filename in files:
             self.assertTrue(os.path.exists(filename))
         self.assertTrue(mock_log.called)
-        mock_clean_ttl.assert_called_once_with(mock.ANY, None)
 
     @mock.patch.object(utils, 'rmtree_without_raise')
     @mock.patch.object(images, 'fetch_to_raw')
@@ -266,11 +542,106 @@ class TestImageCacheCleanUp(base.TestCase):
         self.assertTrue(mock_rmtree.called)
 
     @mock.patch.object(image_cache.LOG, 'warn')
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_too_old')
-    @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size')
-    def test_clean_up_amount_not_satisfied(self, mock_clean_size,
-                                           mock_clean_ttl, mock_log):
-        mock_clean_ttl.side_effect = lambda *xx: xx
-        mock_clean_size.side_effect = lambda listing, amount: amount
+    def test_clean_up_amount_not_satisfied(self, mock_log):
+        files = self._create_files(2)
+        os.link(files[0], files[0] + 'copy')
         self.cache.clean_up(amount=15)
+        self.assertFalse(os.path.exists(files[1]))
         self.assertTrue(mock_log.called)
+
+
+class TestEvictionPolicies(base.TestCase):
+
+    def setUp(self):
+        super(TestEvictionPolicies, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.image_cache._INDEXES', {}))
+        self.master_dir = tempfile.mkdtemp()
+
+    def _cache(self, policy, cache_size=10):
+        return image_cache.ImageCache(self.master_dir,
+                                      cache_size=cache_size,
+                                      cache_ttl=600,
+                                      eviction_policy=policy)
+
+    def _add(self, index, name, size, uses=1):
+        with open(os.path.join(self.master_dir, name), 'w') as fp:
+            fp.write('X' * size)
+        index.add(name, size)
+        for i in range(uses - 1):
+            index.touch(name)
+
+    def _fill(self, cache):
+        index = cache._get_index()
+        # NOTE: from the least to the most recently used: a small image
+        # used often, a large image used once and a small one used once
+        self._add(index, 'kernel', 2, uses=5)
+        self._add(index, 'large', 8)
+        self._add(index, 'small', 2)
+        return index
+
+    def test_order_lru(self):
+        index = self._fill(self._cache('lru'))
+        self.assertEqual(['kernel', 'large', 'small'],
+                         [n for n, e in image_cache.LRUPolicy().order(index)])
+
+    def test_order_lfu(self):
+        index = self._fill(self._cache('lfu'))
+        self.assertEqual(['large', 'small', 'kernel'],
+                         [n for n, e in image_cache.LFUPolicy().order(index)])
+
+    def test_order_gdsf(self):
+        index = self._fill(self._cache('gdsf'))
+        self.assertEqual(['large', 'small', 'kernel'],
+                         [n for n, e in image_cache.GDSFPolicy().order(index)])
+
+    def test_gdsf_clock(self):
+        policy = image_cache.GDSFPolicy()
+        index = self._fill(self._cache('gdsf'))
+
+        policy.evicted(index, index.get('large'))
+        self._add(index, 'new', 8)
+
+        self.assertEqual(1.0 / 8, index.clock)
+        self.assertEqual(['large', 'new', 'small', 'kernel'],
+                         [n for n, e in policy.order(index)])
+
+    def test_clean_up_lru(self):
+        cache = self._cache('lru')
+        self._fill(cache)
+
+        cache.clean_up()
+
+        self.assertEqual(['large', 'small'],
+                         [n for n, e in cache._get_index()])
+
+    def test_clean_up_gdsf(self):
+        cache = self._cache('gdsf')
+        index = self._fill(cache)
+
+        cache.clean_up()
+
+        self.assertEqual(['kernel', 'small'], [n for n, e in index])
+        self.assertEqual(1.0 / 8, index.clock)
+        self.assertEqual(1, cache.get_stats()['evictions'])
+        self.assertEqual(2, cache.get_stats()['images'])
+        self.assertEqual(4, cache.get_stats()['size'])
+
+    def test_clean_up_expired_first(self):
+        cache = self._cache('lfu', cache_size=100)
+        index = self._fill(cache)
+        index.get('kernel')['last_used'] -= 900
+
+        cache.clean_up()
+
+        self.assertEqual(['large', 'small'], [n for n, e in index])
+
+    def test_policy_persisted(self):
+        cache = self._cache('gdsf')
+        self._fill(cache)
+        cache.clean_up()
+
+        index = image_cache._CacheIndex(self.master_dir)
+
+        self.assertEqual(1.0 / 8, index.clock)
+        self.assertEqual(5, index.get('kernel')['uses'])
@@ -0,0 +1,200 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Test class for the BMC command scheduler."""
+
+import time
+
+import eventlet
+from eventlet import event
+import mock
+
+from ironic.drivers.modules import ipmi_scheduler
+from ironic.tests import base
+
+
+@mock.patch.object(time, 'sleep')
+class SchedulerTestCase(base.TestCase):
+
+    def setUp(self):
+        super(SchedulerTestCase, self).setUp()
+        self.config(min_command_interval=5, retry_timeout=60, group='ipmi')
+        self.scheduler = ipmi_scheduler.Scheduler()
+
+    def _fail(self):
+        raise ValueError('boom')
+
+    def test_execute(self, mock_sleep):
+        self.assertEqual('out', self.scheduler.execute('1.2.3.4',
+                                                       lambda: 'out'))
+        self.assertFalse(mock_sleep.called)
+
+    def test_execute_waits_interval(self, mock_sleep):
+        self.scheduler.execute('1.2.3.4', lambda: None)
+        self.scheduler.execute('1.2.3.4', lambda: None)
+
+        self.assertEqual(1, mock_sleep.call_count)
+        self.assertAlmostEqual(5, mock_sleep.call_args[0][0], delta=1)
+
+    def test_execute_diff_address(self, mock_sleep):
+        self.scheduler.execute('1.2.3.4', lambda: None)
+        self.scheduler.execute('1.2.3.5', lambda: None)
+
+        self.assertFalse(mock_sleep.called)
+
+    def test_execute_waits_after_failure(self, mock_sleep):
+        self.assertRaises(ValueError, self.scheduler.execute, '1.2.3.4',
+                          self._fail)
+        self.scheduler.execute('1.2.3.4', lambda: None)
+
+        self.assertTrue(mock_sleep.called)
+
+    def test_execute_coalesce(self, mock_sleep):
+        calls = []
+        done = event.Event()
+
+        def _status():
+            calls.append(None)
+            done.wait()
+            return 'on'
+
+        first = eventlet.spawn(self.scheduler.execute, '1.2.3.4', _status,
+                               coalesce_key='status')
+        eventlet.sleep(0)
+        second = eventlet.spawn(self.scheduler.execute, '1.2.3.4', _status,
+                                coalesce_key='status')
+        eventlet.sleep(0)
+        done.send()
+
+        self.assertEqual('on', first.wait())
+        self.assertEqual('on', second.wait())
+        self.assertEqual(1, len(calls))
+        stats = self.scheduler.get_stats()['1.2.3.4']
+        self.assertEqual(1, stats['commands'])
+        self.assertEqual(1, stats['coalesced'])
+
+    def test_execute_coalesce_failure(self, mock_sleep):
+        done = event.Event()
+
+        def _status():
+            done.wait()
+            self._fail()
+
+        first = eventlet.spawn(self.scheduler.execute, '1.2.3.4', _status,
+                               coalesce_key='status')
+        eventlet.sleep(0)
+        second = eventlet.spawn(self.scheduler.execute, '1.2.3.4', _status,
+                                coalesce_key='status')
+        eventlet.sleep(0)
+        done.send()
+
+        self.assertRaises(ValueError, first.wait)
+        self.assertRaises(ValueError, second.wait)
+        # the next query is not answered by the failed one
+        self.assertEqual('on', self.scheduler.execute(
+            '1.2.3.4', lambda: 'on', coalesce_key='status'))
+
+    def test_execute_no_coalesce_diff_key(self, mock_sleep):
+        self.scheduler.execute('1.2.3.4', lambda: None, coalesce_key='a')
+        self.scheduler.execute('1.2.3.4', lambda: None, coalesce_key='b')
+
+        stats = self.scheduler.get_stats()['1.2.3.4']
+        self.assertEqual(2, stats['commands'])
+        self.assertEqual(0, stats['coalesced'])
+
+    def test_execute_in_order(self, mock_sleep):
+        order = []
+        done = event.Event()
+
+        def _first():
+            done.wait()
+            order.append('first')
+
+        threads = [eventlet.spawn(self.scheduler.execute, '1.2.3.4', _first)]
+        eventlet.sleep(0)
+        threads.extend(eventlet.spawn(self.scheduler.execute, '1.2.3.4',
+                                      lambda i=i: order.append(i))
+                       for i in range(4))
+        eventlet.sleep(0)
+        self.assertEqual(4, self.scheduler.get_stats()['1.2.3.4'][
+                'queue_depth'])
+        done.send()
+        for thread in threads:
+            thread.wait()
+
+        self.assertEqual(['first', 0, 1, 2, 3], order)
+        self.assertEqual(0, self.scheduler.get_stats()['1.2.3.4'][
+                'queue_depth'])
+
+    def test_get_stats(self, mock_sleep):
+        self.scheduler.execute('1.2.3.4', lambda: None)
+        self.assertRaises(ValueError, self.scheduler.execute, '1.2.3.4',
+                          self._fail)
+
+        stats = self.scheduler.get_stats()
+        self.assertEqual(['1.2.3.4'], list(stats))
+        self.assertEqual(2, stats['1.2.3.4']['commands'])
+        self.assertEqual(1, stats['1.2.3.4']['failures'])
+        self.assertEqual(0, stats['1.2.3.4']['queue_depth'])
+        self.assertEqual(5, stats['1.2.3.4']['interval'])
+        self.assertTrue(stats['1.2.3.4']['wait_time'] >= 0)
+
+    def test_interval_not_adaptive(self, mock_sleep):
+        for i in range(3):
+            self.assertRaises(ValueError, self.scheduler.execute, '1.2.3.4',
+                              self._fail)
+
+        self.assertEqual(5, self.scheduler.get_stats()['1.2.3.4']['interval'])
+
+    def test_interval_adaptive_failures(self, mock_sleep):
+        self.config(adaptive_command_interval=True, group='ipmi')
+        intervals = []
+        for i in range(5):
+            self.assertRaises(ValueError, self.scheduler.execute, '1.2.3.4',
+                              self._fail)
+            intervals.append(
+                self.scheduler.get_stats()['1.2.3.4']['interval'])
+
+        self.assertEqual([10, 20, 40, 60, 60], intervals)
+
+    def test_interval_adaptive_recovers(self, mock_sleep):
+        self.config(adaptive_command_interval=True, group='ipmi')
+        for i in range(3):
+            self.assertRaises(ValueError, self.scheduler.execute, '1.2.3.4',
+                              self._fail)
+        intervals = []
+        for i in range(4):
+            self.scheduler.execute('1.2.3.4', lambda: None)
+            intervals.append(
+                self.scheduler.get_stats()['1.2.3.4']['interval'])
+
+        self.assertEqual([20, 10, 5, 5], intervals)
+
+    @mock.patch.object(time, 'time')
+    def test_interval_adaptive_latency(self, mock_time, mock_sleep):
+        self.config(adaptive_command_interval=True, group='ipmi')
+        # queued, turn, started, finished and next command times
+        mock_time.side_effect = [0, 0, 0, 8, 8]
+
+        self.scheduler.execute('1.2.3.4', lambda: None)
+
+        self.assertEqual(8, self.scheduler.get_stats()['1.2.3.4']['interval'])
+
+    def test_reset(self, mock_sleep):
+        self.scheduler.execute('1.2.3.4', lambda: None)
+        self.scheduler.reset()
+        self.assertEqual({}, self.scheduler.get_stats())
+
+        self.scheduler.execute('1.2.3.4', lambda: None)
+        self.assertFalse(mock_sleep.called)
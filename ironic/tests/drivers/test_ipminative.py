@@ -19,6 +19,8 @@
 Test class for Native IPMI power driver module.
 """
 
+import eventlet
+from eventlet import event
 import mock
 
 from oslo.config import cfg
@@ -145,6 +147,7 @@ class IPMINativeDriverTestCase(db_base.DbTestCase):
                                                driver_info=INFO_DICT)
         self.dbapi = db_api.get_instance()
         self.info = ipminative._parse_driver_info(self.node)
+        self.config(min_command_interval=0, group='ipmi')
 
     def test_get_properties(self):
         expected = ipminative.COMMON_PROPERTIES
@@ -177,6 +180,25 @@ class IPMINativeDriverTestCase(db_base.DbTestCase):
                              "pyghmi.ipmi.command.Command.get_power was not"
                              " called 3 times.")
 
+    @mock.patch('pyghmi.ipmi.command.Command')
+    def test_get_power_state_coalesced(self, ipmi_mock):
+        done = event.Event()
+
+        def _get_power():
+            done.wait()
+            return {'powerstate': 'on'}
+
+        ipmi_mock.return_value.get_power.side_effect = _get_power
+
+        threads = [eventlet.spawn(ipminative._power_status, self.info)
+                   for i in range(3)]
+        eventlet.sleep(0)
+        done.send()
+
+        for thread in threads:
+            self.assertEqual(states.POWER_ON, thread.wait())
+        self.assertEqual(1, ipmi_mock.return_value.get_power.call_count)
+
     @mock.patch.object(ipminative, '_power_on')
     def test_set_power_on_ok(self, power_on_mock):
         power_on_mock.return_value = states.POWER_ON
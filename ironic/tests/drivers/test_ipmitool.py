@@ -19,6 +19,8 @@
 
 """Test class for IPMITool driver module."""
 
+import eventlet
+from eventlet import event
 import mock
 import os
 import stat
@@ -35,6 +37,7 @@ from ironic.common import utils
 from ironic.conductor import task_manager
 from ironic.db import api as db_api
 from ironic.drivers.modules import console_utils
+from ironic.drivers.modules import ipmi_scheduler
 from ironic.drivers.modules import ipmitool as ipmi
 from ironic.openstack.common import context
 from ironic.openstack.common import processutils
@@ -152,7 +155,6 @@ class IPMIToolPrivateMethodTestCase(base.TestCase):
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_first_call_to_address(self, mock_exec, mock_pwf,
             mock_timing_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle = tempfile.NamedTemporaryFile()
         pw_file = pw_file_handle.name
         file_handle = open(pw_file, "w")
@@ -181,7 +183,6 @@ class IPMIToolPrivateMethodTestCase(base.TestCase):
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_second_call_to_address_sleep(self, mock_exec,
             mock_pwf, mock_timing_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle1 = tempfile.NamedTemporaryFile()
         pw_file1 = pw_file_handle1.name
         file_handle1 = open(pw_file1, "w")
@@ -223,7 +224,6 @@ class IPMIToolPrivateMethodTestCase(base.TestCase):
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_second_call_to_address_no_sleep(self, mock_exec,
             mock_pwf, mock_timing_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle1 = tempfile.NamedTemporaryFile()
         pw_file1 = pw_file_handle1.name
         file_handle1 = open(pw_file1, "w")
@@ -256,18 +256,75 @@ class IPMIToolPrivateMethodTestCase(base.TestCase):
         ipmi._exec_ipmitool(self.info, 'A B C')
         mock_exec.assert_called_with(*args[0])
         # act like enough time has passed
-        ipmi.LAST_CMD_TIME[self.info['address']] = (time.time() -
-                CONF.ipmi.min_command_interval)
+        ipmi_scheduler.SCHEDULER._bmcs[self.info['address']].next_time = (
+                time.time())
         ipmi._exec_ipmitool(self.info, 'D E F')
         self.assertFalse(mock_sleep.called)
         mock_exec.assert_called_with(*args[1])
 
+    @mock.patch.object(ipmi, '_is_timing_supported')
+    @mock.patch.object(utils, 'execute', autospec=True)
+    def test__exec_ipmitool_coalesce_power_status(self, mock_exec,
+            mock_timing_support, mock_sleep):
+        mock_timing_support.return_value = False
+        done = event.Event()
+
+        def _execute(*args):
+            done.wait()
+            return ('Chassis Power is on\n', '')
+
+        mock_exec.side_effect = _execute
+
+        threads = [eventlet.spawn(ipmi._exec_ipmitool, self.info,
+                                  'power status') for i in range(3)]
+        eventlet.sleep(0)
+        done.send()
+
+        for thread in threads:
+            self.assertEqual(('Chassis Power is on\n', ''), thread.wait())
+        self.assertEqual(1, mock_exec.call_count)
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch.object(ipmi.SHELL_SESSIONS, 'execute', autospec=True)
+    @mock.patch.object(utils, 'execute', autospec=True)
+    def test__exec_ipmitool_shell_session(self, mock_exec, mock_shell_exec,
+                                          mock_sleep):
+        self.config(use_shell_sessions=True, group='ipmi')
+        mock_shell_exec.return_value = ('out', '')
+
+        self.assertEqual(('out', ''),
+                         ipmi._exec_ipmitool(self.info, 'power status'))
+
+        key = (self.info['address'], self.info['username'],
+               self.info['password'], self.info['priv_level'])
+        mock_shell_exec.assert_called_once_with(key, 'power status',
+                                                mock.ANY)
+        self.assertFalse(mock_exec.called)
+        self.assertFalse(mock_sleep.called)
+        stats = ipmi_scheduler.SCHEDULER.get_stats()
+        self.assertEqual(1, stats[self.info['address']]['commands'])
+
+    @mock.patch.object(ipmi, '_is_timing_supported')
+    def test__get_ipmitool_shell_args(self, mock_timing_support,
+                                      mock_sleep):
+        mock_timing_support.return_value = False
+        with ipmi._get_ipmitool_shell_args(self.info) as args:
+            pw_file = args[-2]
+            self.assertTrue(os.path.isfile(pw_file))
+            self.assertEqual(['ipmitool',
+                              '-I', 'lanplus',
+                              '-H', self.info['address'],
+                              '-L', self.info['priv_level'],
+                              '-U', self.info['username'],
+                              '-f', pw_file,
+                              'shell'], args)
+        self.assertFalse(os.path.isfile(pw_file))
+
     @mock.patch.object(ipmi, '_is_timing_supported')
     @mock.patch.object(ipmi, '_make_password_file', autospec=True)
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_two_calls_to_diff_address(self, mock_exec,
             mock_pwf, mock_timing_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle1 = tempfile.NamedTemporaryFile()
         pw_file1 = pw_file_handle1.name
         file_handle1 = open(pw_file1, "w")
@@ -470,6 +527,24 @@ class IPMIToolPrivateMethodTestCase(base.TestCase):
         self.assertEqual(states.ERROR, state)
 
 
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test__power_on_reached(self, mock_exec, mock_sleep):
+        self.config(retry_timeout=60, group='ipmi')
+        mock_exec.side_effect = iter([(None, None),
+                                      ("Chassis Power is off\n", None),
+                                      ("Chassis Power is on\n", None)])
+
+        state = ipmi._power_on(self.info)
+
+        self.assertEqual(states.POWER_ON, state)
+        self.assertEqual([mock.call(self.info, "power on"),
+                          mock.call(self.info, "power status"),
+                          mock.call(self.info, "power status")],
+                         mock_exec.call_args_list)
+        # checked about 1 and 2.5 seconds after powering on
+        self.assertEqual(2, mock_sleep.call_count)
+        self.assertTrue(sum(c[0][0] for c in mock_sleep.call_args_list) < 3)
+
 class IPMIToolDriverTestCase(db_base.DbTestCase):
 
     def setUp(self):
@@ -1122,3 +1197,63 @@ class IPMIToolDriverTestCase(db_base.DbTestCase):
                           ipmi._parse_ipmi_sensors_data,
                           self.node,
                           fake_sensors_data)
+
+    def test__parse_ipmi_sensor_data_sensor_types(self):
+        fake_sensors_data = """
+                            Sensor ID              : Temp (0x1)
+                             Entity ID             : 3.1 (Processor)
+                             Sensor Type (Analog)  : Temperature
+                             Sensor Reading        : 50 (+/- 1) degrees C
+                             Status                : ok
+
+                            Sensor ID              : FAN MOD 1A RPM (0x30)
+                             Entity ID             : 7.1 (System Board)
+                             Sensor Type (Analog)  : Fan
+                             Sensor Reading        : 8400 (+/- 75) RPM
+                             Status                : ok
+                             """
+        expected_return = {
+                             'Fan': {
+                                 'FAN MOD 1A RPM (0x30)': {
+                                     'Status': 'ok',
+                                     'Sensor Reading': '8400 (+/- 75) RPM',
+                                     'Entity ID': '7.1 (System Board)',
+                                     'Sensor Type (Analog)': 'Fan',
+                                     'Sensor ID': 'FAN MOD 1A RPM (0x30)',
+                                  }
+                               }
+                            }
+        ret = ipmi._parse_ipmi_sensors_data(self.node, fake_sensors_data,
+                                            ['fan'])
+        self.assertEqual(expected_return, ret)
+
+        ret = ipmi._parse_ipmi_sensors_data(self.node, fake_sensors_data,
+                                            ['ALL'])
+        self.assertEqual(['Fan', 'Temperature'], sorted(ret))
+
+        ret = ipmi._parse_ipmi_sensors_data(self.node, fake_sensors_data,
+                                            ['Voltage'])
+        self.assertEqual({}, ret)
+
+    def test__parse_ipmi_sensor_data_unknown_type(self):
+        fake_sensors_data = """
+                            Sensor ID              : Temp (0x1)
+                             Sensor Reading        : 50 (+/- 1) degrees C
+                             """
+        self.assertRaises(exception.FailedToParseSensorData,
+                          ipmi._parse_ipmi_sensors_data,
+                          self.node,
+                          fake_sensors_data,
+                          ['fan'])
+
+    @mock.patch.object(ipmi, '_parse_ipmi_sensors_data', autospec=True)
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test_get_sensors_data(self, mock_exec, mock_parse):
+        mock_exec.return_value = ('fake-output', '')
+
+        with task_manager.acquire(self.context, self.node.uuid) as task:
+            ret = self.driver.management.get_sensors_data(task, ['Fan'])
+
+        mock_exec.assert_called_once_with(self.info, 'sdr -v')
+        mock_parse.assert_called_once_with(mock.ANY, 'fake-output', ['Fan'])
+        self.assertEqual(mock_parse.return_value, ret)
@@ -0,0 +1,223 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Test class for the ipmitool shell sessions."""
+
+import contextlib
+import os
+import time
+
+import mock
+
+from ironic.drivers.modules import ipmitool_shell
+from ironic.openstack.common import processutils
+from ironic.tests import base
+
+
+class _Pipe(object):
+    """One end of an os.pipe() standing in for a process' stdout/stderr."""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def fileno(self):
+        return self.fd
+
+
+@mock.patch.object(ipmitool_shell.subprocess, 'Popen')
+class ShellSessionTestCase(base.TestCase):
+
+    def setUp(self):
+        super(ShellSessionTestCase, self).setUp()
+        self.out_r, self.out_w = os.pipe()
+        self.err_r, self.err_w = os.pipe()
+        for fd in (self.out_r, self.out_w, self.err_r, self.err_w):
+            self.addCleanup(self._close, fd)
+        self.process = mock.Mock()
+        self.process.stdout = _Pipe(self.out_r)
+        self.process.stderr = _Pipe(self.err_r)
+        self.process.poll.return_value = None
+        self.responses = {}
+        self.process.stdin.write.side_effect = self._respond
+        os.write(self.out_w, ipmitool_shell.PROMPT)
+
+    def _close(self, fd):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+    def _respond(self, data):
+        out, err = self.responses[data]
+        if err:
+            os.write(self.err_w, err)
+        if out is None:
+            os.close(self.out_w)
+        else:
+            os.write(self.out_w, out + ipmitool_shell.PROMPT)
+
+    def test_start(self, popen_mock):
+        popen_mock.return_value = self.process
+        session = ipmitool_shell.ShellSession(['ipmitool', 'shell'])
+
+        self.assertTrue(session.alive)
+        popen_mock.assert_called_once_with(
+            ['ipmitool', 'shell'], stdin=ipmitool_shell.subprocess.PIPE,
+            stdout=ipmitool_shell.subprocess.PIPE,
+            stderr=ipmitool_shell.subprocess.PIPE, close_fds=True)
+
+    def test_start_error(self, popen_mock):
+        popen_mock.return_value = self.process
+        # the shell exits without printing its prompt
+        os.read(self.out_r, len(ipmitool_shell.PROMPT))
+        os.write(self.err_w, 'Error: Unable to establish IPMI v2 session\n')
+        os.close(self.out_w)
+
+        self.assertRaises(processutils.ProcessExecutionError,
+                          ipmitool_shell.ShellSession, ['ipmitool', 'shell'])
+        self.process.terminate.assert_called_once_with()
+
+    @mock.patch.object(ipmitool_shell.LOG, 'warning')
+    def test_start_warning(self, log_mock, popen_mock):
+        popen_mock.return_value = self.process
+        os.write(self.err_w, 'Get HPM.x Capabilities request failed, '
+                             'compcode = c9\n')
+
+        session = ipmitool_shell.ShellSession(['ipmitool', 'shell'])
+
+        self.assertTrue(session.alive)
+        self.assertTrue(log_mock.called)
+        self.assertFalse(self.process.terminate.called)
+
+    def test_execute(self, popen_mock):
+        popen_mock.return_value = self.process
+        self.responses['power status\n'] = ('Chassis Power is on\n', '')
+        session = ipmitool_shell.ShellSession(['ipmitool', 'shell'])
+
+        self.assertEqual(('Chassis Power is on\n', ''),
+                         session.execute('power status'))
+        self.assertEqual(('Chassis Power is on\n', ''),
+                         session.execute('power status'))
+        self.assertEqual(1, popen_mock.call_count)
+
+    def test_execute_strips_echo(self, popen_mock):
+        popen_mock.return_value = self.process
+        self.responses['power status\n'] = (
+            'power status\nChassis Power is on\n', '')
+        session = ipmitool_shell.ShellSession(['ipmitool', 'shell'])
+
+        self.assertEqual(('Chassis Power is on\n', ''),
+                         session.execute('power status'))
+
+    @mock.patch.object(ipmitool_shell.LOG, 'warning')
+    def test_execute_stderr_warning(self, log_mock, popen_mock):
+        popen_mock.return_value = self.process
+        warning = 'Get HPM.x Capabilities request failed, compcode = c9\n'
+        self.responses['power status\n'] = ('Chassis Power is on\n', warning)
+        session = ipmitool_shell.ShellSession(['ipmitool', 'shell'])
+
+        self.assertEqual(('Chassis Power is on\n', warning),
+                         session.execute('power status'))
+        self.assertTrue(log_mock.called)
+        self.assertTrue(session.alive)
+        self.assertFalse(self.process.terminate.called)
+
+    def test_execute_error(self, popen_mock):
+        popen_mock.return_value = self.process
+        self.responses['foo\n'] = ('', 'Invalid command: foo\n')
+        session = ipmitool_shell.ShellSession(['ipmitool', 'shell'])
+
+        exc = self.assertRaises(processutils.ProcessExecutionError,
+                                session.execute, 'foo')
+        self.assertEqual('Invalid command: foo\n', exc.stderr)
+        self.assertFalse(self.process.terminate.called)
+
+    def test_execute_shell_exited(self, popen_mock):
+        popen_mock.return_value = self.process
+        self.responses['power status\n'] = (None, '')
+        session = ipmitool_shell.ShellSession(['ipmitool', 'shell'])
+
+        self.assertRaises(processutils.ProcessExecutionError,
+                          session.execute, 'power status')
+        self.process.terminate.assert_called_once_with()
+
+
+@mock.patch.object(ipmitool_shell, 'ShellSession')
+class ShellSessionPoolTestCase(base.TestCase):
+
+    def setUp(self):
+        super(ShellSessionPoolTestCase, self).setUp()
+        self.pool = ipmitool_shell.ShellSessionPool()
+        self.args = ['ipmitool', 'shell']
+
+    @contextlib.contextmanager
+    def _get_args(self):
+        yield self.args
+
+    def test_execute_reuses_session(self, session_mock):
+        session = session_mock.return_value
+        session.last_used = time.time()
+        session.execute.return_value = ('out', '')
+
+        self.assertEqual(('out', ''),
+                         self.pool.execute('key', 'cmd', self._get_args))
+        self.assertEqual(('out', ''),
+                         self.pool.execute('key', 'cmd', self._get_args))
+
+        session_mock.assert_called_once_with(self.args)
+        self.assertEqual([mock.call('cmd'), mock.call('cmd')],
+                         session.execute.call_args_list)
+
+    def test_execute_session_per_key(self, session_mock):
+        session_mock.return_value.last_used = time.time()
+        self.pool.execute('key1', 'cmd', self._get_args)
+        self.pool.execute('key2', 'cmd', self._get_args)
+
+        self.assertEqual(2, session_mock.call_count)
+
+    def test_execute_restarts_dead_session(self, session_mock):
+        dead = mock.Mock(alive=True, last_used=time.time())
+        dead.execute.side_effect = processutils.ProcessExecutionError()
+        session_mock.side_effect = [dead, mock.Mock(last_used=time.time())]
+
+        self.assertRaises(processutils.ProcessExecutionError,
+                          self.pool.execute, 'key', 'cmd', self._get_args)
+        dead.alive = False
+        self.pool.execute('key', 'cmd', self._get_args)
+
+        self.assertEqual(2, session_mock.call_count)
+
+    def test_evict_idle(self, session_mock):
+        self.config(shell_session_idle_timeout=60, group='ipmi')
+        idle = mock.Mock(last_used=time.time())
+        recent = mock.Mock(last_used=time.time())
+        session_mock.side_effect = [idle, recent, mock.Mock()]
+        self.pool.execute('idle', 'cmd', self._get_args)
+        self.pool.execute('recent', 'cmd', self._get_args)
+        idle.last_used = time.time() - 61
+
+        self.pool.evict_idle()
+
+        idle.close.assert_called_once_with()
+        self.assertFalse(recent.close.called)
+        self.pool.execute('idle', 'cmd', self._get_args)
+        self.assertEqual(3, session_mock.call_count)
+
+    def test_close_all(self, session_mock):
+        session_mock.return_value.last_used = time.time()
+        self.pool.execute('key', 'cmd', self._get_args)
+
+        self.pool.close_all()
+
+        session_mock.return_value.close.assert_called_once_with()
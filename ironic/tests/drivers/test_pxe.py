@@ -36,6 +36,7 @@ from ironic.conductor import task_manager
 from ironic.conductor import utils as manager_utils
 from ironic.db import api as dbapi
 from ironic.drivers.modules import deploy_utils
+from ironic.drivers.modules import image_cache
 from ironic.drivers.modules import pxe
 from ironic.openstack.common import context
 from ironic.openstack.common import fileutils
@@ -368,6 +369,15 @@ class PXEPrivateMethodsTestCase(db_base.DbTestCase):
                                       'disk'),
                          image_path)
 
+    def test_image_cache_eviction_policy(self):
+        temp_dir = tempfile.mkdtemp()
+        self.config(image_cache_eviction_policy='gdsf', group='pxe')
+        self.config(tftp_master_path=temp_dir, group='pxe')
+        self.config(instance_master_path=temp_dir, group='pxe')
+
+        for cache in (pxe.TFTPImageCache(), pxe.InstanceImageCache()):
+            self.assertIsInstance(cache._policy, image_cache.GDSFPolicy)
+
 
 @mock.patch.object(pxe, 'TFTPImageCache')
 @mock.patch.object(pxe, 'InstanceImageCache')
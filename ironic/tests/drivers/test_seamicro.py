@@ -12,8 +12,10 @@
 
 """Test class for Ironic SeaMicro driver."""
 
+import time
 import uuid
 
+import fixtures
 import mock
 from seamicroclient import exceptions as seamicro_client_exception
 
@@ -147,6 +149,10 @@ class SeaMicroPrivateMethodsTestCase(base.TestCase):
         self.Server = Fake_Server
         self.Volume = Fake_Volume
         self.Pool = Fake_Pool
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.seamicro._CLIENTS', {}))
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.seamicro._SERVER_LISTS', {}))
         self.config(action_timeout=0, group='seamicro')
         self.config(max_retry=2, group='seamicro')
 
@@ -171,52 +177,205 @@ class SeaMicroPrivateMethodsTestCase(base.TestCase):
         pstate = seamicro._get_power_status(self.node)
         self.assertEqual(states.ERROR, pstate)
 
-    @mock.patch.object(seamicro, "_get_server")
-    def test__power_on_good(self, mock_get_server):
-        mock_get_server.return_value = self.Server(active=False)
+    @mock.patch.object(seamicro, "_get_client")
+    def test__get_power_states(self, mock_get_client):
+        servers = [self.Server(active=True), self.Server(active=False)]
+        servers[0].id, servers[1].id = '0/0', '1/0'
+        mock_get_client.return_value.servers.list.return_value = servers
+        other_node = obj_utils.create_test_node(
+            self.context, id=2, uuid=utils.generate_uuid(),
+            driver='fake_seamicro',
+            driver_info=dict(INFO_DICT, seamicro_server_id='1/0'))
+        missing_node = obj_utils.create_test_node(
+            self.context, id=3, uuid=utils.generate_uuid(),
+            driver='fake_seamicro',
+            driver_info=dict(INFO_DICT, seamicro_server_id='2/0'))
+
+        pstates = seamicro._get_power_states([self.node, other_node,
+                                              missing_node])
+
+        self.assertEqual([states.POWER_ON, states.POWER_OFF], pstates[:2])
+        self.assertIsInstance(pstates[2], exception.NodeNotFound)
+        mock_get_client.return_value.servers.list.assert_called_once_with()
+
+    @mock.patch.object(seamicro, "_get_client")
+    def test__get_power_states_list_reused(self, mock_get_client):
+        server = self.Server(active=True)
+        server.id = '0/0'
+        mock_get_client.return_value.servers.list.return_value = [server]
+
+        seamicro._get_power_states([self.node])
+        seamicro._get_power_states([self.node])
+
+        mock_get_client.return_value.servers.list.assert_called_once_with()
+
+    @mock.patch.object(seamicro, "_get_client")
+    def test__get_power_states_list_expired(self, mock_get_client):
+        self.config(server_list_ttl=0, group='seamicro')
+        server = self.Server(active=True)
+        server.id = '0/0'
+        mock_get_client.return_value.servers.list.return_value = [server]
+
+        seamicro._get_power_states([self.node])
+        seamicro._get_power_states([self.node])
+
+        self.assertEqual(
+            2, mock_get_client.return_value.servers.list.call_count)
+
+    @mock.patch.object(seamicro, "_get_client")
+    def test__power_on_drops_server_list(self, mock_get_client):
+        server = self.Server(active=False)
+        server.id = '0/0'
+        mock_get_client.return_value.servers.list.return_value = [server]
+        mock_get_client.return_value.servers.get.return_value = server
+        seamicro._get_power_states([self.node])
+
+        seamicro._power_on(self.node)
+        seamicro._get_power_states([self.node])
+
+        self.assertEqual(
+            2, mock_get_client.return_value.servers.list.call_count)
+
+    @mock.patch.object(seamicro.seamicro_client, "Client")
+    def test__get_client_reused(self, mock_client):
+        info = seamicro._parse_driver_info(self.node)
+
+        client = seamicro._get_client(**info)
+
+        self.assertIs(client, seamicro._get_client(**info))
+        mock_client.assert_called_once_with(info['api_version'],
+                                            username=info['username'],
+                                            password=info['password'],
+                                            auth_url=info['api_endpoint'])
+
+    @mock.patch.object(seamicro.seamicro_client, "Client")
+    def test__get_client_password_changed(self, mock_client):
+        info = seamicro._parse_driver_info(self.node)
+        mock_client.side_effect = [mock.sentinel.client1,
+                                   mock.sentinel.client2]
+
+        seamicro._get_client(**info)
+        client = seamicro._get_client(**dict(info, password='new'))
+
+        self.assertEqual(mock.sentinel.client2, client)
+
+    @mock.patch.object(seamicro.seamicro_client, "Client")
+    def test__call_client_unauthorized(self, mock_client):
+        class Unauthorized(Exception):
+            pass
+
+        info = seamicro._parse_driver_info(self.node)
+        expired, client = mock.Mock(), mock.Mock()
+        expired.servers.get.side_effect = Unauthorized()
+        mock_client.side_effect = [expired, client]
+
+        with mock.patch.object(seamicro.seamicro_client_exception,
+                               'Unauthorized', Unauthorized):
+            server = seamicro._get_server(info)
+
+        self.assertEqual(client.servers.get.return_value, server)
+        self.assertIs(client, seamicro._get_client(**info))
+
+    @mock.patch.object(seamicro.seamicro_client, "Client")
+    def test__power_on_unauthorized(self, mock_client):
+        class Unauthorized(Exception):
+            pass
+
+        expired, client = mock.Mock(), mock.Mock()
+        # the token expires after the power state was checked
+        expired.servers.get.return_value.active = False
+        expired.servers.get.return_value.power_on.side_effect = (
+            Unauthorized())
+        client.servers.get.return_value = self.Server(active=False)
+        mock_client.side_effect = [expired, client]
+
+        with mock.patch.object(seamicro.seamicro_client_exception,
+                               'Unauthorized', Unauthorized):
+            pstate = seamicro._power_on(self.node)
+
+        self.assertEqual(states.POWER_ON, pstate)
+        self.assertTrue(client.servers.get.return_value.active)
+
+    @mock.patch.object(seamicro, "_get_client")
+    def test__get_power_states_client_exception(self, mock_get_client):
+        mock_get_client.return_value.servers.list.side_effect = (
+            seamicro_client_exception.ClientException(500))
+        self.assertRaises(exception.ServiceUnavailable,
+                          seamicro._get_power_states, [self.node])
+
+    @mock.patch.object(seamicro, "_get_client")
+    def test__power_on_good(self, mock_get_client):
+        servers = mock_get_client.return_value.servers
+        servers.get.return_value = self.Server(active=False)
         pstate = seamicro._power_on(self.node)
         self.assertEqual(states.POWER_ON, pstate)
 
-    @mock.patch.object(seamicro, "_get_server")
-    def test__power_on_fail(self, mock_get_server):
+    @mock.patch.object(seamicro, "_get_client")
+    def test__power_on_fail(self, mock_get_client):
         def fake_power_on():
             return
 
         server = self.Server(active=False)
         server.power_on = fake_power_on
-        mock_get_server.return_value = server
+        mock_get_client.return_value.servers.get.return_value = server
         pstate = seamicro._power_on(self.node)
         self.assertEqual(states.ERROR, pstate)
 
-    @mock.patch.object(seamicro, "_get_server")
-    def test__power_off_good(self, mock_get_server):
-        mock_get_server.return_value = self.Server(active=True)
+    @mock.patch.object(time, 'time')
+    @mock.patch.object(time, 'sleep')
+    @mock.patch.object(seamicro, "_get_client")
+    def test__power_on_retries_action(self, mock_get_client, mock_sleep,
+                                      mock_time):
+        self.config(action_timeout=10, group='seamicro')
+        clock = [0]
+        mock_time.side_effect = lambda: clock[0]
+
+        def fake_sleep(seconds):
+            clock[0] += seconds
+
+        mock_sleep.side_effect = fake_sleep
+        server = self.Server(active=False)
+        server.power_on = mock.Mock()
+        mock_get_client.return_value.servers.get.return_value = server
+
+        pstate = seamicro._power_on(self.node)
+
+        self.assertEqual(states.ERROR, pstate)
+        # the first power on and max_retry more, one per action_timeout
+        self.assertEqual(3, server.power_on.call_count)
+        self.assertAlmostEqual(30, clock[0])
+
+    @mock.patch.object(seamicro, "_get_client")
+    def test__power_off_good(self, mock_get_client):
+        servers = mock_get_client.return_value.servers
+        servers.get.return_value = self.Server(active=True)
         pstate = seamicro._power_off(self.node)
         self.assertEqual(states.POWER_OFF, pstate)
 
-    @mock.patch.object(seamicro, "_get_server")
-    def test__power_off_fail(self, mock_get_server):
+    @mock.patch.object(seamicro, "_get_client")
+    def test__power_off_fail(self, mock_get_client):
         def fake_power_off():
             return
         server = self.Server(active=True)
         server.power_off = fake_power_off
-        mock_get_server.return_value = server
+        mock_get_client.return_value.servers.get.return_value = server
         pstate = seamicro._power_off(self.node)
         self.assertEqual(states.ERROR, pstate)
 
-    @mock.patch.object(seamicro, "_get_server")
-    def test__reboot_good(self, mock_get_server):
-        mock_get_server.return_value = self.Server(active=True)
+    @mock.patch.object(seamicro, "_get_client")
+    def test__reboot_good(self, mock_get_client):
+        servers = mock_get_client.return_value.servers
+        servers.get.return_value = self.Server(active=True)
         pstate = seamicro._reboot(self.node)
         self.assertEqual(states.POWER_ON, pstate)
 
-    @mock.patch.object(seamicro, "_get_server")
-    def test__reboot_fail(self, mock_get_server):
+    @mock.patch.object(seamicro, "_get_client")
+    def test__reboot_fail(self, mock_get_client):
         def fake_reboot():
             return
         server = self.Server(active=False)
         server.reset = fake_reboot
-        mock_get_server.return_value = server
+        mock_get_client.return_value.servers.get.return_value = server
         pstate = seamicro._reboot(self.node)
         self.assertEqual(states.ERROR, pstate)
 
@@ -273,6 +432,10 @@ class SeaMicroPowerDriverTestCase(db_base.DbTestCase):
         self.get_server_mock = None
         self.Server = Fake_Server
         self.Volume = Fake_Volume
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.seamicro._CLIENTS', {}))
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.seamicro._SERVER_LISTS', {}))
 
     def test_get_properties(self):
         expected = seamicro.COMMON_PROPERTIES
@@ -297,6 +460,16 @@ class SeaMicroPowerDriverTestCase(db_base.DbTestCase):
                               task.driver.power.validate, task)
         self.assertEqual(1, parse_drv_info_mock.call_count)
 
+    def test_get_power_endpoint(self):
+        power = self.driver.power
+        self.assertEqual(power.get_power_endpoint(INFO_DICT),
+                         power.get_power_endpoint(
+                             dict(INFO_DICT, seamicro_server_id='1/0')))
+        self.assertNotEqual(power.get_power_endpoint(INFO_DICT),
+                            power.get_power_endpoint(
+                                dict(INFO_DICT, seamicro_username='other')))
+        self.assertIsNone(power.get_power_endpoint({}))
+
     @mock.patch.object(seamicro, '_reboot')
     def test_reboot(self, mock_reboot):
         info = seamicro._parse_driver_info(self.node)
@@ -27,6 +27,7 @@ from ironic.common import utils
 from ironic.conductor import task_manager
 from ironic.db import api as dbapi
 from ironic.drivers.modules import ssh
+from ironic.drivers.modules import ssh_pool
 from ironic.drivers import utils as driver_utils
 from ironic.openstack.common import context
 from ironic.openstack.common import processutils
@@ -192,21 +193,36 @@ class SSHPrivateMethodsTestCase(base.TestCase):
                         driver='fake_ssh',
                         driver_info=db_utils.get_test_ssh_info())
         self.sshclient = paramiko.SSHClient()
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.ssh.SSH_CONNECTIONS',
+            ssh_pool.SSHConnectionPool()))
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.ssh._INVENTORIES', {}))
 
     @mock.patch.object(utils, 'ssh_connect')
     def test__get_connection_client(self, ssh_connect_mock):
         ssh_connect_mock.return_value = self.sshclient
-        client = ssh._get_connection(self.node)
-        self.assertEqual(self.sshclient, client)
+        with ssh._get_connection(self.node) as client:
+            self.assertEqual(self.sshclient, client)
         driver_info = ssh._parse_driver_info(self.node)
         ssh_connect_mock.assert_called_once_with(driver_info)
 
+    @mock.patch.object(utils, 'ssh_connect')
+    def test__get_connection_reused(self, ssh_connect_mock):
+        ssh_connect_mock.return_value = mock.Mock(spec=paramiko.SSHClient)
+        with ssh._get_connection(self.node) as client1:
+            pass
+        with ssh._get_connection(self.node) as client2:
+            pass
+        self.assertIs(client1, client2)
+        self.assertEqual(1, ssh_connect_mock.call_count)
+        self.assertEqual(1, ssh.SSH_CONNECTIONS.get_stats()['reused'])
+
     @mock.patch.object(utils, 'ssh_connect')
     def test__get_connection_exception(self, ssh_connect_mock):
         ssh_connect_mock.side_effect = exception.SSHConnectFailed(host='fake')
         self.assertRaises(exception.SSHConnectFailed,
-                          ssh._get_connection,
-                          self.node)
+                          ssh._get_connection(self.node).__enter__)
         driver_info = ssh._parse_driver_info(self.node)
         ssh_connect_mock.assert_called_once_with(driver_info)
 
@@ -229,136 +245,167 @@ class SSHPrivateMethodsTestCase(base.TestCase):
                           ssh_cmd)
         exec_ssh_mock.assert_called_once_with(self.sshclient, ssh_cmd)
 
+    def _inventory_output(self, running='"NodeName" {b43c4982}'):
+        return ('::vm::OtherName\n11:11:11:11:11:12\n'
+                '::vm::NodeName\n52:54:00:cf:2d:31\n'
+                '::running::\n%s\n' % running, '')
+
     @mock.patch.object(processutils, 'ssh_execute')
-    @mock.patch.object(ssh, '_get_hosts_name_for_node')
-    def test__get_power_status_on(self, get_hosts_name_mock, exec_ssh_mock):
+    def test__get_power_status_on(self, exec_ssh_mock):
         info = ssh._parse_driver_info(self.node)
-        exec_ssh_mock.return_value = (
-            '"NodeName" {b43c4982-110c-4c29-9325-d5f41b053513}', '')
-        get_hosts_name_mock.return_value = "NodeName"
+        info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
+        exec_ssh_mock.return_value = self._inventory_output()
 
         pstate = ssh._get_power_status(self.sshclient, info)
 
-        ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
-                             info['cmd_set']['list_running'])
         self.assertEqual(states.POWER_ON, pstate)
-        exec_ssh_mock.assert_called_once_with(self.sshclient, ssh_cmd)
-        get_hosts_name_mock.assert_called_once_with(self.sshclient, info)
+        exec_ssh_mock.assert_called_once_with(
+            self.sshclient, ssh._get_inventory_cmd(info['cmd_set']))
 
     @mock.patch.object(processutils, 'ssh_execute')
-    @mock.patch.object(ssh, '_get_hosts_name_for_node')
-    def test__get_power_status_off(self, get_hosts_name_mock, exec_ssh_mock):
+    def test__get_power_status_off(self, exec_ssh_mock):
         info = ssh._parse_driver_info(self.node)
-        exec_ssh_mock.return_value = (
-            '"NodeName" {b43c4982-110c-4c29-9325-d5f41b053513}', '')
-        get_hosts_name_mock.return_value = "NotNodeName"
+        info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
+        exec_ssh_mock.return_value = self._inventory_output(
+            running='"OtherName" {b43c4982}')
 
         pstate = ssh._get_power_status(self.sshclient, info)
 
-        ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
-                             info['cmd_set']['list_running'])
         self.assertEqual(states.POWER_OFF, pstate)
-        exec_ssh_mock.assert_called_once_with(self.sshclient, ssh_cmd)
-        get_hosts_name_mock.assert_called_once_with(self.sshclient, info)
+        exec_ssh_mock.assert_called_once_with(
+            self.sshclient, ssh._get_inventory_cmd(info['cmd_set']))
 
     @mock.patch.object(processutils, 'ssh_execute')
-    @mock.patch.object(ssh, '_get_hosts_name_for_node')
-    def test__get_power_status_error(self, get_hosts_name_mock, exec_ssh_mock):
-
+    def test__get_power_status_error(self, exec_ssh_mock):
         info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["11:11:11:11:11:11", "22:22:22:22:22:22"]
+        exec_ssh_mock.return_value = self._inventory_output()
 
-        exec_ssh_mock.return_value = (
-            '"NodeName" {b43c4982-110c-4c29-9325-d5f41b053513}', '')
-        info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
-        get_hosts_name_mock.return_value = None
         self.assertRaises(exception.NodeNotFound,
                           ssh._get_power_status,
                           self.sshclient,
                           info)
-
-        ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
-                             info['cmd_set']['list_running'])
-
-        exec_ssh_mock.assert_called_once_with(self.sshclient, ssh_cmd)
-        get_hosts_name_mock.assert_called_once_with(self.sshclient, info)
+        exec_ssh_mock.assert_called_once_with(
+            self.sshclient, ssh._get_inventory_cmd(info['cmd_set']))
 
     @mock.patch.object(processutils, 'ssh_execute')
     def test__get_power_status_exception(self, exec_ssh_mock):
         info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
         exec_ssh_mock.side_effect = processutils.ProcessExecutionError
 
         self.assertRaises(exception.SSHCommandFailed,
                           ssh._get_power_status,
                           self.sshclient,
                           info)
-        ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
-                             info['cmd_set']['list_running'])
         exec_ssh_mock.assert_called_once_with(
-                self.sshclient, ssh_cmd)
+            self.sshclient, ssh._get_inventory_cmd(info['cmd_set']))
 
     @mock.patch.object(processutils, 'ssh_execute')
-    def test__get_hosts_name_for_node_match(self, exec_ssh_mock):
+    def test__get_power_status_cached(self, exec_ssh_mock):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
-        ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
-                             info['cmd_set']['list_all'])
+        other_info = dict(info, macs=["11:11:11:11:11:12"])
+        exec_ssh_mock.return_value = self._inventory_output()
 
-        cmd_to_exec = "%s %s" % (info['cmd_set']['base_cmd'],
-                                 info['cmd_set']['get_node_macs'])
-        cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', 'NodeName')
-        exec_ssh_mock.side_effect = [('NodeName', ''),
-                                          ('52:54:00:cf:2d:31', '')]
-        expected = [mock.call(self.sshclient, ssh_cmd),
-                    mock.call(self.sshclient, cmd_to_exec)]
+        self.assertEqual(states.POWER_ON,
+                         ssh._get_power_status(self.sshclient, info))
+        self.assertEqual(states.POWER_OFF,
+                         ssh._get_power_status(self.sshclient, other_info))
+
+        self.assertEqual(1, exec_ssh_mock.call_count)
+
+    @mock.patch.object(processutils, 'ssh_execute')
+    def test__get_power_status_cache_disabled(self, exec_ssh_mock):
+        self.config(inventory_cache_ttl=0, group='ssh')
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
+        exec_ssh_mock.return_value = self._inventory_output()
+
+        ssh._get_power_status(self.sshclient, info)
+        ssh._get_power_status(self.sshclient, info)
+
+        self.assertEqual(2, exec_ssh_mock.call_count)
+
+    @mock.patch.object(processutils, 'ssh_execute')
+    def test__get_hosts_name_for_node_match(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
+        exec_ssh_mock.return_value = self._inventory_output()
 
         found_name = ssh._get_hosts_name_for_node(self.sshclient, info)
 
         self.assertEqual('NodeName', found_name)
-        self.assertEqual(expected, exec_ssh_mock.call_args_list)
+        exec_ssh_mock.assert_called_once_with(
+            self.sshclient, ssh._get_inventory_cmd(info['cmd_set']))
 
     @mock.patch.object(processutils, 'ssh_execute')
     def test__get_hosts_name_for_node_no_match(self, exec_ssh_mock):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "22:22:22:22:22:22"]
-        exec_ssh_mock.side_effect = [('NodeName', ''),
-                                          ('52:54:00:cf:2d:31', '')]
+        exec_ssh_mock.return_value = self._inventory_output()
 
-        ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
-                             info['cmd_set']['list_all'])
+        found_name = ssh._get_hosts_name_for_node(self.sshclient, info)
 
-        cmd_to_exec = "%s %s" % (info['cmd_set']['base_cmd'],
-                                 info['cmd_set']['get_node_macs'])
+        self.assertIsNone(found_name)
 
-        cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', 'NodeName')
-        expected = [mock.call(self.sshclient, ssh_cmd),
-                    mock.call(self.sshclient, cmd_to_exec)]
+    @mock.patch.object(processutils, 'ssh_execute')
+    def test__get_hosts_name_for_node_new_vm(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["52:54:00:cf:2d:32"]
+        exec_ssh_mock.side_effect = iter([
+            self._inventory_output(),
+            ('::vm::NewName\n52:54:00:cf:2d:32\n::running::\n', '')])
 
+        ssh._get_hosts_name_for_node(self.sshclient,
+                                     dict(info, macs=["11:11:11:11:11:12"]))
         found_name = ssh._get_hosts_name_for_node(self.sshclient, info)
 
-        self.assertIsNone(found_name)
-        self.assertEqual(expected, exec_ssh_mock.call_args_list)
+        # a cached inventory which does not list the VM is reloaded
+        self.assertEqual('NewName', found_name)
+        self.assertEqual(2, exec_ssh_mock.call_count)
 
     @mock.patch.object(processutils, 'ssh_execute')
     def test__get_hosts_name_for_node_exception(self, exec_ssh_mock):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
-        ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
-                             info['cmd_set']['list_all'])
-
-        cmd_to_exec = "%s %s" % (info['cmd_set']['base_cmd'],
-                                 info['cmd_set']['get_node_macs'])
-        cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', 'NodeName')
-
-        exec_ssh_mock.side_effect = [('NodeName', ''),
-                                     processutils.ProcessExecutionError]
-        expected = [mock.call(self.sshclient, ssh_cmd),
-                    mock.call(self.sshclient, cmd_to_exec)]
+        exec_ssh_mock.side_effect = processutils.ProcessExecutionError
 
         self.assertRaises(exception.SSHCommandFailed,
                           ssh._get_hosts_name_for_node,
                           self.sshclient,
                           info)
-        self.assertEqual(expected, exec_ssh_mock.call_args_list)
+
+    def test__parse_inventory_running_per_vm(self):
+        output = ['::vm::1', '00:0c:29:00:00:01', '::running::', '"1"',
+                  '::vm::2', '00:0c:29:00:00:02', '::running::', '']
+
+        inventory = ssh._parse_inventory(output, True)
+
+        self.assertEqual([('1', ['00:0c:29:00:00:01']),
+                          ('2', ['00:0c:29:00:00:02'])], inventory.vms)
+        self.assertEqual(set(['1']), inventory.running)
+
+    @mock.patch.object(processutils, 'ssh_execute')
+    def test__power_on_invalidates_inventory(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
+        exec_ssh_mock.side_effect = iter([
+            self._inventory_output(running=''),
+            ('', ''),
+            self._inventory_output()])
+
+        self.assertEqual(states.POWER_ON,
+                         ssh._power_on(self.sshclient, info))
+
+        cmd_to_exec = "%s %s" % (info['cmd_set']['base_cmd'],
+                                 info['cmd_set']['start_cmd'])
+        cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', 'NodeName')
+        inventory_cmd = ssh._get_inventory_cmd(info['cmd_set'])
+        self.assertEqual([mock.call(self.sshclient, inventory_cmd),
+                          mock.call(self.sshclient, cmd_to_exec),
+                          mock.call(self.sshclient, inventory_cmd)],
+                         exec_ssh_mock.call_args_list)
 
     @mock.patch.object(processutils, 'ssh_execute')
     @mock.patch.object(ssh, '_get_power_status')
@@ -568,6 +615,11 @@ class SSHDriverTestCase(db_base.DbTestCase):
         self.port = self.dbapi.create_port(db_utils.get_test_port(
                                                          node_id=self.node.id))
         self.sshclient = paramiko.SSHClient()
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.ssh.SSH_CONNECTIONS',
+            ssh_pool.SSHConnectionPool()))
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.drivers.modules.ssh._INVENTORIES', {}))
 
     @mock.patch.object(utils, 'ssh_connect')
     def test__validate_info_ssh_connect_failed(self, ssh_connect_mock):
@@ -613,7 +665,7 @@ class SSHDriverTestCase(db_base.DbTestCase):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
         get_mac_addr_mock.return_value = info['macs']
-        get_conn_mock.return_value = self.sshclient
+        get_conn_mock.return_value.__enter__.return_value = self.sshclient
         get_power_stat_mock.return_value = states.POWER_ON
         power_off_mock.return_value = None
         power_on_mock.return_value = states.POWER_ON
@@ -643,7 +695,7 @@ class SSHDriverTestCase(db_base.DbTestCase):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
         get_mac_addr_mock.return_value = info['macs']
-        get_conn_mock.return_value = self.sshclient
+        get_conn_mock.return_value.__enter__.return_value = self.sshclient
         get_power_stat_mock.return_value = states.POWER_ON
         power_off_mock.return_value = None
         power_on_mock.return_value = states.POWER_OFF
@@ -662,6 +714,38 @@ class SSHDriverTestCase(db_base.DbTestCase):
                 power_off_mock.assert_called_once_with(self.sshclient, info)
                 power_on_mock.assert_called_once_with(self.sshclient, info)
 
+    def test_get_power_endpoint(self):
+        info = db_utils.get_test_ssh_info()
+        self.assertEqual(self.driver.power.get_power_endpoint(info),
+                         self.driver.power.get_power_endpoint(dict(info)))
+        self.assertNotEqual(
+            self.driver.power.get_power_endpoint(info),
+            self.driver.power.get_power_endpoint(dict(info, ssh_port=23)))
+        self.assertIsNone(self.driver.power.get_power_endpoint({}))
+
+    @mock.patch.object(driver_utils, 'get_node_mac_addresses')
+    @mock.patch.object(processutils, 'ssh_execute')
+    @mock.patch.object(ssh, '_get_connection')
+    def test_get_power_states(self, get_conn_mock, exec_ssh_mock,
+                              get_mac_addr_mock):
+        info = ssh._parse_driver_info(self.node)
+        get_conn_mock.return_value.__enter__.return_value = self.sshclient
+        exec_ssh_mock.return_value = (
+            '::vm::vm1\n52:54:00:cf:2d:31\n::vm::vm2\n52:54:00:cf:2d:32\n'
+            '::running::\n"vm1" {b43c4982}\n', '')
+        get_mac_addr_mock.side_effect = [["52:54:00:cf:2d:31"],
+                                         ["52:54:00:cf:2d:32"],
+                                         ["52:54:00:cf:2d:33"]]
+        tasks = [mock.Mock(node=self.node) for i in range(3)]
+
+        power_states = self.driver.power.get_power_states(tasks)
+
+        self.assertEqual([states.POWER_ON, states.POWER_OFF],
+                         power_states[:2])
+        self.assertIsInstance(power_states[2], exception.NodeNotFound)
+        exec_ssh_mock.assert_called_once_with(
+            self.sshclient, ssh._get_inventory_cmd(info['cmd_set']))
+
     @mock.patch.object(driver_utils, 'get_node_mac_addresses')
     @mock.patch.object(ssh, '_get_connection')
     def test_set_power_state_bad_state(self, get_conn_mock,
@@ -669,7 +753,7 @@ class SSHDriverTestCase(db_base.DbTestCase):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
         get_mac_addr_mock.return_value = info['macs']
-        get_conn_mock.return_value = self.sshclient
+        get_conn_mock.return_value.__enter__.return_value = self.sshclient
         with mock.patch.object(ssh,
                                '_parse_driver_info') as parse_drv_info_mock:
             parse_drv_info_mock.return_value = info
@@ -693,7 +777,7 @@ class SSHDriverTestCase(db_base.DbTestCase):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
         get_mac_addr_mock.return_value = info['macs']
-        get_conn_mock.return_value = self.sshclient
+        get_conn_mock.return_value.__enter__.return_value = self.sshclient
         power_on_mock.return_value = states.POWER_ON
         with mock.patch.object(ssh,
                                '_parse_driver_info') as parse_drv_info_mock:
@@ -715,7 +799,7 @@ class SSHDriverTestCase(db_base.DbTestCase):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
         get_mac_addr_mock.return_value = info['macs']
-        get_conn_mock.return_value = self.sshclient
+        get_conn_mock.return_value.__enter__.return_value = self.sshclient
         power_on_mock.return_value = states.POWER_OFF
         with mock.patch.object(ssh,
                                '_parse_driver_info') as parse_drv_info_mock:
@@ -741,7 +825,7 @@ class SSHDriverTestCase(db_base.DbTestCase):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
         get_mac_addr_mock.return_value = info['macs']
-        get_conn_mock.return_value = self.sshclient
+        get_conn_mock.return_value.__enter__.return_value = self.sshclient
         power_off_mock.return_value = states.POWER_OFF
         with mock.patch.object(ssh,
                                '_parse_driver_info') as parse_drv_info_mock:
@@ -763,7 +847,7 @@ class SSHDriverTestCase(db_base.DbTestCase):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
         get_mac_addr_mock.return_value = info['macs']
-        get_conn_mock.return_value = self.sshclient
+        get_conn_mock.return_value.__enter__.return_value = self.sshclient
         power_off_mock.return_value = states.POWER_ON
         with mock.patch.object(ssh,
                                '_parse_driver_info') as parse_drv_info_mock:
@@ -788,7 +872,7 @@ class SSHDriverTestCase(db_base.DbTestCase):
                                                      mock_get_conn):
         fake_name = 'fake-name'
         mock_h.return_value = fake_name
-        mock_get_conn.return_value = self.sshclient
+        mock_get_conn.return_value.__enter__.return_value = self.sshclient
         with task_manager.acquire(self.context, self.node.uuid) as task:
             task.node['driver_info']['ssh_virt_type'] = 'virsh'
             self.driver.management.set_boot_device(task, boot_devices.PXE)
@@ -808,7 +892,7 @@ class SSHDriverTestCase(db_base.DbTestCase):
     @mock.patch.object(ssh, '_get_hosts_name_for_node')
     def test_set_boot_device_not_supported(self, mock_h, mock_get_conn):
         mock_h.return_value = 'NodeName'
-        mock_get_conn.return_value = self.sshclient
+        mock_get_conn.return_value.__enter__.return_value = self.sshclient
         # vmware does not support set_boot_device()
         self.node['driver_info']['ssh_virt_type'] = 'vmware'
         with task_manager.acquire(self.context, self.node.uuid) as task:
@@ -831,7 +915,7 @@ class SSHDriverTestCase(db_base.DbTestCase):
         fake_name = 'fake-name'
         mock_h.return_value = fake_name
         mock_exc.return_value = ('network', '')
-        mock_get_conn.return_value = self.sshclient
+        mock_get_conn.return_value.__enter__.return_value = self.sshclient
         with task_manager.acquire(self.context, self.node.uuid) as task:
             task.node['driver_info']['ssh_virt_type'] = 'virsh'
             result = self.driver.management.get_boot_device(task)
@@ -846,7 +930,7 @@ class SSHDriverTestCase(db_base.DbTestCase):
     @mock.patch.object(ssh, '_get_hosts_name_for_node')
     def test_get_boot_device_not_supported(self, mock_h, mock_get_conn):
         mock_h.return_value = 'NodeName'
-        mock_get_conn.return_value = self.sshclient
+        mock_get_conn.return_value.__enter__.return_value = self.sshclient
         # vmware does not support get_boot_device()
         self.node['driver_info']['ssh_virt_type'] = 'vmware'
         with task_manager.acquire(self.context, self.node.uuid) as task:
@@ -0,0 +1,158 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Test class for the SSH connection pool."""
+
+import time
+
+import eventlet
+import mock
+
+from ironic.common import exception
+from ironic.common import utils
+from ironic.drivers.modules import ssh_pool
+from ironic.tests import base
+
+
+@mock.patch.object(utils, 'ssh_connect')
+class SSHConnectionPoolTestCase(base.TestCase):
+
+    def setUp(self):
+        super(SSHConnectionPoolTestCase, self).setUp()
+        self.pool = ssh_pool.SSHConnectionPool()
+        self.info = {'host': '10.0.0.1', 'port': 22, 'username': 'user',
+                     'password': 'secret'}
+
+    def _client(self, active=True):
+        client = mock.Mock()
+        client.get_transport.return_value.is_active.return_value = active
+        return client
+
+    def _use(self, info=None):
+        with self.pool.connection(info or self.info) as client:
+            return client
+
+    def test_connection_reused(self, connect_mock):
+        connect_mock.return_value = self._client()
+
+        self.assertIs(self._use(), self._use())
+
+        connect_mock.assert_called_once_with(self.info)
+        self.assertEqual({'connects': 1, 'reused': 1, 'evicted': 0,
+                          'idle': 1}, self.pool.get_stats())
+
+    def test_connection_per_credentials(self, connect_mock):
+        connect_mock.side_effect = lambda info: self._client()
+        other = dict(self.info, username='other')
+
+        self.assertIsNot(self._use(), self._use(other))
+
+        self.assertEqual(2, connect_mock.call_count)
+
+    def test_connection_dead_not_reused(self, connect_mock):
+        dead = self._client()
+        connect_mock.side_effect = [dead, self._client()]
+        self._use()
+        dead.get_transport.return_value.is_active.return_value = False
+
+        self.assertIsNot(dead, self._use())
+
+        dead.close.assert_called_once_with()
+        self.assertEqual(2, connect_mock.call_count)
+
+    def test_connection_not_shared(self, connect_mock):
+        connect_mock.side_effect = lambda info: self._client()
+
+        with self.pool.connection(self.info) as client1:
+            with self.pool.connection(self.info) as client2:
+                self.assertIsNot(client1, client2)
+
+        self.assertEqual(2, self.pool.get_stats()['idle'])
+
+    def test_connection_released_on_error(self, connect_mock):
+        connect_mock.return_value = self._client()
+
+        def _fail():
+            with self.pool.connection(self.info):
+                raise exception.SSHCommandFailed(cmd='foo')
+
+        self.assertRaises(exception.SSHCommandFailed, _fail)
+        self._use()
+
+        connect_mock.assert_called_once_with(self.info)
+
+    def test_connect_failed(self, connect_mock):
+        connect_mock.side_effect = exception.SSHConnectFailed(host='fake')
+
+        self.assertRaises(exception.SSHConnectFailed, self._use)
+        self.assertEqual(0, self.pool.get_stats()['idle'])
+
+    def test_max_connections_per_host(self, connect_mock):
+        self.config(max_connections_per_host=1, group='ssh')
+        connect_mock.side_effect = lambda info: self._client()
+        events = []
+
+        def _use(name):
+            with self.pool.connection(self.info):
+                events.append(name + ' start')
+                eventlet.sleep(0)
+                events.append(name + ' end')
+
+        threads = [eventlet.spawn(_use, name) for name in ('a', 'b')]
+        for thread in threads:
+            thread.wait()
+
+        self.assertEqual(['a start', 'a end', 'b start', 'b end'], events)
+        connect_mock.assert_called_once_with(self.info)
+
+    def test_idle_timeout_zero(self, connect_mock):
+        self.config(connection_idle_timeout=0, group='ssh')
+        client = self._client()
+        connect_mock.return_value = client
+
+        self._use()
+
+        client.close.assert_called_once_with()
+        self.assertEqual(0, self.pool.get_stats()['idle'])
+
+    @mock.patch.object(time, 'time')
+    def test_evict_idle(self, time_mock, connect_mock):
+        self.config(connection_idle_timeout=60, group='ssh')
+        idle, recent = self._client(), self._client()
+        connect_mock.side_effect = [idle, recent]
+        time_mock.return_value = 1000
+        connection1 = self.pool.connection(self.info)
+        connection2 = self.pool.connection(self.info)
+        connection1.__enter__()
+        connection2.__enter__()
+        connection1.__exit__(None, None, None)
+        time_mock.return_value = 1030
+        connection2.__exit__(None, None, None)
+
+        time_mock.return_value = 1061
+        self.assertIs(recent, self._use())
+
+        idle.close.assert_called_once_with()
+        self.assertFalse(recent.close.called)
+        self.assertEqual(1, self.pool.get_stats()['evicted'])
+
+    def test_close_all(self, connect_mock):
+        client = self._client()
+        connect_mock.return_value = client
+        self._use()
+
+        self.pool.close_all()
+
+        client.close.assert_called_once_with()
+        self.assertEqual(0, self.pool.get_stats()['idle'])
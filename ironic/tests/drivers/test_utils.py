@@ -13,10 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
 import mock
 
 from ironic.common import driver_factory
 from ironic.common import exception
+from ironic.common import states
 from ironic.conductor import task_manager
 from ironic.db import api as db_api
 from ironic.drivers.modules import fake
@@ -132,3 +135,56 @@ class UtilsTestCase(base.TestCase):
         with task_manager.acquire(self.context, self.node.uuid) as task:
             node_macs = driver_utils.get_node_mac_addresses(task)
         self.assertEqual(sorted([p.address for p in ports]), sorted(node_macs))
+
+
+@mock.patch.object(time, 'sleep')
+class WaitForPowerStateTestCase(base.TestCase):
+
+    def _slept(self, sleep_mock):
+        return [c[0][0] for c in sleep_mock.call_args_list]
+
+    def test_reached(self, sleep_mock):
+        get_state = mock.Mock(side_effect=[states.POWER_OFF, None,
+                                           states.POWER_ON])
+
+        state = driver_utils.wait_for_power_state(get_state, states.POWER_ON,
+                                                  60)
+
+        self.assertEqual(states.POWER_ON, state)
+        self.assertEqual(3, get_state.call_count)
+        self.assertEqual(3, sleep_mock.call_count)
+
+    def test_first_check_after_initial_interval(self, sleep_mock):
+        get_state = mock.Mock(return_value=states.POWER_ON)
+
+        driver_utils.wait_for_power_state(get_state, states.POWER_ON, 60,
+                                          initial_interval=0.5)
+
+        get_state.assert_called_once_with()
+        self.assertAlmostEqual(0.5, self._slept(sleep_mock)[0], delta=0.05)
+
+    def test_backoff_capped(self, sleep_mock):
+        get_state = mock.Mock(return_value=states.POWER_OFF)
+
+        state = driver_utils.wait_for_power_state(get_state, states.POWER_ON,
+                                                  30, initial_interval=1,
+                                                  max_interval=4)
+
+        self.assertEqual(states.ERROR, state)
+        slept = self._slept(sleep_mock)
+        self.assertAlmostEqual(30, sum(slept))
+        for expected, actual in zip([1, 1.5, 2.25, 3.375, 4, 4], slept):
+            self.assertAlmostEqual(expected, actual, delta=expected * 0.1)
+        for actual in slept:
+            self.assertTrue(actual <= 4 * 1.1)
+        self.assertEqual(len(slept), get_state.call_count)
+
+    def test_timeout_zero(self, sleep_mock):
+        get_state = mock.Mock(return_value=states.POWER_OFF)
+
+        state = driver_utils.wait_for_power_state(get_state, states.POWER_ON,
+                                                  0)
+
+        self.assertEqual(states.ERROR, state)
+        get_state.assert_called_once_with()
+        self.assertFalse(sleep_mock.called)
@@ -12,6 +12,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import BaseHTTPServer
+import re
+import SocketServer
+import threading
+import time
+
 from ironic.common import exception
 
 
@@ -114,3 +120,80 @@ class FakeImage(object):
             self.__dict__['raw'][key] = value
         except KeyError:
             raise AttributeError(key)
+
+
+class _SwiftRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the objects of a FakeSwiftServer, honouring Range headers."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split('?', 1)[0]
+        data = server.objects.get(path)
+        if data is None:
+            self.send_error(404)
+            return
+        range_header = self.headers.get('Range')
+        server.ranges.append(range_header)
+        match = re.match(r'bytes=(\d+)-(\d+)$', range_header or '')
+        if match and not server.ignore_ranges:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), len(data) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             'bytes %d-%d/%d' % (start, end, len(data)))
+        else:
+            start, end = 0, len(data) - 1
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        chunk_size = 64 * 1024
+        for offset in range(start, end + 1, chunk_size):
+            chunk = data[offset:min(offset + chunk_size, end + 1)]
+            self.wfile.write(chunk)
+            if server.stream_rate:
+                time.sleep(len(chunk) / float(server.stream_rate))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSwiftServer(SocketServer.ThreadingMixIn,
+                      BaseHTTPServer.HTTPServer):
+    """A local HTTP server standing in for Swift temporary URLs.
+
+    Objects are added to the objects dict, keyed by their path. The Range
+    headers of the requests are recorded in ranges.
+
+    :param ignore_ranges: whether to answer range requests with the whole
+                          object, like servers which do not support them.
+    :param stream_rate: if set, the maximum number of bytes per second
+                        sent in answer to each request.
+    """
+
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, ignore_ranges=False, stream_rate=None):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           _SwiftRequestHandler)
+        self.objects = {}
+        self.ranges = []
+        self.ignore_ranges = ignore_ranges
+        self.stream_rate = stream_rate
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        args=(0.05,))
+        self._thread.daemon = True
+
+    @property
+    def endpoint_url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
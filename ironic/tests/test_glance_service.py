@@ -16,9 +16,13 @@
 
 import datetime
 import filecmp
+import hashlib
 import os
 import tempfile
+import time
 
+import eventlet
+import fixtures
 import mock
 import testtools
 
@@ -26,6 +30,7 @@ import testtools
 from ironic.common import exception
 from ironic.common.glance_service import base_image_service
 from ironic.common.glance_service import service_utils
+from ironic.common.glance_service.v2 import image_service as glance_v2
 from ironic.common import image_service as service
 from ironic.openstack.common import context
 from ironic.openstack.common import jsonutils
@@ -624,6 +629,230 @@ class TestGlanceImageService(base.TestCase):
                          wrapped_func(self.service, **params))
 
 
+class ListWriter(object):
+    """Records what is written to it."""
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def getvalue(self):
+        return ''.join(self.writes)
+
+
+def _chunks(chunks, error=None):
+    for chunk in chunks:
+        yield chunk
+    if error is not None:
+        raise error
+
+
+@mock.patch.object(time, 'sleep')
+class TestGlanceDownload(base.TestCase):
+
+    def setUp(self):
+        super(TestGlanceDownload, self).setUp()
+        self.context = context.RequestContext(auth_token=True)
+        self.writer = ListWriter()
+
+    def _service(self, attempts, **image):
+        attempts = iter(attempts)
+
+        class MyGlanceStubClient(stubs.StubGlanceClient):
+            """A client returning the given data for each request."""
+            def get(self, image_id):
+                return stubs.FakeImage(image)
+
+            def data(self, image_id):
+                return next(attempts)
+
+        return service.Service(MyGlanceStubClient(), 1, self.context)
+
+    def test_download_checksum(self, mock_sleep):
+        checksum = hashlib.md5('abcdef').hexdigest()
+        stub_service = self._service([['abc', 'def']], checksum=checksum)
+
+        self.assertEqual(checksum,
+                         stub_service.download('image', self.writer))
+        self.assertEqual('abcdef', self.writer.getvalue())
+
+    def test_download_checksum_mismatch(self, mock_sleep):
+        checksum = hashlib.md5('abcdef').hexdigest()
+        stub_service = self._service([['abc', 'dex']], checksum=checksum)
+
+        self.assertRaises(exception.ImageChecksumError,
+                          stub_service.download, 'image', self.writer)
+
+    def test_download_os_hash(self, mock_sleep):
+        stub_service = self._service(
+            [['abc']], checksum='ignored', os_hash_algo='sha512',
+            os_hash_value=hashlib.sha512('abc').hexdigest())
+
+        self.assertIsNone(stub_service.download('image', self.writer))
+
+    def test_download_no_checksum(self, mock_sleep):
+        stub_service = self._service([['abc']])
+
+        self.assertIsNone(stub_service.download('image', self.writer))
+        self.assertEqual('abc', self.writer.getvalue())
+
+    def test_download_checksum_not_verified(self, mock_sleep):
+        self.config(glance_verify_checksum=False, group='glance')
+        stub_service = self._service([['abc']], checksum='wrong')
+
+        self.assertIsNone(stub_service.download('image', self.writer))
+
+    def test_download_resumed(self, mock_sleep):
+        self.config(glance_num_retries=2, group='glance')
+        data = 'abcdefgh'
+        stub_service = self._service(
+            [_chunks(['abc', 'de'], IOError('reset')),
+             _chunks(['ab', 'cdef'], exception.CommunicationError()),
+             _chunks(['abcd', 'efgh'])],
+            checksum=hashlib.md5(data).hexdigest())
+
+        stub_service.download('image', self.writer)
+
+        self.assertEqual(data, self.writer.getvalue())
+        self.assertEqual([mock.call(1), mock.call(2)],
+                         mock_sleep.call_args_list)
+
+    def test_download_resume_fails(self, mock_sleep):
+        self.config(glance_num_retries=1, group='glance')
+        stub_service = self._service([_chunks(['abc'], IOError('reset')),
+                                      _chunks(['ab'], IOError('reset'))])
+
+        self.assertRaises(exception.GlanceConnectionFailed,
+                          stub_service.download, 'image', self.writer)
+        self.assertEqual('abc', self.writer.getvalue())
+
+    def test_download_write_error_not_retried(self, mock_sleep):
+        self.config(glance_num_retries=2, glance_download_buffer_size=0,
+                    group='glance')
+        stub_service = self._service([['abc', 'def'], ['abc', 'def']])
+        self.writer.write = mock.Mock(side_effect=IOError(28, 'No space'))
+
+        self.assertRaises(IOError, stub_service.download, 'image',
+                          self.writer)
+        self.writer.write.assert_called_once_with('abc')
+        self.assertFalse(mock_sleep.called)
+
+    def test_download_buffered(self, mock_sleep):
+        self.config(glance_download_buffer_size=4, group='glance')
+        stub_service = self._service([['ab', 'cd', 'ef']])
+
+        stub_service.download('image', self.writer)
+
+        self.assertEqual(['abcd', 'ef'], self.writer.writes)
+
+    def test_download_unbuffered(self, mock_sleep):
+        self.config(glance_download_buffer_size=0, group='glance')
+        stub_service = self._service([['ab', 'cd', 'ef']])
+
+        stub_service.download('image', self.writer)
+
+        self.assertEqual(['ab', 'cd', 'ef'], self.writer.writes)
+
+    def test_retry_interval(self, mock_sleep):
+        self.config(glance_retry_interval=2, glance_max_retry_interval=5,
+                    group='glance')
+        self.assertEqual([2, 4, 5, 5],
+                         [base_image_service._retry_interval(attempt)
+                          for attempt in range(1, 5)])
+
+
+class TestImageMetadataCache(base.TestCase):
+    def setUp(self):
+        super(TestImageMetadataCache, self).setUp()
+        self.client = stubs.StubGlanceClient()
+        self.client.get = mock.Mock(wraps=self.client.get)
+        self.client.images.get = self.client.get
+        self.client.create(id='public', is_public=True, properties={})
+        self.client.create(id='private', is_public=False,
+                           properties={'project_id': 'p1'})
+        self.cache = base_image_service.METADATA_CACHE
+
+    def _service(self, project_id='p1', version=1):
+        ctx = context.RequestContext()
+        ctx.project_id = project_id
+        ctx.user_id = 'u1'
+        return service.Service(self.client, version, ctx)
+
+    def test_show_cached(self):
+        glance = self._service()
+        glance.show('public')
+        self.assertEqual('public', glance.show('public')['id'])
+        self.client.get.assert_called_once_with('public')
+        self.assertEqual({'hits': 1, 'misses': 1, 'entries': 1},
+                         self.cache.get_stats())
+
+    def test_public_image_shared(self):
+        self._service('p1').show('public')
+        self._service('p2').show('public')
+        self.assertEqual(1, self.client.get.call_count)
+
+    def test_private_image_per_project(self):
+        self._service('p1').show('private')
+        self._service('p1').show('private')
+        self.assertEqual(1, self.client.get.call_count)
+        self.assertRaises(exception.ImageNotFound,
+                          self._service('p2').show, 'private')
+        self.assertEqual(2, self.client.get.call_count)
+
+    def test_availability_checked_on_hit(self):
+        self.client.create(id='mine', is_public=False,
+                           properties={'user_id': 'u1'})
+        self._service(None).show('mine')
+        glance = self._service(None)
+        glance.context.user_id = 'u2'
+        self.assertRaises(exception.ImageNotFound, glance.show, 'mine')
+        self.assertEqual(1, self.client.get.call_count)
+
+    def test_versions_not_shared(self):
+        self._service(version=1).show('public')
+        self._service(version=2).show('public')
+        self.assertEqual(2, self.client.get.call_count)
+
+    @mock.patch.object(base_image_service.time, 'time')
+    def test_expired(self, mock_time):
+        self.config(glance_metadata_cache_ttl=60, group='glance')
+        mock_time.return_value = 1000
+        self._service().show('public')
+        mock_time.return_value = 1059
+        self._service().show('public')
+        self.assertEqual(1, self.client.get.call_count)
+        mock_time.return_value = 1060
+        self._service().show('public')
+        self.assertEqual(2, self.client.get.call_count)
+        self.assertEqual(1, self.cache.get_stats()['expired'])
+
+    def test_size_bound(self):
+        self.config(glance_metadata_cache_size=1, group='glance')
+        self._service().show('public')
+        self._service().show('private')
+        self._service().show('private')
+        self._service().show('public')
+        self.assertEqual(3, self.client.get.call_count)
+        self.assertEqual(1, self.cache.get_stats()['entries'])
+        self.assertEqual(2, self.cache.get_stats()['evictions'])
+
+    def test_disabled(self):
+        self.config(glance_metadata_cache_ttl=0, group='glance')
+        self._service().show('public')
+        self._service().show('public')
+        self.assertEqual(2, self.client.get.call_count)
+        self.assertEqual({'entries': 0}, self.cache.get_stats())
+
+    def test_update_invalidates(self):
+        glance = self._service()
+        glance.show('public')
+        glance.update('public', {'name': 'new'})
+        self.assertEqual('new', glance.show('public')['name'])
+        self.assertEqual(2, self.client.get.call_count)
+
+
 def _create_failing_glance_client(info):
     class MyGlanceStubClient(stubs.StubGlanceClient):
         """A client that fails the first time, then succeeds."""
@@ -639,6 +868,8 @@ def _create_failing_glance_client(info):
 class TestGlanceSwiftTempURL(base.TestCase):
     def setUp(self):
         super(TestGlanceSwiftTempURL, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.common.glance_service.v2.image_service._TEMP_URLS', {}))
         client = stubs.StubGlanceClient()
         self.context = context.RequestContext()
         self.service = service.Service(client, 2, self.context)
@@ -682,6 +913,50 @@ class TestGlanceSwiftTempURL(base.TestCase):
             key=CONF.glance.swift_temp_url_key,
             method='GET')
 
+    @mock.patch.object(glance_v2.time, 'time')
+    @mock.patch('swiftclient.utils.generate_temp_url')
+    def test_swift_temp_url_reused(self, tempurl_mock, time_mock):
+        tempurl_mock.side_effect = ['/path?sig=1', '/path?sig=2']
+        time_mock.return_value = 1000
+
+        first = self.service.swift_temp_url(image_info=self.fake_image)
+        time_mock.return_value = 1599
+        self.assertEqual(first,
+                         self.service.swift_temp_url(
+                             image_info=self.fake_image))
+        self.assertEqual(1, tempurl_mock.call_count)
+
+        # NOTE: half of the 1200 seconds the URL is valid for have elapsed
+        time_mock.return_value = 1600
+        self.assertEqual(CONF.glance.swift_endpoint_url + '/path?sig=2',
+                         self.service.swift_temp_url(
+                             image_info=self.fake_image))
+        self.assertEqual(2, tempurl_mock.call_count)
+
+    @mock.patch('swiftclient.utils.generate_temp_url')
+    def test_swift_temp_url_reuse_disabled(self, tempurl_mock):
+        self.config(swift_temp_url_reuse_fraction=0, group='glance')
+        tempurl_mock.return_value = '/path?sig'
+
+        self.service.swift_temp_url(image_info=self.fake_image)
+        self.service.swift_temp_url(image_info=self.fake_image)
+        self.assertEqual(2, tempurl_mock.call_count)
+        self.assertEqual({}, glance_v2._TEMP_URLS)
+
+    @mock.patch('swiftclient.utils.generate_temp_url')
+    def test_swift_temp_url_per_image_container_and_key(self, tempurl_mock):
+        tempurl_mock.return_value = '/path?sig'
+        other_image = {'id': 'a9d1ecb4-35a0-4c2d-a1b3-1cb0b1ac6d8b'}
+
+        self.service.swift_temp_url(image_info=self.fake_image)
+        self.service.swift_temp_url(image_info=other_image)
+        self.config(swift_container='other', group='glance')
+        self.service.swift_temp_url(image_info=self.fake_image)
+        self.config(swift_temp_url_key='newkey', group='glance')
+        self.service.swift_temp_url(image_info=self.fake_image)
+        self.service.swift_temp_url(image_info=self.fake_image)
+        self.assertEqual(4, tempurl_mock.call_count)
+
     def test_swift_temp_url_url_bad_no_info(self):
         self.assertRaises(exception.ImageUnacceptable,
                           self.service.swift_temp_url,
@@ -712,6 +987,119 @@ class TestGlanceSwiftTempURL(base.TestCase):
                           self.service._validate_temp_url_config)
 
 
+class TestGlanceSwiftDownload(base.TestCase):
+    def setUp(self):
+        super(TestGlanceSwiftDownload, self).setUp()
+        self.server = stubs.FakeSwiftServer()
+        self.image_id = '757274c4-2856-4bd2-bb20-9a4a231e187b'
+        self.data = os.urandom(100000)
+        self.image_info = {'id': self.image_id, 'size': len(self.data),
+                           'checksum': hashlib.md5(self.data).hexdigest()}
+        self.service = service.Service(stubs.StubGlanceClient(), 2,
+                                       context.RequestContext())
+        self.service.show = mock.Mock(return_value=self.image_info)
+        self.config(swift_temp_url_key='correcthorsebatterystaple',
+                    swift_endpoint_url=self.server.endpoint_url,
+                    swift_account='AUTH_a422b2',
+                    swift_download_streams=4,
+                    swift_download_min_range_size=10000,
+                    group='glance')
+        self.server.objects['/v1/AUTH_a422b2/glance/' + self.image_id] = (
+            self.data)
+        self.path = tempfile.mkstemp()[1]
+        self.addCleanup(os.unlink, self.path)
+
+    def _download(self):
+        with self.server:
+            return self.service.download_from_swift(self.image_id,
+                                                    self.path)
+
+    def _read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_download_from_swift(self):
+        checksum = self._download()
+        self.assertEqual(self.image_info['checksum'], checksum)
+        self.assertEqual(self.data, self._read())
+        self.assertEqual(['bytes=0-24999', 'bytes=25000-49999',
+                          'bytes=50000-74999', 'bytes=75000-99999'],
+                         sorted(self.server.ranges))
+
+    def test_download_from_swift_min_range_size(self):
+        self.config(swift_download_min_range_size=40000, group='glance')
+        self._download()
+        self.assertEqual(self.data, self._read())
+        self.assertEqual(['bytes=0-49999', 'bytes=50000-99999'],
+                         sorted(self.server.ranges))
+
+    def test_download_from_swift_small_image(self):
+        self.config(swift_download_min_range_size=1000000, group='glance')
+        self._download()
+        self.assertEqual(self.data, self._read())
+        self.assertEqual(['bytes=0-99999'], self.server.ranges)
+
+    def test_download_from_swift_range_failed(self):
+        writes = []
+
+        def _download_range(image_id, url, path, start, end):
+            if start == 0:
+                raise exception.ImageDownloadFailed(image_href=image_id,
+                                                    reason='boom')
+            for i in range(10):
+                eventlet.sleep(0.01)
+                writes.append(start)
+
+        with mock.patch.object(self.service, '_download_range',
+                               _download_range):
+            self.assertRaises(exception.ImageDownloadFailed,
+                              self.service.download_from_swift,
+                              self.image_id, self.path)
+            count = len(writes)
+            eventlet.sleep(0.1)
+
+        self.assertEqual(count, len(writes))
+        self.assertTrue(count < 30)
+
+    def test_download_from_swift_bad_checksum(self):
+        self.image_info['checksum'] = 'f00'
+        self.assertRaises(exception.ImageChecksumError, self._download)
+
+    def test_download_from_swift_no_verify(self):
+        self.config(glance_verify_checksum=False, group='glance')
+        self.image_info['checksum'] = 'f00'
+        self.assertIsNone(self._download())
+        self.assertEqual(self.data, self._read())
+
+    def test_download_from_swift_ranges_ignored(self):
+        self.server.ignore_ranges = True
+        self.assertRaises(exception.ImageDownloadFailed, self._download)
+
+    def test_download_from_swift_missing_object(self):
+        self.server.objects.clear()
+        self.assertRaises(exception.ImageDownloadFailed, self._download)
+
+    @mock.patch.object(glance_v2.requests, 'get')
+    def test_download_from_swift_timeout(self, mock_get):
+        self.config(swift_download_timeout=30, group='glance')
+        mock_get.side_effect = glance_v2.requests.exceptions.ReadTimeout()
+
+        self.assertRaises(exception.ImageDownloadFailed, self._download)
+        self.assertEqual(30, mock_get.call_args[1]['timeout'])
+
+    def test_download_from_swift_no_size(self):
+        for size in (None, 0):
+            self.image_info['size'] = size
+            self.assertRaises(exception.ImageDownloadFailed,
+                              self.service.download_from_swift,
+                              self.image_id, self.path)
+        self.assertEqual([], self.server.ranges)
+
+    def test_download_from_swift_short_object(self):
+        self.image_info['size'] = len(self.data) + 100
+        self.assertRaises(exception.ImageDownloadFailed, self._download)
+
+
 class TestGlanceUrl(base.TestCase):
 
     def test_generate_glance_http_url(self):
@@ -13,6 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
+import mock
 from oslo.config import cfg
 
 from ironic.common import exception
@@ -32,7 +35,7 @@ class HashRingTestCase(base.TestCase):
     #                fake -> foo, bar
     #             if hosts = [foo, bar, baz]:
     #                fake -> foo, bar, baz
-    #                fake-again -> bar, baz, foo
+    #                fake-node -> bar, baz, foo
 
     def test_create_ring(self):
         hosts = ['foo', 'bar']
@@ -59,19 +62,19 @@ class HashRingTestCase(base.TestCase):
         hosts = ['foo', 'bar', 'baz']
         ring = hash.HashRing(hosts, replicas=1)
         self.assertEqual(['foo'], ring.get_hosts('fake'))
-        self.assertEqual(['bar'], ring.get_hosts('fake-again'))
+        self.assertEqual(['bar'], ring.get_hosts('fake-node'))
 
     def test_distribution_two_replicas(self):
         hosts = ['foo', 'bar', 'baz']
         ring = hash.HashRing(hosts, replicas=2)
         self.assertEqual(['foo', 'bar'], ring.get_hosts('fake'))
-        self.assertEqual(['bar', 'baz'], ring.get_hosts('fake-again'))
+        self.assertEqual(['bar', 'baz'], ring.get_hosts('fake-node'))
 
     def test_distribution_three_replicas(self):
         hosts = ['foo', 'bar', 'baz']
         ring = hash.HashRing(hosts, replicas=3)
         self.assertEqual(['foo', 'bar', 'baz'], ring.get_hosts('fake'))
-        self.assertEqual(['bar', 'baz', 'foo'], ring.get_hosts('fake-again'))
+        self.assertEqual(['bar', 'baz', 'foo'], ring.get_hosts('fake-node'))
 
     def test_ignore_hosts(self):
         hosts = ['foo', 'bar', 'baz']
@@ -90,9 +93,9 @@ class HashRingTestCase(base.TestCase):
                                                         ignore_hosts=['foo']))
         self.assertEqual(['baz'], ring.get_hosts('fake',
                                                  ignore_hosts=['foo', 'bar']))
-        self.assertEqual(['baz', 'foo'], ring.get_hosts('fake-again',
+        self.assertEqual(['baz', 'foo'], ring.get_hosts('fake-node',
                                                         ignore_hosts=['bar']))
-        self.assertEqual(['foo'], ring.get_hosts('fake-again',
+        self.assertEqual(['foo'], ring.get_hosts('fake-node',
                                                  ignore_hosts=['bar', 'baz']))
         self.assertEqual([], ring.get_hosts('fake',
                                             ignore_hosts=hosts))
@@ -114,6 +117,94 @@ class HashRingTestCase(base.TestCase):
                           hash.HashRing,
                           hosts)
 
+    def test_ignore_duplicate_hosts(self):
+        hosts = ['foo', 'bar', 'baz']
+        ring = hash.HashRing(hosts, replicas=2)
+        self.assertEqual(['baz'], ring.get_hosts('fake',
+                                                 ignore_hosts=['foo', 'bar',
+                                                               'foo']))
+
+    def test_part2host_distribution(self):
+        CONF.set_override('hash_partition_exponent', 3)
+        ring = hash.HashRing(['foo', 'bar', 'baz'])
+        self.assertEqual([0, 0, 0, 1, 1, 1, 2, 2], list(ring.part2host))
+
+    def test_get_hosts_many(self):
+        hosts = ['foo', 'bar', 'baz']
+        ring = hash.HashRing(hosts, replicas=2)
+        self.assertEqual({'fake': ['foo', 'bar'],
+                          'fake-node': ['bar', 'baz']},
+                         ring.get_hosts_many(['fake', 'fake-node', 'fake']))
+
+    def test_get_hosts_many_ignore_hosts(self):
+        hosts = ['foo', 'bar', 'baz']
+        ring = hash.HashRing(hosts, replicas=2)
+        self.assertEqual({'fake': ['foo', 'baz'],
+                          'fake-node': ['baz', 'foo']},
+                         ring.get_hosts_many(['fake', 'fake-node'],
+                                             ignore_hosts=['bar']))
+
+    def test_get_hosts_many_matches_get_hosts(self):
+        CONF.set_override('hash_partition_exponent', 4)
+        ring = hash.HashRing(['foo', 'bar', 'baz', 'qux'], replicas=3)
+        data = ['node-%d' % i for i in range(100)]
+        result = ring.get_hosts_many(data, ignore_hosts=['qux'])
+        for d in data:
+            self.assertEqual(ring.get_hosts(d, ignore_hosts=['qux']),
+                             result[d])
+
+    def test_get_hosts_many_invalid_data(self):
+        ring = hash.HashRing(['foo', 'bar'])
+        self.assertRaises(exception.Invalid,
+                          ring.get_hosts_many,
+                          ['fake', None])
+
+    def test_get_moved_partitions(self):
+        CONF.set_override('hash_partition_exponent', 4)
+        old_ring = hash.HashRing(['foo', 'bar'])
+        new_ring = hash.HashRing(['foo', 'bar', 'baz'])
+        # foo owns 0-7 in old_ring and 0-5 in new_ring
+        self.assertEqual(set([6, 7]),
+                         hash.get_moved_partitions(old_ring, new_ring, 'foo'))
+        self.assertEqual(set(range(11, 16)),
+                         hash.get_moved_partitions(old_ring, new_ring, 'baz'))
+
+    def test_get_moved_partitions_no_ring(self):
+        CONF.set_override('hash_partition_exponent', 2)
+        ring = hash.HashRing(['foo', 'bar'])
+        self.assertEqual(set([0, 1]),
+                         hash.get_moved_partitions(None, ring, 'foo'))
+        self.assertEqual(set([2, 3]),
+                         hash.get_moved_partitions(ring, None, 'bar'))
+        self.assertEqual(set(), hash.get_moved_partitions(ring, ring, 'foo'))
+
+    def test_get_hash_key_range(self):
+        CONF.set_override('hash_partition_exponent', 4)
+        ring = hash.HashRing(['foo', 'bar', 'baz'])
+        self.assertEqual((0, 6 << 28), ring.get_hash_key_range('foo'))
+        self.assertEqual((6 << 28, 11 << 28), ring.get_hash_key_range('bar'))
+        self.assertEqual((11 << 28, 16 << 28),
+                         ring.get_hash_key_range('baz'))
+        self.assertIsNone(ring.get_hash_key_range('qux'))
+
+    def test_get_hash_key_range_matches_get_hosts(self):
+        CONF.set_override('hash_partition_exponent', 5)
+        ring = hash.HashRing(['foo', 'bar', 'baz'])
+        for i in range(100):
+            data = 'node-%d' % i
+            host = ring.get_hosts(data)[0]
+            start, end = ring.get_hash_key_range(host)
+            self.assertTrue(start <= hash.get_hash_key(data) < end)
+
+    def test_get_partitions_hash_key_ranges(self):
+        CONF.set_override('hash_partition_exponent', 4)
+        ring = hash.HashRing(['foo', 'bar'])
+        self.assertEqual([], ring.get_partitions_hash_key_ranges([]))
+        self.assertEqual([(1 << 28, 4 << 28), (7 << 28, 8 << 28),
+                          (15 << 28, 16 << 28)],
+                         ring.get_partitions_hash_key_ranges(
+                                 set([15, 3, 1, 2, 7])))
+
     def test_get_hosts_invalid_data(self):
         hosts = ['foo', 'bar']
         ring = hash.HashRing(hosts)
@@ -153,8 +244,8 @@ class HashRingManagerTestCase(db_base.DbTestCase):
 
     def test_hash_ring_manager_no_refresh(self):
         # If a new conductor is registered after the ring manager is
-        # initialized, it won't be seen. Long term this is probably
-        # undesirable, but today is the intended behavior.
+        # initialized, it won't be seen until the rings are refreshed
+        # after CONF.hash_ring_reset_interval.
         self.assertRaises(exception.DriverNotFound,
                           self.ring_manager.get_hash_ring,
                           'driver1')
@@ -162,3 +253,109 @@ class HashRingManagerTestCase(db_base.DbTestCase):
         self.assertRaises(exception.DriverNotFound,
                           self.ring_manager.get_hash_ring,
                           'driver1')
+
+    @mock.patch.object(time, 'time')
+    def test_hash_ring_manager_refresh(self, mock_time):
+        CONF.set_override('hash_ring_reset_interval', 30)
+        mock_time.return_value = 100
+        self.assertRaises(exception.DriverNotFound,
+                          self.ring_manager.get_hash_ring,
+                          'driver1')
+        self.register_conductors()
+        mock_time.return_value = 131
+        ring = self.ring_manager.get_hash_ring('driver1')
+        self.assertEqual(sorted(['host1', 'host2']), sorted(ring.hosts))
+
+    @mock.patch.object(time, 'time')
+    def test_hash_ring_manager_refresh_rebuilds_changed_rings(self,
+                                                              mock_time):
+        CONF.set_override('hash_ring_reset_interval', 30)
+        mock_time.return_value = 100
+        self.register_conductors()
+        ring1 = self.ring_manager.get_hash_ring('driver1')
+        ring2 = self.ring_manager.get_hash_ring('driver2')
+        self.dbapi.register_conductor({
+            'hostname': 'host3',
+            'drivers': ['driver2'],
+        })
+        mock_time.return_value = 131
+        self.assertIs(ring1, self.ring_manager.get_hash_ring('driver1'))
+        new_ring2 = self.ring_manager.get_hash_ring('driver2')
+        self.assertIsNot(ring2, new_ring2)
+        self.assertEqual(sorted(['host1', 'host3']), sorted(new_ring2.hosts))
+
+    def test_hash_ring_manager_refresh_now(self):
+        self.assertRaises(exception.DriverNotFound,
+                          self.ring_manager.get_hash_ring,
+                          'driver1')
+        self.register_conductors()
+        self.ring_manager.refresh()
+        ring = self.ring_manager.get_hash_ring('driver1')
+        self.assertEqual(sorted(['host1', 'host2']), sorted(ring.hosts))
+
+    def test_hash_ring_manager_generation(self):
+        self.register_conductors()
+        self.ring_manager.get_hash_ring('driver1')
+        generation = self.ring_manager.generation
+        self.ring_manager.refresh()
+        self.assertEqual(generation, self.ring_manager.generation)
+        self.dbapi.register_conductor({
+            'hostname': 'host3',
+            'drivers': ['driver2'],
+        })
+        self.ring_manager.refresh()
+        self.assertEqual(generation + 1, self.ring_manager.generation)
+        self.assertEqual(generation + 1,
+                         hash.HashRingManager().generation)
+
+    def test_hash_ring_manager_refresh_membership(self):
+        self.register_conductors()
+        self.ring_manager.refresh_membership()
+        ring = self.ring_manager.get_hash_ring('driver1')
+        self.assertEqual(sorted(['host1', 'host2']), sorted(ring.hosts))
+        self.dbapi.register_conductor({
+            'hostname': 'host3',
+            'drivers': ['driver1'],
+        })
+        self.ring_manager.refresh_membership()
+        ring = self.ring_manager.get_hash_ring('driver1')
+        self.assertEqual(sorted(['host1', 'host2', 'host3']),
+                         sorted(ring.hosts))
+
+    def test_hash_ring_manager_refresh_membership_unchanged(self):
+        self.register_conductors()
+        self.ring_manager.refresh_membership()
+        with mock.patch.object(self.dbapi,
+                               'get_active_driver_dict') as mock_d2c:
+            self.ring_manager.refresh_membership()
+            self.assertFalse(mock_d2c.called)
+
+    def test_hash_ring_manager_refresh_membership_conductor_restarted(self):
+        self.register_conductors()
+        self.ring_manager.refresh_membership()
+        self.dbapi.unregister_conductor('host2')
+        self.dbapi.register_conductor({
+            'hostname': 'host2',
+            'drivers': ['driver2'],
+        })
+        self.ring_manager.refresh_membership()
+        ring = self.ring_manager.get_hash_ring('driver2')
+        self.assertEqual(sorted(['host1', 'host2']), sorted(ring.hosts))
+
+    def test_hash_ring_manager_shared(self):
+        self.register_conductors()
+        ring = self.ring_manager.get_hash_ring('driver1')
+        with mock.patch.object(self.dbapi,
+                               'get_active_driver_dict') as mock_d2c:
+            other_manager = hash.HashRingManager()
+            self.assertIs(ring, other_manager.get_hash_ring('driver1'))
+            self.assertFalse(mock_d2c.called)
+
+    def test_hash_ring_manager_reset(self):
+        self.assertRaises(exception.DriverNotFound,
+                          self.ring_manager.get_hash_ring,
+                          'driver1')
+        self.register_conductors()
+        hash.HashRingManager.reset()
+        ring = self.ring_manager.get_hash_ring('driver1')
+        self.assertEqual(sorted(['host1', 'host2']), sorted(ring.hosts))
@@ -17,10 +17,16 @@
 #    under the License.
 
 import contextlib
+import os
+import struct
+import tempfile
+
 import fixtures
+import mock
 
 from ironic.common import exception
 from ironic.common import images
+from ironic.common import utils
 from ironic.openstack.common import excutils
 from ironic.tests import base
 
@@ -110,3 +116,191 @@ class IronicImagesTestCase(base.TestCase):
         self.assertEqual(expected_commands, self.executes)
 
         del self.executes
+
+
+class FakeImageService(object):
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.written = 0
+
+    def download(self, image_href, data):
+        for chunk in self.chunks:
+            data.write(chunk)
+            self.written += 1
+
+
+def _qcow2_header(backing_file=''):
+    offset = 72 if backing_file else 0
+    header = struct.pack('>4sIQI', 'QFI\xfb', 2, offset, len(backing_file))
+    return (header.ljust(72, '\0') + backing_file).ljust(512, '\0')
+
+
+class DetectImageFormatTestCase(base.TestCase):
+
+    def test_raw(self):
+        self.assertEqual('raw', images.detect_image_format('\0' * 512))
+
+    def test_qcow2(self):
+        self.assertEqual('qcow2', images.detect_image_format(_qcow2_header()))
+
+    def test_vdi(self):
+        header = '<<< VirtualBox Disk Image >>>'.ljust(0x40, '\0')
+        self.assertEqual('vdi',
+                         images.detect_image_format(header +
+                                                    '\x7f\x10\xda\xbe'))
+
+    def test_short(self):
+        self.assertEqual('raw', images.detect_image_format('QFI'))
+
+
+class StreamToRawTestCase(base.TestCase):
+
+    def setUp(self):
+        super(StreamToRawTestCase, self).setUp()
+        self.config(stream_image_downloads=True)
+        self.path = os.path.join(tempfile.mkdtemp(), 'image')
+        patcher = mock.patch.object(utils, 'execute')
+        self.execute = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fetch(self, chunks):
+        self.service = FakeImageService(chunks)
+        images.fetch_to_raw(None, 'image', self.path, self.service)
+
+    def test_raw(self):
+        chunks = ['\0' * 1024, 'data' * 256, '\0' * 1024, 'tail', '\0' * 8]
+        self._fetch(chunks)
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(''.join(chunks), f.read())
+        self.assertFalse(os.path.exists(self.path + '.part'))
+        self.assertFalse(self.execute.called)
+
+    def test_raw_small(self):
+        self._fetch(['small'])
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual('small', f.read())
+
+    def test_qcow2(self):
+        self._fetch([_qcow2_header(), 'data'])
+
+        self.execute.assert_called_once_with(
+            'qemu-img', 'convert', '-O', 'raw', self.path + '.part',
+            self.path, run_as_root=False)
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+    def test_qcow2_not_forced_raw(self):
+        self.config(force_raw_images=False)
+        self._fetch([_qcow2_header(), 'data'])
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(_qcow2_header() + 'data', f.read())
+        self.assertFalse(self.execute.called)
+
+    def test_qcow2_backing_file(self):
+        self.assertRaises(exception.ImageUnacceptable, self._fetch,
+                          [_qcow2_header('base.img'), 'data'])
+
+        # NOTE: the download stops as soon as the header is seen
+        self.assertEqual(0, self.service.written)
+        self.assertFalse(os.path.exists(self.path + '.part'))
+        self.assertFalse(os.path.exists(self.path))
+
+    @mock.patch.object(images, 'image_to_raw')
+    def test_other_format(self, mock_to_raw):
+        self._fetch(['KDMV'.ljust(512, '\0')])
+
+        mock_to_raw.assert_called_once_with('image', self.path,
+                                            self.path + '.part')
+
+    def test_direct_copy(self):
+        class DirectImageService(object):
+            def download(self, image_href, data):
+                os.write(data.fileno(), _qcow2_header('base.img'))
+
+        self.assertRaises(exception.ImageUnacceptable,
+                          images.fetch_to_raw, None, 'image', self.path,
+                          DirectImageService())
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+
+@mock.patch.object(images.service, 'Service')
+class FetchFromSwiftTestCase(base.TestCase):
+
+    def setUp(self):
+        super(FetchFromSwiftTestCase, self).setUp()
+        self.config(swift_download_streams=4, group='glance')
+        self.path = os.path.join(tempfile.mkdtemp(), 'image')
+        self.glance = mock.Mock()
+        self.glance.download.return_value = 'glance checksum'
+
+    def _from_swift(self, data):
+        def download_from_swift(image_href, path):
+            with open(path, 'wb') as f:
+                f.write(data)
+            return 'swift checksum'
+        return download_from_swift
+
+    def test_fetch(self, mock_service):
+        mock_service.return_value = self.glance
+        self.glance.download_from_swift.side_effect = self._from_swift('a')
+
+        self.assertEqual('swift checksum',
+                         images.fetch('ctx', 'image', self.path))
+        mock_service.assert_called_once_with(version=2, context='ctx')
+        self.glance.download_from_swift.assert_called_once_with('image',
+                                                                self.path)
+        self.assertFalse(self.glance.download.called)
+
+    def test_fetch_disabled(self, mock_service):
+        self.config(swift_download_streams=0, group='glance')
+        mock_service.return_value = self.glance
+
+        self.assertEqual('glance checksum',
+                         images.fetch('ctx', 'image', self.path))
+        mock_service.assert_called_once_with(version=1, context='ctx')
+        self.assertFalse(self.glance.download_from_swift.called)
+
+    def test_fetch_image_service(self, mock_service):
+        images.fetch('ctx', 'image', self.path, self.glance)
+
+        self.assertFalse(mock_service.called)
+        self.assertFalse(self.glance.download_from_swift.called)
+        self.assertTrue(self.glance.download.called)
+
+    def test_fetch_fallback(self, mock_service):
+        mock_service.return_value = self.glance
+        self.glance.download_from_swift.side_effect = (
+            exception.ImageDownloadFailed(image_href='image', reason='boom'))
+
+        self.assertEqual('glance checksum',
+                         images.fetch('ctx', 'image', self.path))
+        self.assertEqual([mock.call(version=2, context='ctx'),
+                          mock.call(version=1, context='ctx')],
+                         mock_service.call_args_list)
+        self.assertTrue(self.glance.download.called)
+
+    @mock.patch.object(utils, 'execute')
+    def test_stream_to_raw(self, mock_execute, mock_service):
+        self.config(stream_image_downloads=True)
+        mock_service.return_value = self.glance
+        self.glance.download_from_swift.side_effect = self._from_swift(
+            _qcow2_header() + 'data')
+
+        self.assertEqual('swift checksum',
+                         images.fetch_to_raw('ctx', 'image', self.path))
+        mock_execute.assert_called_once_with(
+            'qemu-img', 'convert', '-O', 'raw', self.path + '.part',
+            self.path, run_as_root=False)
+        self.assertFalse(self.glance.download.called)
+
+    def test_stream_to_raw_backing_file(self, mock_service):
+        self.config(stream_image_downloads=True)
+        mock_service.return_value = self.glance
+        self.glance.download_from_swift.side_effect = self._from_swift(
+            _qcow2_header('base.img'))
+
+        self.assertRaises(exception.ImageUnacceptable, images.fetch_to_raw,
+                          'ctx', 'image', self.path)
+        self.assertFalse(os.path.exists(self.path + '.part'))
@@ -0,0 +1,116 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure how long images.fetch_to_raw takes on large synthetic images.
+
+Serves a synthetic disk image, a quarter of it data and the rest zeros,
+from a fake image service in 64 KiB chunks, like glanceclient does, and
+reports the time, throughput and disk usage of fetch_to_raw with and
+without stream_image_downloads, for the image in raw format and, converted
+with qemu-img, in qcow2 format. Without qemu-img only the streamed raw
+image is measured, as the other cases need it.
+
+Usage: python -m tools.benchmarks.fetch_to_raw [image size in MiB]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from oslo.config import cfg
+from oslo import i18n
+i18n.install('ironic')
+
+from ironic.common import images  # noqa
+from ironic.common import utils  # noqa
+
+CONF = cfg.CONF
+
+CHUNK_SIZE = 64 * 1024
+MiB = 1024 * 1024
+
+
+class FakeImageService(object):
+    """Serves an image file in chunks, like the Glance image service."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def download(self, image_href, data):
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                data.write(chunk)
+
+
+def _make_raw_image(path, size):
+    block = os.urandom(MiB)
+    with open(path, 'wb') as f:
+        for i in range(size):
+            f.write(block if i % 4 == 0 else '\0' * MiB)
+
+
+def _has_qemu_img():
+    try:
+        utils.execute('qemu-img', '--help', check_exit_code=False)
+    except OSError:
+        return False
+    return True
+
+
+def _measure(source, dest_dir, stream):
+    CONF.set_override('stream_image_downloads', stream)
+    dest = os.path.join(dest_dir, 'dest')
+    start = time.time()
+    images.fetch_to_raw(None, 'image', dest, FakeImageService(source))
+    elapsed = time.time() - start
+    stat = os.stat(dest)
+    os.unlink(dest)
+    return elapsed, stat.st_size, stat.st_blocks * 512
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    work_dir = tempfile.mkdtemp()
+    try:
+        raw = os.path.join(work_dir, 'image.raw')
+        _make_raw_image(raw, size)
+        sources = [('raw', raw)]
+        qemu_img = _has_qemu_img()
+        if qemu_img:
+            qcow2 = os.path.join(work_dir, 'image.qcow2')
+            utils.execute('qemu-img', 'convert', '-O', 'qcow2', raw, qcow2)
+            sources.append(('qcow2', qcow2))
+        else:
+            print('qemu-img not found, only measuring streamed raw images')
+
+        print('%-6s %-8s %10s %10s %12s' % ('format', 'mode', 'seconds',
+                                            'MiB/s', 'disk MiB'))
+        for fmt, source in sources:
+            for stream in (False, True):
+                if not (stream or qemu_img):
+                    continue
+                elapsed, dest_size, disk = _measure(source, work_dir,
+                                                    stream)
+                print('%-6s %-8s %10.2f %10.1f %12d'
+                      % (fmt, 'stream' if stream else 'legacy', elapsed,
+                         dest_size / float(MiB) / elapsed, disk / MiB))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
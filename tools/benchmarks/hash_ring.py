@@ -0,0 +1,66 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure HashRing construction and lookups over a batch of node UUIDs.
+
+For each partition exponent and replica count, reports the time to build
+the ring, to map every UUID with get_hosts and to map the whole batch with
+get_hosts_many.
+
+Usage: python -m tools.benchmarks.hash_ring [number of uuids]
+"""
+
+import sys
+import time
+
+from oslo.config import cfg
+
+from ironic.common import hash_ring
+from ironic.common import utils
+
+CONF = cfg.CONF
+
+HOSTS = ['conductor-%d' % i for i in range(10)]
+EXPONENTS = (8, 12, 16)
+REPLICAS = (1, 2, 3)
+
+
+def _time(func, *args, **kwargs):
+    start = time.time()
+    func(*args, **kwargs)
+    return time.time() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    uuids = [utils.generate_uuid() for i in range(count)]
+    ignore_hosts = HOSTS[:1]
+
+    print('%d uuids, %d hosts, ignoring %s' % (count, len(HOSTS),
+                                               ignore_hosts))
+    print('%8s %8s %10s %12s %14s' % ('exponent', 'replicas', 'build (ms)',
+                                      'get_hosts (s)', 'get_hosts_many (s)'))
+    for exponent in EXPONENTS:
+        CONF.set_override('hash_partition_exponent', exponent)
+        for replicas in REPLICAS:
+            build = _time(hash_ring.HashRing, HOSTS, replicas=replicas)
+            ring = hash_ring.HashRing(HOSTS, replicas=replicas)
+            single = _time(lambda: [ring.get_hosts(u, ignore_hosts)
+                                    for u in uuids])
+            many = _time(ring.get_hosts_many, uuids, ignore_hosts)
+            print('%8d %8d %10.2f %12.3f %14.3f' % (exponent, replicas,
+                                                    build * 1000, single,
+                                                    many))
+
+
+if __name__ == '__main__':
+    main()
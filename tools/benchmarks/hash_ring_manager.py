@@ -0,0 +1,65 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure the per-request cost of routing a node to a conductor.
+
+Compares building a new set of hash rings for every request (what the API
+service did when it created a new ConductorAPI per request) with using the
+rings shared process-wide by HashRingManager.
+
+Usage: python -m tools.benchmarks.hash_ring_manager [requests]
+"""
+
+import sys
+import timeit
+
+from ironic.common import hash_ring
+from ironic.common import utils
+
+DRIVERS = {'pxe_ipmitool': set(['c%d' % i for i in range(5)]),
+           'pxe_ssh': set(['c%d' % i for i in range(3)]),
+           'agent_ipmitool': set(['c%d' % i for i in range(5)])}
+
+
+class FakeDBAPI(object):
+
+    def get_active_driver_dict(self):
+        return DRIVERS
+
+
+def _manager():
+    manager = hash_ring.HashRingManager()
+    manager.dbapi = FakeDBAPI()
+    return manager
+
+
+def get_topic_for_unshared(uuid):
+    hash_ring.HashRingManager.reset()
+    return _manager().get_hash_ring('pxe_ipmitool').get_hosts(uuid)[0]
+
+
+def get_topic_for_shared(uuid):
+    return _manager().get_hash_ring('pxe_ipmitool').get_hosts(uuid)[0]
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    uuid = utils.generate_uuid()
+    for name, func in (('unshared', get_topic_for_unshared),
+                       ('shared', get_topic_for_shared)):
+        hash_ring.HashRingManager.reset()
+        elapsed = timeit.timeit(lambda: func(uuid), number=requests)
+        print('%-10s %10.1f us/request' % (name, elapsed / requests * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure how long querying the power states of many iLOs takes.
+
+Uses a fake IloClient which answers power status queries after a random
+delay, and compares querying the nodes one after the other with the
+concurrent query of ilo.power._get_power_states. It also reports how many
+IloClient objects were created, which is one per node thanks to the
+client cache.
+
+Usage: python -m tools.benchmarks.ilo_power [nodes] [workers]
+"""
+
+import random
+import sys
+import time
+import uuid
+
+import eventlet
+from oslo.config import cfg
+from oslo import i18n
+i18n.install('ironic')
+
+from ironic.drivers.modules.ilo import common as ilo_common  # noqa
+from ironic.drivers.modules.ilo import power as ilo_power  # noqa
+
+CONF = cfg.CONF
+
+# range of the time (in seconds) an iLO takes to answer
+LATENCY = (0.05, 0.3)
+
+
+class FakeIloError(Exception):
+    pass
+
+
+class FakeIloClient(object):
+    """Stands in for proliantutils' IloClient."""
+
+    created = 0
+
+    def __init__(self, host, login, password, timeout, port):
+        FakeIloClient.created += 1
+        self.host = host
+
+    def get_host_power_status(self):
+        eventlet.sleep(random.uniform(*LATENCY))
+        return 'ON'
+
+
+class FakeIloModule(object):
+    IloClient = FakeIloClient
+    IloError = FakeIloError
+
+
+class FakeNode(object):
+    def __init__(self, index):
+        self.uuid = str(uuid.uuid4())
+        self.driver_info = {'ilo_address': '10.0.%d.%d' % divmod(index, 256),
+                            'ilo_username': 'admin',
+                            'ilo_password': 'secret'}
+
+
+def _sequential(nodes):
+    return [ilo_power._get_power_state(node) for node in nodes]
+
+
+def _measure(query, nodes, rounds=3):
+    start = time.time()
+    for i in range(rounds):
+        query(nodes)
+    return (time.time() - start) / rounds
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    if len(sys.argv) > 2:
+        CONF.set_override('power_query_workers', int(sys.argv[2]), 'ilo')
+    random.seed(0)
+    ilo_common.ilo_client = FakeIloModule
+    ilo_power.ilo_client = FakeIloModule
+    nodes = [FakeNode(i) for i in range(count)]
+
+    print('%-12s %10s' % ('query', 'seconds'))
+    print('%-12s %10.2f' % ('sequential', _measure(_sequential, nodes)))
+    print('%-12s %10.2f' % ('concurrent', _measure(ilo_power._get_power_states,
+                                                   nodes)))
+    print('%d IloClient objects created for %d nodes'
+          % (FakeIloClient.created, count))
+
+
+if __name__ == '__main__':
+    main()
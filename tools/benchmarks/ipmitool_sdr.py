@@ -0,0 +1,118 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure parsing of 'ipmitool sdr -v' output.
+
+Compares the previous split-based parser, followed by the conductor's
+sensor type filter, with the single-pass parser which filters while
+parsing. The input is either a captured dump given on the command line or
+a synthetic one with the requested number of sensors.
+
+Usage: python -m tools.benchmarks.ipmitool_sdr [sensors | dump file]
+"""
+
+import os
+import sys
+import timeit
+
+from oslo import i18n
+i18n.install('ironic')
+
+from ironic.drivers.modules import ipmitool  # noqa
+
+RECORD = """Sensor ID              : %(type)s %(index)d (0x%(index)x)
+ Entity ID             : 3.%(index)d (Processor)
+ Sensor Type (%(kind)s)  : %(type)s
+ Sensor Reading        : %(index)d (+/- 1) unspecified
+ Status                : ok
+ Nominal Reading       : 50.000
+ Normal Minimum        : 11.000
+ Normal Maximum        : 69.000
+ Upper critical        : 90.000
+ Upper non-critical    : 85.000
+ Positive Hysteresis   : 1.000
+ Negative Hysteresis   : 1.000
+ Minimum sensor range  : Unspecified
+ Maximum sensor range  : Unspecified
+ Event Message Control : Per-threshold
+ Readable Thresholds   : ucr unc
+ Settable Thresholds   : ucr unc
+ Threshold Read Mask   : ucr unc
+ Assertions Enabled    : unc+ ucr+
+"""
+TYPES = ('Temperature', 'Fan', 'Voltage', 'Current', 'Power Supply',
+         'Memory', 'Processor', 'Drive Slot')
+SENSOR_TYPES = (['ALL'], ['Temperature'], ['Temperature', 'Fan'])
+
+
+class FakeNode(object):
+    uuid = 'fake-uuid'
+
+
+def _synthetic_dump(count):
+    return '\n'.join(RECORD % {'type': TYPES[i % len(TYPES)], 'index': i,
+                               'kind': 'Analog' if i % 2 else 'Discrete'}
+                     for i in range(count))
+
+
+def _legacy_parse(node, sensors_data, sensor_types):
+    sensors_data_dict = {}
+    for sensor_data in sensors_data.split('\n\n'):
+        sensor_data_dict = {}
+        for field in sensor_data.split('\n'):
+            kv_value = field.split(':')
+            if len(kv_value) != 2:
+                continue
+            sensor_data_dict[kv_value[0].strip()] = kv_value[1].strip()
+        if not sensor_data_dict:
+            continue
+        sensor_type = ipmitool._get_sensor_type(node, sensor_data_dict)
+        if 'Sensor Reading' in sensor_data_dict:
+            sensors_data_dict.setdefault(sensor_type,
+                {})[sensor_data_dict['Sensor ID']] = sensor_data_dict
+
+    # what ConductorManager._filter_out_unsupported_types does
+    allowed = set(x.lower() for x in sensor_types)
+    if 'all' in allowed:
+        return sensors_data_dict
+    return dict((k, v) for (k, v) in sensors_data_dict.items()
+                if k.lower() in allowed)
+
+
+def main():
+    arg = sys.argv[1] if len(sys.argv) > 1 else '500'
+    if os.path.exists(arg):
+        with open(arg) as f:
+            dump = f.read()
+    else:
+        dump = _synthetic_dump(int(arg))
+    node = FakeNode()
+    number = 20
+
+    print('%d bytes, %d records' % (len(dump), dump.count('Sensor ID')))
+    print('%-26s %12s %12s' % ('sensor types', 'legacy (ms)', 'stream (ms)'))
+    for sensor_types in SENSOR_TYPES:
+        legacy = timeit.timeit(
+            lambda: _legacy_parse(node, dump, sensor_types), number=number)
+        stream = timeit.timeit(
+            lambda: ipmitool._parse_ipmi_sensors_data(node, dump,
+                                                      sensor_types),
+            number=number)
+        assert (_legacy_parse(node, dump, sensor_types) ==
+                ipmitool._parse_ipmi_sensors_data(node, dump, sensor_types))
+        print('%-26s %12.2f %12.2f' % (','.join(sensor_types),
+                                       legacy / number * 1000,
+                                       stream / number * 1000))
+
+
+if __name__ == '__main__':
+    main()
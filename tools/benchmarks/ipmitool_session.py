@@ -0,0 +1,63 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compare ipmitool commands per second with and without shell sessions.
+
+Runs the same command against a real BMC, first starting ipmitool for
+every command and then through a reused 'ipmitool shell' session. The
+min_command_interval wait is skipped so that only the cost of running the
+commands is measured.
+
+Usage: python -m tools.benchmarks.ipmitool_session
+           address username password [commands] [command]
+"""
+
+import sys
+import time
+
+from oslo.config import cfg
+from oslo import i18n
+i18n.install('ironic')
+
+from ironic.drivers.modules import ipmi_scheduler  # noqa
+from ironic.drivers.modules import ipmitool  # noqa
+
+CONF = cfg.CONF
+
+
+def _run(driver_info, command, count):
+    start = time.time()
+    for i in range(count):
+        ipmi_scheduler.SCHEDULER.reset()
+        ipmitool._exec_ipmitool(driver_info, command)
+    return count / (time.time() - start)
+
+
+def main():
+    if len(sys.argv) < 4:
+        sys.exit(__doc__)
+    count = int(sys.argv[4]) if len(sys.argv) > 4 else 20
+    command = sys.argv[5] if len(sys.argv) > 5 else 'power status'
+    driver_info = {'address': sys.argv[1], 'username': sys.argv[2],
+                   'password': sys.argv[3], 'priv_level': 'ADMINISTRATOR'}
+    ipmitool.check_timing_support()
+
+    for use_shell in (False, True):
+        CONF.set_override('use_shell_sessions', use_shell, 'ipmi')
+        rate = _run(driver_info, command, count)
+        print('%-20s %8.2f commands/s' % (
+            'shell session' if use_shell else 'process per command', rate))
+    ipmitool.SHELL_SESSIONS.close_all()
+
+
+if __name__ == '__main__':
+    main()
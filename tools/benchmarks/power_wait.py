@@ -0,0 +1,147 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure how long power actions take to be noticed as complete.
+
+Simulates BMCs which take a random time to reach the requested power state
+and answer status queries with some latency, and reports the end-to-end
+latency of a power action (from the action until the wait returns, i.e.
+how long the node's lock is held) for each driver, comparing its previous
+polling schedule with driver_utils.wait_for_power_state, which only
+changes the polling intervals (backoff and jitter). The ipmitool
+simulation also keeps min_command_interval between commands, like the
+BMC command scheduler does. Time is simulated, so this runs instantly.
+
+Usage: python -m tools.benchmarks.power_wait [actions per profile]
+"""
+
+import random
+import sys
+
+from oslo import i18n
+i18n.install('ironic')
+
+from ironic.common import states  # noqa
+from ironic.drivers import utils as driver_utils  # noqa
+
+# name, range of the power transition time, range of the status latency
+PROFILES = (('fast', (1, 4), (0.1, 0.3)),
+            ('medium', (4, 15), (0.3, 1)),
+            ('slow', (15, 45), (1, 3)))
+TIMEOUT = 60
+
+
+class FakeClock(object):
+    """Stands in for the time module, sleeping in simulated time."""
+
+    def __init__(self):
+        self.now = 0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeBMC(object):
+    def __init__(self, clock, transition, latency, min_interval=0):
+        self.clock = clock
+        self.done_at = clock.now + random.uniform(*transition)
+        self.latency = latency
+        self.min_interval = min_interval
+        self.next_command = clock.now + min_interval
+
+    def get_state(self):
+        if self.clock.now < self.next_command:
+            self.clock.now = self.next_command
+        self.clock.now += random.uniform(*self.latency)
+        self.next_command = self.clock.now + self.min_interval
+        if self.clock.now >= self.done_at:
+            return states.POWER_ON
+        return states.POWER_OFF
+
+
+def _legacy_ipmitool(clock, bmc):
+    # DynamicLoopingCall sleeping 1, 1, 4, 9, 16... seconds
+    total, i = 0, 0
+    while True:
+        sleep_time = 1 if i <= 1 else i ** 2
+        if total + sleep_time > TIMEOUT:
+            return
+        clock.sleep(sleep_time)
+        total += sleep_time
+        i += 1
+        if bmc.get_state() == states.POWER_ON:
+            return
+
+
+def _new_ipmitool(clock, bmc):
+    driver_utils.wait_for_power_state(bmc.get_state, states.POWER_ON,
+                                      TIMEOUT, max_interval=5)
+
+
+def _legacy_fixed(interval, skip_first):
+    # FixedIntervalLoopingCall checking right away, then every interval
+    def _wait(clock, bmc):
+        for i in range(int(TIMEOUT / interval) + 1):
+            if i:
+                clock.sleep(interval)
+            if bmc.get_state() == states.POWER_ON and (i or not skip_first):
+                return
+    return _wait
+
+
+def _new_fixed(interval):
+    def _wait(clock, bmc):
+        driver_utils.wait_for_power_state(bmc.get_state, states.POWER_ON,
+                                          TIMEOUT,
+                                          initial_interval=min(1, interval),
+                                          max_interval=interval)
+    return _wait
+
+
+DRIVERS = (('ipmitool', 5, _legacy_ipmitool, _new_ipmitool),
+           ('ilo', 0, _legacy_fixed(2, True), _new_fixed(2)),
+           ('seamicro', 0, _legacy_fixed(10, False), _new_fixed(10)))
+
+
+def _measure(wait, profile, min_interval, count):
+    clock = FakeClock()
+    driver_utils.time = clock
+    latencies = []
+    for i in range(count):
+        clock.now = 0
+        bmc = FakeBMC(clock, profile[1], profile[2], min_interval)
+        wait(clock, bmc)
+        latencies.append(clock.now)
+    latencies.sort()
+    return (sum(latencies) / len(latencies),
+            latencies[int(len(latencies) * 0.95)])
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    random.seed(0)
+    print('%-10s %-8s %18s %18s' % ('driver', 'profile',
+                                    'legacy mean/p95 (s)',
+                                    'new mean/p95 (s)'))
+    for name, min_interval, legacy, new in DRIVERS:
+        for profile in PROFILES:
+            print('%-10s %-8s %9.1f %8.1f %9.1f %8.1f' % (
+                (name, profile[0]) +
+                _measure(legacy, profile, min_interval, count) +
+                _measure(new, profile, min_interval, count)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure how long downloading an image from Swift in ranges takes.
+
+Serves a random image from a local fake Swift server which limits the rate
+of each response, like a single Swift proxy connection limited by latency
+or per-connection throughput, and reports the time and throughput of
+GlanceImageService.download_from_swift with one to 'streams' concurrent
+range requests.
+
+Usage: python -m tools.benchmarks.swift_download [image size in MiB]
+       [streams] [MiB/s per stream]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import eventlet
+eventlet.monkey_patch(os=False)
+
+from oslo.config import cfg  # noqa
+from oslo import i18n  # noqa
+i18n.install('ironic')
+
+from ironic.common.glance_service.v2 import image_service  # noqa
+from ironic.tests import stubs  # noqa
+
+CONF = cfg.CONF
+
+MiB = 1024 * 1024
+IMAGE_ID = '757274c4-2856-4bd2-bb20-9a4a231e187b'
+
+
+def _measure(glance, path, streams):
+    CONF.set_override('swift_download_streams', streams, 'glance')
+    start = time.time()
+    glance.download_from_swift(IMAGE_ID, path)
+    return time.time() - start
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    max_streams = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 20
+    data = os.urandom(size * MiB)
+
+    with stubs.FakeSwiftServer(stream_rate=rate * MiB) as server:
+        server.objects['/v1/AUTH_bench/glance/' + IMAGE_ID] = data
+        CONF.set_override('swift_temp_url_key', 'secret', 'glance')
+        CONF.set_override('swift_endpoint_url', server.endpoint_url,
+                          'glance')
+        CONF.set_override('swift_account', 'AUTH_bench', 'glance')
+        CONF.set_override('swift_download_min_range_size', MiB, 'glance')
+        glance = image_service.GlanceImageService(
+            stubs.StubGlanceClient(), 2)
+        glance.show = lambda image_id: {'id': IMAGE_ID, 'size': len(data),
+                                        'checksum': None}
+        path = tempfile.mkstemp()[1]
+        try:
+            print('%-8s %10s %10s' % ('streams', 'seconds', 'MiB/s'))
+            streams = 1
+            while streams <= max_streams:
+                elapsed = _measure(glance, path, streams)
+                print('%-8d %10.2f %10.1f' % (streams, elapsed,
+                                              size / elapsed))
+                streams *= 2
+        finally:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()